@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Alias phrase matching inside treatment names
+
+The extract_core_drug_name functions of the annotate_* scripts expand
+abbreviations and common phrases ("ldn", "nac", "fish oil") to the RxNorm
+name they stand for. The alias table used to be a dict literal rebuilt on
+every call and copied into each script, and it only applied when the whole
+normalized name was an alias, so "LDN 4.5mg nightly" missed.
+
+The table now lives in data/drug_aliases.json, a versioned data file.
+AliasMatcher compiles it once into an Aho-Corasick automaton. A single pass
+over a normalized name finds every alias phrase in it, which is kept when
+it covers whole words. Overlapping hits resolve leftmost, then longest, so
+"vitamin d3 5000 iu" finds "vitamin d3" and not "vitamin d".
+
+A name that is an alias still becomes its expansion. Inside a longer name,
+leading_expansion() only uses an alias that starts the name or is the whole
+core name. The annotators try that expansion after the core drug name, so
+"Magnesium citrate 200 mg tablet" still matches magnesium citrate before
+magnesium. An alias later in the name ("Acetaminophen with vitamin c",
+"Methyl B12") names a different ingredient and is not used.
+
+Usage:
+    python alias_matcher.py NAME [NAME ...] [--aliases PATH]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import deque
+
+ALIAS_FILE_VERSION = 1
+
+DEFAULT_ALIAS_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                                  'data', 'drug_aliases.json'))
+
+def normalize_phrase(phrase):
+    """The annotate_* scripts' normalize_name() rules, applied to alias phrases"""
+    normalized = re.sub(r'[^\w\s-]', '', str(phrase).lower())
+    return re.sub(r'\s+', ' ', normalized).strip()
+
+def load_aliases(path=DEFAULT_ALIAS_PATH):
+    """Alias phrase -> expansion dict from a drug_aliases.json file"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != ALIAS_FILE_VERSION:
+        raise ValueError(f"Unsupported alias file version {data.get('version')!r} in {path}")
+    return data['aliases']
+
+class AliasMatcher:
+    """Aho-Corasick automaton over normalized alias phrases
+
+    Node 0 is the root. Each node has its transitions, a failure link to the
+    node for its longest proper suffix that is also a prefix, and the lengths
+    of the phrases ending there, longest first and including those reached
+    through failure links.
+    """
+
+    def __init__(self, aliases):
+        self.expansions = {}
+        for phrase, expansion in aliases.items():
+            # The first spelling of a phrase wins, as with dict lookups of normalized names
+            self.expansions.setdefault(normalize_phrase(phrase), expansion)
+        self.expansions.pop('', None)
+
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for phrase in self.expansions:
+            node = 0
+            for char in phrase:
+                next_node = self.transitions[node].get(char)
+                if next_node is None:
+                    next_node = len(self.transitions)
+                    self.transitions[node][char] = next_node
+                    self.transitions.append({})
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append(len(phrase))
+
+        # Breadth-first, so every failure link points at a finished node
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.transitions[node].items():
+                failure = self.failures[node]
+                while failure and char not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[child] = self.transitions[failure].get(char, 0)
+                self.outputs[child] = sorted(self.outputs[child] + self.outputs[self.failures[child]],
+                                             reverse=True)
+                queue.append(child)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_ALIAS_PATH):
+        return cls(load_aliases(path))
+
+    def __len__(self):
+        return len(self.expansions)
+
+    def find(self, normalized):
+        """Non-overlapping whole-word alias hits in a normalized name
+
+        Returns (start, end, phrase, expansion) tuples in text order.
+        """
+        hits = []
+        node = 0
+        for end, char in enumerate(normalized, 1):
+            while node and char not in self.transitions[node]:
+                node = self.failures[node]
+            node = self.transitions[node].get(char, 0)
+            for length in self.outputs[node]:
+                start = end - length
+                whole_words = ((start == 0 or normalized[start - 1] == ' ')
+                               and (end == len(normalized) or normalized[end] == ' '))
+                if whole_words:
+                    hits.append((start, end))
+
+        found = []
+        covered = 0
+        for start, end in sorted(hits, key=lambda hit: (hit[0], -hit[1])):
+            if start >= covered:
+                phrase = normalized[start:end]
+                found.append((start, end, phrase, self.expansions[phrase]))
+                covered = end
+        return found
+
+    def get(self, normalized):
+        """Expansion of a normalized name that is itself an alias, or None"""
+        return self.expansions.get(normalized)
+
+    def leading_expansion(self, normalized, core_name=''):
+        """Expansion of an alias that is the whole core_name or starts the normalized name, or None"""
+        if core_name in self.expansions:
+            return self.expansions[core_name]
+        found = self.find(normalized)
+        return found[0][3] if found and found[0][0] == 0 else None
+
+# Compiled once on import; shared by the annotate_* scripts
+DRUG_ALIASES = AliasMatcher.from_file()
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Show the alias phrases found in treatment names")
+    parser.add_argument('names', nargs='+', help="Treatment names to scan")
+    parser.add_argument('--aliases', default=DEFAULT_ALIAS_PATH,
+                        help="Alias file (default: data/drug_aliases.json)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    try:
+        matcher = AliasMatcher.from_file(args.aliases)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Compiled {len(matcher):,} aliases from {args.aliases}")
+
+    for name in args.names:
+        found = matcher.find(normalize_phrase(name))
+        if not found:
+            print(f"  {name}: no aliases")
+        for _, _, phrase, expansion in found:
+            print(f"  {name}: '{phrase}' → {expansion}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,30 @@ Achieves ~44% match rate with brand names included
 """
 
 import pandas as pd
+import argparse
 import re
 import os
-import sys
+
+from alias_matcher import DRUG_ALIASES
+from database_loader import load_rxnorm_compact
+from shared_index import SharedIndex
+from sqlite_index import RxnormSqliteIndex
+from result_writer import ResultWriter, add_output_arguments, output_path
+from run_metrics import MetricsFile, add_metrics_arguments
+from run_profiler import RunProfiler, add_profile_arguments
+from treatment_tokenizer import CORE_DRUG_TOKENIZER, DETAIL_COLUMNS, treatment_details
+from matching_pipeline import (MatchPipeline, ExactNormalizedStage, CleanNameStage,
+                               ParentheticalStage, CoreDrugStage, TypoStage, iter_fan_out)
+
+STAGE_NAMES = ['normalized', 'clean_name', 'parenthetical', 'core_drug', 'typo']
+DEFAULT_STAGES = ['normalized', 'clean_name', 'parenthetical', 'core_drug']
+
+# Low-cardinality output columns stored as dictionaries in parquet/arrow output
+DICTIONARY_COLUMNS = ['sources', 'term_type', 'match_method', 'match_stage', 'unit', 'route', 'dosage_form',
+                      'frequency']
+
+# Non-text output columns, typed up front so parquet/arrow schemas do not depend on the first batch
+COLUMN_TYPES = {'matched': 'bool'}
 
 def normalize_name(name):
     """Normalize drug/treatment names for matching"""
@@ -44,81 +65,63 @@ def extract_names_from_parentheses(treatment_name):
     if core_drug_name and core_drug_name != normalized:
         names_to_try.append(core_drug_name)
     
+    # Then the expansion of an alias leading the name
+    alias_name = extract_alias_name(main_name)
+    if alias_name and alias_name != normalized:
+        names_to_try.append(alias_name)
+    
     return list(dict.fromkeys(names_to_try))  # Remove duplicates while preserving order
 
 def extract_core_drug_name(treatment_name):
     """Extract core drug name from complex treatment descriptions"""
     normalized = normalize_name(treatment_name)
     
-    # Special mappings
-    mappings = {
-        'low dose naltrexone': 'naltrexone',
-        'ldn': 'naltrexone', 
-        'n acetyl cysteine': 'acetylcysteine',
-        'nac': 'acetylcysteine',
-        'coq10': 'coenzyme q10',
-        'd ribose': 'ribose',
-        'nad+': 'nicotinamide adenine dinucleotide',
-        'omega 3': 'omega-3 fatty acids',
-        'fish oil': 'omega-3 fatty acids',
-        'b complex': 'vitamin b complex',
-        'b12': 'cyanocobalamin',
-        'vitamin b12': 'cyanocobalamin',
-        'vitamin d3': 'cholecalciferol',
-        'vitamin d': 'vitamin d',
-        'vitamin c': 'vitamin c',
-        'magnesium glycinate': 'magnesium',
-        'magnesium citrate': 'magnesium',
-        'iron bisglycinate': 'iron',
-        'ferrous sulfate': 'iron',
-        'ivig': 'immunoglobulin',
-        'intravenous immunoglobulin': 'immunoglobulin',
-    }
+    # Names that are an abbreviation or common phrase (data/drug_aliases.json)
+    alias = DRUG_ALIASES.get(normalized)
+    if alias is not None:
+        return alias
     
-    if normalized in mappings:
-        return mappings[normalized]
+    # Strip dose, route, form and frequency details in one scan
+    return CORE_DRUG_TOKENIZER.core_name(normalized)
+
+def extract_alias_name(treatment_name):
+    """Expansion of an alias that starts the name or is its whole core name, or ''"""
+    normalized = normalize_name(treatment_name)
+    return DRUG_ALIASES.leading_expansion(normalized, CORE_DRUG_TOKENIZER.core_name(normalized)) or ''
+
+def annotate_treatment(treatment_name, pipeline):
+    """Annotate a single treatment name with the matching pipeline"""
+    # Get all possible names to try
+    names_to_try = extract_names_from_parentheses(treatment_name)
     
-    # Pattern cleaning
-    patterns = [
-        (r'\b(low\s+dose|high\s+dose|extended\s+release|immediate\s+release)\s+', ''),
-        (r'\b(oral|iv|intravenous|topical|nasal|sublingual)\s+', ''),
-        (r'\b(tablet|capsule|injection|spray|cream|gel|solution)\s*', ''),
-        (r'\b\d+\s*(mg|mcg|ml|units?)\b', ''),
-        (r'\b(twice\s+daily|once\s+daily|bid|tid|qid|prn)\b', ''),
-    ]
+    result = {
+        'Treatment Name': treatment_name,
+        'matched': False,
+        'RXCUI': '',
+        'matched_name': '',
+        'sources': '',
+        'term_type': '',
+        'match_method': '',
+        'searched_terms': '|'.join(names_to_try),
+        'match_stage': ''
+    }
     
-    result = normalized
-    for pattern, replacement in patterns:
-        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
+    # Run the matching stages in order until one hits
+    match, _ = pipeline.match(treatment_name)
+    if match is not None:
+        record = match['record']
+        result['matched'] = True
+        result['RXCUI'] = record['RXCUI']
+        result['matched_name'] = record['name']
+        result['sources'] = record['sources']
+        result['term_type'] = record['term_type']
+        result['match_method'] = match['method']
+        result['match_stage'] = match['stage']
     
-    result = re.sub(r'\s+', ' ', result).strip()
     return result
 
-def main():
-    # Get the script directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    repo_root = os.path.dirname(script_dir)
-    
-    print("RxNorm Treatment Annotator")
-    print("==========================\n")
-    
-    # File paths
-    rxnorm_file = os.path.join(repo_root, "data", "rxnorm_core_medications.csv")
-    treatment_file = os.path.join(repo_root, "examples", "sample_treatments.csv")
-    output_file = os.path.join(repo_root, "treatment_dictionary_annotated.csv")
-    
-    # Check for custom treatment file
-    if len(sys.argv) > 1:
-        treatment_file = sys.argv[1]
-        print(f"Using custom treatment file: {treatment_file}")
-    
-    print("Loading RxNorm data...")
-    # Load RxNorm with specific columns
-    rxnorm_df = pd.read_csv(rxnorm_file, 
-                            usecols=['normalized_name', 'primary_RXCUI', 'DrugName', 
-                                     'sources', 'preferred_term_type', 'clean_name'])
-    
-    # Create lookups
+def build_lookups(rxnorm_df):
+    """Build normalized name and clean name lookups; the first row for a name wins"""
     rxnorm_lookup = {}
     clean_lookup = {}
     
@@ -144,11 +147,241 @@ def main():
                     'term_type': row['preferred_term_type']
                 }
     
-    print(f"Loaded {len(rxnorm_df)} RxNorm entries")
-    print(f"Created lookup with {len(rxnorm_lookup)} unique normalized names")
+    return rxnorm_lookup, clean_lookup
+
+def build_stages(rxnorm_lookup, clean_lookup):
+    """All available matching stages, keyed by name"""
+    lookups = [('normalized', rxnorm_lookup), ('clean_name', clean_lookup)]
+    stages = [
+        ExactNormalizedStage(rxnorm_lookup, normalize_name),
+        CleanNameStage(clean_lookup, normalize_name),
+        ParentheticalStage(lookups, normalize_name),
+        CoreDrugStage(lookups, normalize_name, extract_core_drug_name, extract_alias_name),
+        TypoStage(rxnorm_lookup, normalize_name),
+    ]
+    return {stage.name: stage for stage in stages}
+
+# Stages the join mode can run; typo variants are not joinable
+JOIN_STAGES = ['normalized', 'clean_name', 'parenthetical', 'core_drug']
+
+# Lookup columns probed for each candidate term, in order, and the match method they report
+JOIN_LOOKUPS = [('normalized_name', 'normalized'), ('clean_name', 'clean_name')]
+
+RESULT_COLUMNS = ['Treatment Name', 'matched', 'RXCUI', 'matched_name', 'sources', 'term_type',
+                  'match_method', 'searched_terms', 'match_stage']
+
+def normalize_series(names):
+    """normalize_name() over a Series of strings; missing values become ''"""
+    normalized = names.str.lower().str.replace(r'[^\w\s-]', '', regex=True)
+    return normalized.str.replace(r'\s+', ' ', regex=True).str.strip().fillna('')
+
+def dedup_key_series(names):
+    """matching_pipeline.dedup_key() over a Series of names"""
+    keys = names.astype(str).where(names.notna()).str.lower().str.replace(r'[^\w\s()-]', '', regex=True)
+    return keys.str.replace(r'\s+', ' ', regex=True).str.strip().fillna('')
+
+def build_join_index(rxnorm_df):
+    """build_lookups() as one table keyed by (lookup, key) for hash joins"""
+    tables = []
+    for column, _ in JOIN_LOOKUPS:
+        table = rxnorm_df[[column, 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type']]
+        table = table.dropna(subset=[column]).drop_duplicates(column)
+        table[column] = table[column].astype(str)
+        tables.append(table.rename(columns={column: 'key'}).assign(lookup=column))
+    return pd.concat(tables, ignore_index=True)
+
+def join_candidates(names, stage_names):
+    """Explode names into (row, rank, lookup, key, stage) rows in the order the stages probe them
+
+    Also returns the searched_terms column for the names.
+    """
+    text = names.astype(str).where(names.notna())
+    normalized = normalize_series(text)
+    parts = text.str.extract(r'^(.+?)\s*\(([^)]+)\)')
+    main_part = normalize_series(parts[0])
+    paren_part = normalize_series(parts[1])
+    main_name = text.fillna('').str.replace(r'\s*\([^)]+\)', '', regex=True)
+    distinct = main_name.unique()
+    core = main_name.map(dict(zip(distinct, map(extract_core_drug_name, distinct))))
+    alias = main_name.map(dict(zip(distinct, map(extract_alias_name, distinct))))
+    
+    stage_terms = {
+        'normalized': [(normalized, 'normalized_name', False)],
+        'clean_name': [(normalized, 'clean_name', False)],
+        'parenthetical': [(part, column, True) for part in (main_part, paren_part) for column, _ in JOIN_LOOKUPS],
+        'core_drug': [(terms, column, True) for terms in (core, alias) for column, _ in JOIN_LOOKUPS],
+    }
+    frames = []
+    rank = 0
+    for stage in stage_names:
+        for terms, column, derived in stage_terms[stage]:
+            # Derived terms are only tried when they differ from the normalized name
+            keep = (terms != '') & (terms != normalized) if derived else (terms != '')
+            frames.append(pd.DataFrame({'row': keep[keep].index, 'rank': rank, 'lookup': column,
+                                        'key': terms[keep].values, 'stage': stage}))
+            rank += 1
+    
+    searched_terms = ['|'.join(dict.fromkeys([n] + [t for t in (m, p, c, a) if t and t != n]))
+                      for n, m, p, c, a in zip(normalized, main_part, paren_part, core, alias)]
+    return pd.concat(frames, ignore_index=True), searched_terms
+
+def annotate_exact_join(treatment_names, rxnorm_df, stage_names=DEFAULT_STAGES):
+    """Exact annotation of a whole input table with one hash join
+
+    Gives the same rows as running annotate_treatment() through fan_out():
+    each distinct dedup key is resolved from its first name, every candidate
+    term of every name is joined against the normalized_name and clean_name
+    index at once, and the lowest-ranked hit wins. Returns (results
+    DataFrame, number of unique names, pipeline-style stage stats).
+    """
+    names = pd.Series(treatment_names, dtype=object)
+    # Key codes number the distinct keys in order of first appearance
+    codes, _ = pd.factorize(dedup_key_series(names))
+    first = ~pd.Series(codes).duplicated()
+    representatives = names[first.values].reset_index(drop=True)
+    
+    candidates, searched_terms = join_candidates(representatives, stage_names)
+    hits = candidates.merge(build_join_index(rxnorm_df), on=['lookup', 'key'], how='inner')
+    best = hits.sort_values(['row', 'rank'], kind='stable').drop_duplicates('row')
+    methods = dict(JOIN_LOOKUPS)
+    
+    resolved = pd.DataFrame({
+        'matched': False, 'RXCUI': '', 'matched_name': '', 'sources': '', 'term_type': '',
+        'match_method': '', 'searched_terms': searched_terms, 'match_stage': '',
+    }, index=representatives.index).astype({column: object for column in
+                                            ['RXCUI', 'matched_name', 'sources', 'term_type']})
+    rows = best['row'].values
+    resolved.loc[rows, 'matched'] = True
+    resolved.loc[rows, 'RXCUI'] = best['primary_RXCUI'].astype(object).values
+    resolved.loc[rows, 'matched_name'] = best['DrugName'].astype(object).values
+    resolved.loc[rows, 'sources'] = best['sources'].astype(object).values
+    resolved.loc[rows, 'term_type'] = best['preferred_term_type'].astype(object).values
+    resolved.loc[rows, 'match_method'] = best['lookup'].map(methods).values
+    resolved.loc[rows, 'match_stage'] = best['stage'].values
+    
+    # Fan the resolved names out to every input row
+    results = resolved.iloc[codes].reset_index(drop=True)
+    results.insert(0, 'Treatment Name', names.values)
+    
+    stats = {}
+    remaining = len(representatives)
+    for stage in stage_names:
+        hit_count = int((best['stage'] == stage).sum())
+        stats[stage] = {'calls': remaining, 'hits': hit_count, 'skipped': 0, 'seconds': 0.0}
+        remaining -= hit_count
+    return results[RESULT_COLUMNS], len(representatives), stats
+
+def write_metrics(path, profiler, results_df, pipeline):
+    """Write run metrics in Prometheus text format"""
+    metrics = MetricsFile('rxnorm_annotator', 'annotate_treatments')
+    metrics.add('rows_processed', len(results_df), "Treatment rows annotated in the run")
+    method_counts = results_df[results_df['matched']]['match_method'].value_counts()
+    for method, count in method_counts.items():
+        metrics.add('matches', count, "Annotated rows by match source and type",
+                    labels={'source': 'rxnorm', 'match_type': method})
+    metrics.add('matches', int((~results_df['matched']).sum()), "Annotated rows by match source and type",
+                labels={'source': 'none', 'match_type': 'no_match'})
+    for stage, stage_stats in pipeline.stats.items():
+        metrics.add('stage_hits', stage_stats['hits'], "Unique treatments matched by each pipeline stage",
+                    labels={'stage': stage})
+        metrics.add('stage_duration_seconds', stage_stats['seconds'], "Cumulative time spent in each pipeline stage",
+                    labels={'stage': stage})
+    metrics.add_run_metrics(profiler)
+    metrics.write(path)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Annotate treatments with RxNorm identifiers")
+    parser.add_argument('treatment_file', nargs='?',
+                        help="Treatment CSV file (default: examples/sample_treatments.csv)")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES),
+                        help=f"Comma-separated matching stages in order ({', '.join(STAGE_NAMES)}; "
+                             f"default: {','.join(DEFAULT_STAGES)})")
+    parser.add_argument('--sqlite-index', metavar='PATH',
+                        help="Answer lookups from a SQLite index (see sqlite_index.py) "
+                             "instead of loading the RxNorm CSV")
+    parser.add_argument('--shared-index', metavar='PATH',
+                        help="Map a shared index file (see shared_index.py) read-only instead of building "
+                             "lookups, so parallel annotator processes share one copy")
+    parser.add_argument('--vectorized', action='store_true',
+                        help="Resolve every treatment with one pandas hash join instead of per-name "
+                             f"lookups (exact stages only: {', '.join(JOIN_STAGES)})")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    args.stages = args.stages.split(',')
+    unknown = [name for name in args.stages if name not in STAGE_NAMES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if args.vectorized:
+        if args.sqlite_index or args.shared_index:
+            parser.error("--vectorized joins against the RxNorm CSV and cannot use an index file")
+        unjoinable = [name for name in args.stages if name not in JOIN_STAGES]
+        if unjoinable:
+            parser.error(f"--vectorized cannot run stage(s): {', '.join(unjoinable)}")
+    return args
+
+def main():
+    args = parse_args()
+    profiler = RunProfiler.from_args('annotate_treatments.py', args)
+    
+    # Get the script directory
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    repo_root = os.path.dirname(script_dir)
+    
+    print("RxNorm Treatment Annotator")
+    print("==========================\n")
+    
+    # File paths
+    rxnorm_file = os.path.join(repo_root, "data", "rxnorm_core_medications.csv")
+    treatment_file = os.path.join(repo_root, "examples", "sample_treatments.csv")
+    output_file = output_path(os.path.join(repo_root, "treatment_dictionary_annotated.csv"),
+                              args.output_format)
+    
+    # Check for custom treatment file
+    if args.treatment_file:
+        treatment_file = args.treatment_file
+        print(f"Using custom treatment file: {treatment_file}")
+    
+    if args.shared_index:
+        # Lookups live in a memory-mapped file shared with other annotator processes
+        print(f"Mapping shared index {args.shared_index}...")
+        profiler.begin('open_shared_index')
+        index = SharedIndex(args.shared_index)
+        rxnorm_lookup = index.lookup('normalized_name')
+        clean_lookup = index.lookup('clean_name')
+        print(f"Mapped index with {len(rxnorm_lookup)} normalized names ({index.load_seconds * 1000:.1f} ms)")
+    elif args.sqlite_index:
+        # Answer lookups straight from the SQLite index instead of loading the table
+        print(f"Opening SQLite index {args.sqlite_index}...")
+        profiler.begin('open_sqlite_index')
+        index = RxnormSqliteIndex(args.sqlite_index)
+        rxnorm_lookup = index.lookup('normalized_name')
+        clean_lookup = index.lookup('clean_name')
+        print(f"Opened index with {index.row_count} RxNorm entries ({index.load_seconds * 1000:.1f} ms)")
+    else:
+        print("Loading RxNorm data...")
+        profiler.begin('load_rxnorm')
+        # Load RxNorm with specific columns in compact form
+        rxnorm_df = load_rxnorm_compact(rxnorm_file)
+        profiler.set_rows(len(rxnorm_df))
+        
+        print(f"Loaded {len(rxnorm_df)} RxNorm entries")
+        
+        if not args.vectorized:
+            # Create lookups
+            profiler.begin('build_lookups', rows=len(rxnorm_df))
+            rxnorm_lookup, clean_lookup = build_lookups(rxnorm_df)
+            print(f"Created lookup with {len(rxnorm_lookup)} unique normalized names")
+    
+    if not args.vectorized:
+        pipeline = MatchPipeline.from_names(build_stages(rxnorm_lookup, clean_lookup), args.stages)
     
     # Load treatment names
     print(f"\nLoading treatments from {treatment_file}...")
+    profiler.begin('read_input')
     try:
         # Try reading as CSV first
         treatment_df = pd.read_csv(treatment_file)
@@ -159,66 +392,36 @@ def main():
             lines = f.readlines()
         treatment_names = [line.strip() for line in lines[1:] if line.strip()]
     
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_treatments = []
-    for name in treatment_names:
-        normalized = name.lower()
-        if normalized not in seen:
-            seen.add(normalized)
-            unique_treatments.append(name)
-    
-    print(f"Processing {len(unique_treatments)} unique treatments...")
-    
-    # Process treatments
-    results = []
+    profiler.set_rows(len(treatment_names))
     
-    for i, treatment_name in enumerate(unique_treatments):
-        if i % 50 == 0 and i > 0:
-            print(f"  Processed {i}/{len(unique_treatments)}...")
-        
-        # Get all possible names to try
-        names_to_try = extract_names_from_parentheses(treatment_name)
-        
-        result = {
-            'Treatment Name': treatment_name,
-            'matched': False,
-            'RXCUI': '',
-            'matched_name': '',
-            'sources': '',
-            'term_type': '',
-            'match_method': '',
-            'searched_terms': '|'.join(names_to_try)
-        }
+    profiler.begin('annotate', rows=len(treatment_names))
+    # Dose, route, form and frequency details, tokenized once per distinct name
+    details = treatment_details(treatment_names)
+    with ResultWriter(output_file, args.output_format, DICTIONARY_COLUMNS, args.batch_size, COLUMN_TYPES) as writer:
+        if args.vectorized:
+            # Resolve every treatment in one join against the lookup tables
+            results_df, unique_count, stage_stats = annotate_exact_join(treatment_names, rxnorm_df, args.stages)
+            pipeline = MatchPipeline([], stats=stage_stats)
+            results_df = pd.concat([results_df, pd.DataFrame(details, columns=DETAIL_COLUMNS)], axis=1)
+            writer.write_frame(results_df)
+        else:
+            # Resolve each normalized form once, writing every row as its result comes in
+            resolved = {}
+            results = []
+            annotated = iter_fan_out(treatment_names, lambda name: annotate_treatment(name, pipeline),
+                                     resolved=resolved, progress_every=50)
+            for name, result, detail in zip(treatment_names, annotated, details):
+                result = dict(result, **{'Treatment Name': name}, **detail)
+                results.append(result)
+                writer.write(result)
+            unique_count = len(resolved)
+            results_df = pd.DataFrame(results)
         
-        # Try each possible name
-        for search_term in names_to_try:
-            # Try normalized lookup first
-            if search_term in rxnorm_lookup:
-                match = rxnorm_lookup[search_term]
-                result['matched'] = True
-                result['RXCUI'] = match['RXCUI']
-                result['matched_name'] = match['name']
-                result['sources'] = match['sources']
-                result['term_type'] = match['term_type']
-                result['match_method'] = 'normalized'
-                break
-            # Try clean name lookup
-            elif search_term in clean_lookup:
-                match = clean_lookup[search_term]
-                result['matched'] = True
-                result['RXCUI'] = match['RXCUI']
-                result['matched_name'] = match['name']
-                result['sources'] = match['sources']
-                result['term_type'] = match['term_type']
-                result['match_method'] = 'clean_name'
-                break
+        print(f"Annotated {len(treatment_names)} rows from {unique_count} unique treatments")
         
-        results.append(result)
-    
-    # Create DataFrame and save
-    results_df = pd.DataFrame(results)
-    results_df.to_csv(output_file, index=False)
+        # Finish the output file
+        profiler.begin('write_output', rows=len(treatment_names))
+    profiler.end()
     
     # Print summary
     total = len(results_df)
@@ -243,6 +446,8 @@ def main():
         for term_type, count in term_types.items():
             print(f"  {term_type}: {count}")
     
+    pipeline.print_stats()
+    
     # Show examples of matches
     print(f"\nExample matches:")
     matched_samples = results_df[results_df['matched']].head(10)
@@ -261,6 +466,12 @@ def main():
             print(f"  {row['Treatment Name']} -> {row['matched_name']}")
     
     print(f"\nResults saved to: {output_file}")
+    
+    profiler.extra['stages'] = pipeline.stats
+    profiler.finish()
+    
+    if args.metrics_file:
+        write_metrics(args.metrics_file, profiler, results_df, pipeline)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
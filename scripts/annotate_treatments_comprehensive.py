@@ -7,51 +7,79 @@ This script annotates treatments using both:
 2. Cerbo supplements database
 
 Usage:
-    python annotate_treatments_comprehensive.py [input_file.csv]
+    python annotate_treatments_comprehensive.py [input_file.csv] [--top-k N] [--sqlite-index PATH]
+
+With --top-k, the best N candidates from each database are written alongside
+the chosen match so uncertain annotations can be reviewed without searching
+RxNorm by hand.
+
+With --sqlite-index, RxNorm queries are answered from a SQLite index built by
+sqlite_index.py or create_unified_rxnorm_core.py --sqlite instead of loading
+the RxNorm table into memory.
+
+The 'phonetic' stage is a fallback for names the fuzzy RxNorm stage and the
+exact supplements stage miss. It matches sound-alike misspellings of brand
+and ingredient names ("Klonapin") by scoring only the entries that share
+their phonetic key, before the fuzzy supplements stage can pick a wrong
+supplement.
 """
 
 import pandas as pd
 from difflib import SequenceMatcher
-import re
-import sys
+import argparse
+import heapq
+import json
 import os
 
+from database_loader import (DEFAULT_CATALOG_BUDGET_MB, TENANT_SUPPLEMENT_PATH, LazyDatabase,
+                             SupplementCatalogs, load_rxnorm_compact)
+from fuzzy_prefilter import FuzzyPrefilter
+from matching_pipeline import MatchPipeline, MatchStage, iter_fan_out
+from phonetic_index import PhoneticIndex
+from result_writer import ResultWriter, add_output_arguments, output_path
+from sqlite_index import RxnormSqliteIndex
+from run_metrics import MetricsFile, add_metrics_arguments
+from run_profiler import RunProfiler, add_profile_arguments
+from treatment_tokenizer import FUZZY_NAME_TOKENIZER, exact_key
+
+DEFAULT_STAGES = ['exact', 'fuzzy', 'supplements_exact', 'phonetic', 'supplements']
+
+# Low-cardinality output columns stored as dictionaries in parquet/arrow output
+DICTIONARY_COLUMNS = ['match_source', 'match_type', 'category']
+
+def output_column_types(top_k=0):
+    """Non-text output columns, typed up front so parquet/arrow schemas do not depend on the first batch"""
+    column_types = {'confidence': 'float'}
+    column_types.update({f'candidate_{rank}_score': 'float' for rank in range(1, top_k + 1)})
+    return column_types
+
 def normalize_name(name):
     """Normalize treatment name for better matching"""
     if pd.isna(name):
         return ""
-    
-    name = str(name).lower().strip()
-    
-    # Remove common patterns
-    name = re.sub(r'\b(tablet|capsule|injection|cream|gel|ointment|syrup|liquid|suspension)s?\b', '', name)
-    name = re.sub(r'\b\d+\s*(mg|mcg|g|ml|cc|units?|iu|meq)\b', '', name)  # Remove dosages
-    name = re.sub(r'\bonce\s+daily\b|\bod\b|\bbid\b|\btid\b|\bqid\b', '', name)  # Remove frequency
-    name = re.sub(r'\b(oral|topical|iv|im|sc|sublingual|rectal)\b', '', name)  # Remove routes
-    name = re.sub(r'[^\w\s]', ' ', name)  # Replace punctuation with spaces
-    name = re.sub(r'\s+', ' ', name).strip()  # Normalize whitespace
-    
-    return name
+    # Remove forms, dosages, frequencies and routes, and turn punctuation into spaces, in one scan
+    return FUZZY_NAME_TOKENIZER.core_name(name)
 
-def find_best_match(treatment_name, database_df, name_column, threshold=0.6):
-    """Find best matching entry in a database"""
-    if not treatment_name:
-        return None, 0, 'no_match'
-    
-    normalized_treatment = normalize_name(treatment_name)
-    if not normalized_treatment:
-        return None, 0, 'no_match'
-    
-    # Try exact match first
-    exact_matches = database_df[database_df[name_column].str.lower() == treatment_name.lower()]
-    if len(exact_matches) > 0:
-        return exact_matches.iloc[0], 1.0, 'exact'
-    
-    # Try fuzzy matching
+def match_key(treatment_name):
+    """Fan-out key: the forms the stages compare, exact_key() and normalize_name()
+
+    Names with the same key always get the same annotation, so "Low Dose
+    Naltrexone", "low-dose naltrexone" and "LOW DOSE NALTREXONE " share one.
+    """
+    return exact_key(treatment_name), normalize_name(treatment_name)
+
+def find_fuzzy_match(normalized_treatment, database_df, name_column, threshold=0.6, top_k=0):
+    """Score every database entry against a normalized treatment name
+
+    Returns (best_row, best_score, candidates). With top_k > 0 the best top_k
+    entries are kept in a bounded heap during the same scoring pass and
+    returned as (score, row) pairs sorted best first.
+    """
     best_match = None
     best_score = 0
+    heap = []
     
-    for _, row in database_df.iterrows():
+    for position, (_, row) in enumerate(database_df.iterrows()):
         if pd.isna(row[name_column]):
             continue
             
@@ -73,176 +101,557 @@ def find_best_match(treatment_name, database_df, name_column, threshold=0.6):
             word_overlap = len(treatment_words.intersection(db_words)) / len(treatment_words.union(db_words))
             similarity = max(similarity, word_overlap * 0.9)
         
-        if similarity > best_score and similarity >= threshold:
+        if similarity < threshold:
+            continue
+        
+        if similarity > best_score:
             best_score = similarity
             best_match = row
-    
-    if best_match is not None:
-        return best_match, best_score, 'fuzzy'
-    else:
-        return None, 0, 'no_match'
+        
+        # Keep the top_k candidates; earlier rows win ties like best_match does
+        if top_k:
+            entry = (similarity, -position, row)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    
+    candidates = [(score, row) for score, _, row in sorted(heap, key=lambda e: e[:2], reverse=True)]
+    return best_match, best_score, candidates
 
-def load_databases():
-    """Load RxNorm and supplements databases"""
-    databases = {}
+class ExactNameStage(MatchStage):
+    """Exact match on a database's name column, ignoring case, punctuation and spacing
+
+    Names are grouped into an exact_key() -> row positions index on first
+    use instead of normalizing the whole column for every treatment, unless
+    the database was loaded with that index prepared.
+    """
+    
+    def __init__(self, name, database, source, top_k=0):
+        self.name = name
+        self.database = database
+        self.source = source
+        self.top_k = top_k
+        self._positions = None
+    
+    def positions(self):
+        if self._positions is None:
+            df = self.database.df
+            prepared = getattr(self.database, 'prepared', {})
+            if 'key_positions' in prepared:
+                self._positions = prepared['key_positions']
+            else:
+                keys = df[self.database.name_column].map(exact_key, na_action='ignore')
+                self._positions = keys.groupby(keys, sort=False).indices
+        return self._positions
+    
+    def match(self, query):
+        if not query.cached('normalized', normalize_name):
+            return None
+        positions = self.positions().get(query.cached('exact_key', exact_key))
+        if positions is None:
+            return None
+        
+        rows = self.database.df.iloc[positions[:max(self.top_k, 1)]]
+        if self.top_k:
+            query.candidates.extend(format_candidates(
+                [(1.0, row) for _, row in rows.iterrows()], self.database, self.source))
+        return {'source': self.source, 'database': self.database, 'row': rows.iloc[0],
+                'match_type': 'exact', 'confidence': 1.0}
+
+class FuzzyStage(MatchStage):
+    """Fuzzy scan of a database, accepted at min_confidence or above
+
+    Rows that cannot reach the cutoff are ruled out by a FuzzyPrefilter built
+    on first use; when no row can, the scan is skipped.
+    """
+    
+    def __init__(self, name, database, source, min_confidence=0.6, threshold=0.6, top_k=0):
+        self.name = name
+        self.database = database
+        self.source = source
+        self.min_confidence = min_confidence
+        self.threshold = threshold
+        self.top_k = top_k
+        self._prefilter = None
+    
+    def names(self):
+        """Every name in the database, in row order"""
+        return self.database.df[self.database.name_column].tolist()
+    
+    def rows_at(self, positions):
+        """DataFrame of the rows at positions, or of every row when positions is None"""
+        return self.database.df if positions is None else self.database.df.iloc[positions]
+    
+    def prefilter(self):
+        if self._prefilter is None:
+            prepared = getattr(self.database, 'prepared', {})
+            if 'normalized_names' in prepared:
+                # Names were normalized when the catalog was written
+                self._prefilter = FuzzyPrefilter(prepared['normalized_names'], lambda name: name)
+            else:
+                self._prefilter = FuzzyPrefilter(self.names(), normalize_name)
+        return self._prefilter
+    
+    def match(self, query):
+        normalized_treatment = query.cached('normalized', normalize_name)
+        if not normalized_treatment:
+            return None
+        
+        # Candidates are kept down to the scoring threshold; otherwise only a confident match counts
+        cutoff = self.threshold if self.top_k else max(self.threshold, self.min_confidence)
+        positions = self.prefilter().candidate_positions(normalized_treatment, cutoff)
+        if positions is not None and len(positions) == 0:
+            query.skipped = True
+            return None
+        
+        best_row, confidence, candidates = find_fuzzy_match(
+            normalized_treatment, self.rows_at(positions), self.database.name_column,
+            self.threshold, self.top_k)
+        if self.top_k:
+            query.candidates.extend(format_candidates(candidates, self.database, self.source))
+        
+        if best_row is None or confidence < self.min_confidence:
+            return None
+        return {'source': self.source, 'database': self.database, 'row': best_row,
+                'match_type': 'fuzzy', 'confidence': confidence}
+
+class PhoneticStage(MatchStage):
+    """Sound-alike match on a database's brand and ingredient names
+
+    Only the rows sharing the treatment's phonetic key in a PhoneticIndex
+    built on first use are scored. The confidence is their SequenceMatcher
+    ratio to the normalized treatment, and the best row is accepted at
+    min_confidence or above. Treatments with no candidates count as skipped.
+    """
+    
+    def __init__(self, name, database, source, min_confidence=0.75, top_k=0):
+        self.name = name
+        self.database = database
+        self.source = source
+        self.min_confidence = min_confidence
+        self.top_k = top_k
+        self._index = None
+    
+    def names(self):
+        """Every name in the database and its term type, in row order"""
+        df = self.database.df
+        return df[self.database.name_column].tolist(), df[self.database.type_column].tolist()
+    
+    def rows_at(self, positions):
+        """DataFrame of the rows at positions"""
+        return self.database.df.iloc[positions]
+    
+    def index(self):
+        if self._index is None:
+            names, term_types = self.names()
+            self._index = PhoneticIndex(names, normalize_name, term_types)
+        return self._index
+    
+    def match(self, query):
+        normalized_treatment = query.cached('normalized', normalize_name)
+        if not normalized_treatment:
+            return None
+        positions = self.index().candidates(normalized_treatment)
+        if not positions:
+            query.skipped = True
+            return None
+        
+        rows = self.rows_at(positions)
+        scored = [(SequenceMatcher(None, normalized_treatment, normalize_name(name)).ratio(), position)
+                  for position, name in enumerate(rows[self.database.name_column])]
+        # Best first, earlier rows winning ties
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        if self.top_k:
+            query.candidates.extend(format_candidates(
+                [(score, rows.iloc[position]) for score, position in scored[:self.top_k]],
+                self.database, self.source))
+        
+        confidence, position = scored[0]
+        if confidence < self.min_confidence:
+            return None
+        return {'source': self.source, 'database': self.database, 'row': rows.iloc[position],
+                'match_type': 'phonetic', 'confidence': confidence}
+
+class SqliteExactStage(ExactNameStage):
+    """Exact match answered by the exact_key column of a SQLite index"""
+    
+    def match(self, query):
+        if not query.cached('normalized', normalize_name):
+            return None
+        rows = self.database.exact_name(query.treatment_name, limit=max(self.top_k, 1))
+        if not rows:
+            return None
+        
+        if self.top_k:
+            query.candidates.extend(format_candidates(
+                [(1.0, row) for row in rows], self.database, self.source))
+        return {'source': self.source, 'database': self.database, 'row': rows[0],
+                'match_type': 'exact', 'confidence': 1.0}
+
+class SqliteFuzzyStage(FuzzyStage):
+    """FuzzyStage over a SQLite index
+
+    The prefilter is built from the names read from the index, and only the
+    rows it cannot rule out are fetched and scored, so matches are the same
+    as over the in-memory table.
+    """
+    
+    def names(self):
+        return self.database.column(self.database.name_column)
+    
+    def rows_at(self, positions):
+        if positions is None:
+            positions = range(self.database.row_count)
+        return pd.DataFrame(self.database.rows_at(positions))
+
+class SqlitePhoneticStage(PhoneticStage):
+    """PhoneticStage over a SQLite index, fetching only the rows sharing the phonetic key"""
     
-    # Load RxNorm medications
-    try:
-        rxnorm_df = pd.read_csv('data/rxnorm_core_medications.csv', low_memory=False)
-        databases['rxnorm'] = {
-            'df': rxnorm_df,
-            'name_column': 'DrugName',
-            'id_column': 'primary_RXCUI',
-            'type_column': 'preferred_term_type'
+    def names(self):
+        return self.database.column(self.database.name_column), self.database.column(self.database.type_column)
+    
+    def rows_at(self, positions):
+        return pd.DataFrame(self.database.rows_at(positions))
+
+def build_stages(databases, top_k=0):
+    """All stages the available databases support, keyed by name
+
+    RxNorm fuzzy matches need 0.85 confidence and phonetic matches 0.75; the
+    supplements stages accept anything over the 0.6 scoring threshold. An
+    RxNorm SQLite index gets the on-disk versions of the RxNorm stages, which
+    match the same rows.
+    """
+    available = {}
+    if databases.get('rxnorm'):
+        on_disk = isinstance(databases['rxnorm'], RxnormSqliteIndex)
+        exact_stage = SqliteExactStage if on_disk else ExactNameStage
+        phonetic_stage = SqlitePhoneticStage if on_disk else PhoneticStage
+        fuzzy_stage = SqliteFuzzyStage if on_disk else FuzzyStage
+        available['exact'] = exact_stage('exact', databases['rxnorm'], 'rxnorm', top_k)
+        available['phonetic'] = phonetic_stage('phonetic', databases['rxnorm'], 'rxnorm', top_k=top_k)
+        available['fuzzy'] = fuzzy_stage('fuzzy', databases['rxnorm'], 'rxnorm',
+                                         min_confidence=0.85, top_k=top_k)
+    if databases.get('supplements'):
+        available['supplements_exact'] = ExactNameStage('supplements_exact', databases['supplements'],
+                                                        'supplements', top_k)
+        available['supplements'] = FuzzyStage('supplements', databases['supplements'],
+                                              'supplements', top_k=top_k)
+    return available
+
+def build_pipeline(databases, stage_names=None, top_k=0, available=None, stats=None):
+    """Build the matching pipeline from available databases
+
+    available can supply prebuilt stages, such as RxNorm stages shared by
+    several tenants' pipelines; stats can be a stats dict shared between them.
+    """
+    if available is None:
+        available = build_stages(databases, top_k)
+    if stage_names is None:
+        stage_names = DEFAULT_STAGES
+    # Stages for a missing database are skipped, as before
+    return MatchPipeline.from_names(available, [name for name in stage_names if name in available],
+                                    stats=stats)
+
+def format_candidates(candidates, database, source):
+    """Describe ranked candidates with name, identifier, term type and score"""
+    return [
+        {
+            'source': source,
+            'name': row[database.name_column],
+            'identifier': row[database.id_column],
+            'term_type': '' if pd.isna(row.get(database.type_column)) else row.get(database.type_column),
+            'score': round(float(score), 4)
         }
-        print(f"✅ Loaded RxNorm database: {len(rxnorm_df):,} medications")
-    except FileNotFoundError:
-        print("⚠️ RxNorm database not found: data/rxnorm_core_medications.csv")
-        databases['rxnorm'] = None
-    
-    # Load supplements
-    supplement_files = ['data/cerbo_supplements.csv', 'cerbo_supplements.csv']
-    supplements_loaded = False
-    
-    for file_path in supplement_files:
-        try:
-            supplements_df = pd.read_csv(file_path, low_memory=False)
-            databases['supplements'] = {
-                'df': supplements_df,
-                'name_column': 'name',
-                'id_column': 'supplement_id',
-                'type_column': 'class'
-            }
-            print(f"✅ Loaded supplements database: {len(supplements_df):,} supplements")
-            supplements_loaded = True
-            break
-        except FileNotFoundError:
-            continue
+        for score, row in candidates
+    ]
+
+def candidates_to_columns(candidates, top_k):
+    """Flatten ranked candidates into candidate_<n>_* columns"""
+    columns = {}
+    for rank in range(1, top_k + 1):
+        candidate = candidates[rank - 1] if rank <= len(candidates) else {}
+        for field in ('source', 'name', 'identifier', 'term_type', 'score'):
+            columns[f'candidate_{rank}_{field}'] = candidate.get(field)
+    return columns
+
+def _json_default(value):
+    """Serialize numpy scalars found in DataFrame rows"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def load_databases(sqlite_index=None, catalogs=None, tenant=None):
+    """Locate RxNorm and supplements databases
+
+    Each database is loaded lazily, reading only the columns used for matching
+    and output, the first time a treatment needs it. With sqlite_index, RxNorm
+    queries are answered from that SQLite index instead. The supplements
+    catalog is the tenant's catalog from catalogs (the default catalog when
+    tenant is None).
+    """
+    databases = {}
     
-    if not supplements_loaded:
+    # RxNorm medications
+    if sqlite_index:
+        databases['rxnorm'] = RxnormSqliteIndex(sqlite_index)
+        print(f"✅ Opened RxNorm SQLite index: {sqlite_index} ({databases['rxnorm'].row_count:,} entries)")
+    else:
+        databases['rxnorm'] = LazyDatabase.find(
+            'RxNorm', ['data/rxnorm_core_medications.csv'],
+            name_column='DrugName',
+            id_column='primary_RXCUI',
+            type_column='preferred_term_type',
+            loader=lambda path: load_rxnorm_compact(
+                path, columns=['primary_RXCUI', 'DrugName', 'preferred_term_type'])
+        )
+        if databases['rxnorm']:
+            print(f"✅ Found RxNorm database: {databases['rxnorm'].path}")
+        else:
+            print("⚠️ RxNorm database not found: data/rxnorm_core_medications.csv")
+    
+    # Supplements
+    catalogs = catalogs or SupplementCatalogs()
+    databases['supplements'] = catalogs.get(tenant)
+    if databases['supplements']:
+        print(f"✅ Found supplements database: {databases['supplements'].path}")
+    elif tenant is not None:
+        print(f"⚠️ Supplements catalog not found for tenant {tenant}: {catalogs.paths_for(tenant)[0]}")
+    else:
         print("⚠️ Supplements database not found. Run fetch_supplements_from_cerbo.py first")
-        databases['supplements'] = None
     
     return databases
 
-def annotate_comprehensive(treatment_df, databases):
-    """Annotate treatments using both RxNorm and supplements databases"""
+def treatment_names_from(treatment_df):
+    """Treatment names from the 'Treatment Name' or 'treatment' column, else the first column"""
+    if 'Treatment Name' in treatment_df.columns:
+        return treatment_df['Treatment Name'].tolist()
+    elif 'treatment' in treatment_df.columns:
+        return treatment_df['treatment'].tolist()
+    return treatment_df.iloc[:, 0].tolist()
+
+def annotate_treatment(treatment_name, pipeline, top_k=0, candidates_format='json'):
+    """Annotate one treatment name, returning (annotation, stats key)"""
+    annotation = {
+        'treatment_name': treatment_name,
+        'match_source': 'no_match',
+        'match_type': 'no_match',
+        'confidence': 0.0,
+        'matched_name': '',
+        'identifier': '',
+        'category': '',
+        'additional_info': ''
+    }
+    
+    match, query = pipeline.match(treatment_name)
     
-    print(f"\nAnnotating {len(treatment_df)} treatments...")
+    if match is None:
+        return _with_candidates(annotation, query.candidates, top_k, candidates_format), 'no_match'
+    
+    database = match['database']
+    matched_row = match['row']
+    category = matched_row.get(database.type_column, '')
+    if match['source'] == 'rxnorm':
+        additional_info = f"RxNorm {database.type_column}: {category}"
+    else:
+        additional_info = f"Supplement class: {category}"
+    
+    annotation.update({
+        'match_source': match['source'],
+        'match_type': match['match_type'],
+        'confidence': match['confidence'],
+        'matched_name': matched_row[database.name_column],
+        'identifier': matched_row[database.id_column],
+        'category': category,
+        'additional_info': additional_info
+    })
+    stats_key = f"{match['source']}_{match['match_type']}"
+    return _with_candidates(annotation, query.candidates, top_k, candidates_format), stats_key
+
+def annotate_comprehensive(treatment_df, databases, top_k=0, candidates_format='json', pipeline=None,
+                           writer=None):
+    """Annotate treatments using both RxNorm and supplements databases
+
+    Treatments run through the matching pipeline (exact and fuzzy RxNorm,
+    exact supplements, phonetic RxNorm, then fuzzy supplements by default).
+    Names with the same match_key() are annotated once, and the result is
+    fanned back out to every input row in order. With top_k > 0 each annotation also
+    carries the best top_k candidates across both databases, as a JSON
+    'candidates' column or as candidate_<n>_* columns depending on
+    candidates_format. With a ResultWriter, each row is written as soon as
+    it is annotated.
+    """
+    if pipeline is None:
+        pipeline = build_pipeline(databases, top_k=top_k)
+    
+    treatment_names = treatment_names_from(treatment_df)
+    resolved = {}
+    results = iter_fan_out(
+        treatment_names,
+        lambda name: annotate_treatment(name, pipeline, top_k, candidates_format),
+        key=match_key, resolved=resolved, progress_every=100)
     
     annotations = []
     stats = {
         'rxnorm_exact': 0,
+        'rxnorm_phonetic': 0,
         'rxnorm_fuzzy': 0, 
         'supplements_exact': 0,
         'supplements_fuzzy': 0,
         'no_match': 0
     }
     
-    for idx, row in treatment_df.iterrows():
-        if 'Treatment Name' in row:
-            treatment_name = row['Treatment Name']
-        elif 'treatment' in row:
-            treatment_name = row['treatment']
-        else:
-            treatment_name = row.iloc[0]  # Use first column
-        
-        annotation = {
-            'treatment_name': treatment_name,
-            'match_source': 'no_match',
-            'match_type': 'no_match',
-            'confidence': 0,
-            'matched_name': '',
-            'identifier': '',
-            'category': '',
-            'additional_info': ''
-        }
-        
-        # Try RxNorm first (require higher confidence for fuzzy matches)
-        if databases['rxnorm']:
-            rxnorm_match, confidence, match_type = find_best_match(
-                treatment_name, 
-                databases['rxnorm']['df'], 
-                databases['rxnorm']['name_column']
-            )
-            
-            # Only accept RxNorm matches with high confidence (exact or fuzzy >= 0.85)
-            if rxnorm_match is not None and (match_type == 'exact' or confidence >= 0.85):
-                annotation.update({
-                    'match_source': 'rxnorm',
-                    'match_type': match_type,
-                    'confidence': confidence,
-                    'matched_name': rxnorm_match[databases['rxnorm']['name_column']],
-                    'identifier': rxnorm_match[databases['rxnorm']['id_column']],
-                    'category': rxnorm_match.get(databases['rxnorm']['type_column'], ''),
-                    'additional_info': f"RxNorm {databases['rxnorm']['type_column']}: {rxnorm_match.get(databases['rxnorm']['type_column'], '')}"
-                })
-                
-                if match_type == 'exact':
-                    stats['rxnorm_exact'] += 1
-                else:
-                    stats['rxnorm_fuzzy'] += 1
-                
-                annotations.append(annotation)
-                continue
-        
-        # Try supplements if no RxNorm match
-        if databases['supplements']:
-            supplement_match, confidence, match_type = find_best_match(
-                treatment_name,
-                databases['supplements']['df'],
-                databases['supplements']['name_column']
-            )
-            
-            if supplement_match is not None:
-                annotation.update({
-                    'match_source': 'supplements',
-                    'match_type': match_type,
-                    'confidence': confidence,
-                    'matched_name': supplement_match[databases['supplements']['name_column']],
-                    'identifier': supplement_match[databases['supplements']['id_column']],
-                    'category': supplement_match.get(databases['supplements']['type_column'], ''),
-                    'additional_info': f"Supplement class: {supplement_match.get(databases['supplements']['type_column'], '')}"
-                })
-                
-                if match_type == 'exact':
-                    stats['supplements_exact'] += 1
-                else:
-                    stats['supplements_fuzzy'] += 1
-                
-                annotations.append(annotation)
-                continue
-        
-        # No match found
-        stats['no_match'] += 1
+    for treatment_name, (annotation, stats_key) in zip(treatment_names, results):
+        annotation = dict(annotation, treatment_name=treatment_name)
         annotations.append(annotation)
-        
-        # Progress indicator
-        if (idx + 1) % 100 == 0:
-            print(f"  Processed {idx + 1:,} treatments...")
+        if writer is not None:
+            writer.write(annotation)
+        stats[stats_key] += 1
     
+    print(f"\nAnnotated {len(treatment_names):,} treatments from {len(resolved):,} unique names")
     return pd.DataFrame(annotations), stats
 
+def annotate_by_tenant(treatment_df, rxnorm, catalogs, tenant_column, stage_names=None,
+                       top_k=0, candidates_format='json'):
+    """Annotate rows against their own tenant's supplements catalog
+
+    Rows are grouped by tenant_column. The RxNorm stages are built once and
+    shared by every tenant's pipeline, while each tenant gets supplements
+    stages over its catalog from catalogs. Returns (results in input order,
+    stats, pipeline) where the pipeline's stats cover all tenants.
+    """
+    rxnorm_stages = build_stages({'rxnorm': rxnorm}, top_k)
+    stage_stats = {}
+    stats = dict.fromkeys(['rxnorm_exact', 'rxnorm_phonetic', 'rxnorm_fuzzy', 'supplements_exact',
+                           'supplements_fuzzy', 'no_match'], 0)
+    results = []
+    pipeline = None
+    
+    for tenant, positions in treatment_df.groupby(tenant_column, sort=False, dropna=False).indices.items():
+        tenant = None if pd.isna(tenant) else str(tenant)
+        catalog = catalogs.get(tenant)
+        if catalog is None:
+            print(f"⚠️ No supplements catalog for tenant {tenant}, matching RxNorm only")
+        print(f"\nTenant {tenant or 'default'}: {len(positions):,} treatments")
+        
+        available = dict(rxnorm_stages, **build_stages({'supplements': catalog}, top_k))
+        pipeline = build_pipeline({}, stage_names, top_k, available=available, stats=stage_stats)
+        tenant_df = treatment_df.iloc[positions]
+        tenant_results, tenant_stats = annotate_comprehensive(tenant_df, None, top_k, candidates_format, pipeline)
+        tenant_results.index = tenant_df.index
+        results.append(tenant_results)
+        for key, count in tenant_stats.items():
+            stats[key] += count
+    
+    if pipeline is None:
+        pipeline = build_pipeline({}, stage_names, top_k, available=rxnorm_stages, stats=stage_stats)
+    results_df = pd.concat(results).loc[treatment_df.index].reset_index(drop=True) if results else pd.DataFrame()
+    return results_df, stats, pipeline
+
+def _with_candidates(annotation, candidates, top_k, candidates_format):
+    """Attach the overall top_k candidates to an annotation"""
+    if not top_k:
+        return annotation
+    
+    # Stages may offer the same entry; keep its best score
+    best = {}
+    for candidate in candidates:
+        key = (candidate['source'], candidate['identifier'], candidate['name'])
+        if key not in best or candidate['score'] > best[key]['score']:
+            best[key] = candidate
+    ranked = sorted(best.values(), key=lambda c: c['score'], reverse=True)[:top_k]
+    if candidates_format == 'columns':
+        annotation.update(candidates_to_columns(ranked, top_k))
+    else:
+        annotation['candidates'] = json.dumps(ranked, default=_json_default)
+    return annotation
+
+def write_metrics(path, profiler, stats, total, pipeline, catalogs=None):
+    """Write run metrics in Prometheus text format"""
+    metrics = MetricsFile('rxnorm_annotator', 'annotate_treatments_comprehensive')
+    metrics.add('rows_processed', total, "Treatment rows annotated in the run")
+    for key, count in stats.items():
+        source, _, match_type = key.rpartition('_')
+        if key == 'no_match':
+            source, match_type = 'none', 'no_match'
+        metrics.add('matches', count, "Annotated rows by match source and type",
+                    labels={'source': source, 'match_type': match_type})
+    for stage, stage_stats in pipeline.stats.items():
+        metrics.add('stage_hits', stage_stats['hits'], "Unique treatments matched by each pipeline stage",
+                    labels={'stage': stage})
+        metrics.add('stage_duration_seconds', stage_stats['seconds'], "Cumulative time spent in each pipeline stage",
+                    labels={'stage': stage})
+        metrics.add('stage_skips', stage_stats['skipped'], "Unique treatments a pipeline stage ruled out unscored",
+                    labels={'stage': stage})
+    if catalogs is not None:
+        metrics.add('catalog_loads', catalogs.stats['loads'], "Supplement catalogs loaded from disk")
+        metrics.add('catalog_evictions', catalogs.stats['evictions'],
+                    "Supplement catalogs unloaded to stay within the memory budget")
+        metrics.add('catalog_bytes', catalogs.bytes_in_use, "Memory held by loaded supplement catalogs")
+    metrics.add_run_metrics(profiler)
+    metrics.write(path)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Annotate treatments with RxNorm and supplements")
+    parser.add_argument('input_file', nargs='?', default='examples/sample_treatments.csv',
+                        help="Treatment CSV file (default: examples/sample_treatments.csv)")
+    parser.add_argument('--top-k', type=int, default=0,
+                        help="Also output the best N ranked candidates for manual review")
+    parser.add_argument('--candidates-format', choices=['json', 'columns'], default='json',
+                        help="Write candidates as one JSON column or as candidate_<n>_* columns")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES),
+                        help="Comma-separated matching stages in order "
+                             f"(default: {','.join(DEFAULT_STAGES)})")
+    parser.add_argument('--sqlite-index', metavar='PATH',
+                        help="Answer RxNorm queries from a SQLite index (see sqlite_index.py) "
+                             "instead of loading the RxNorm CSV")
+    parser.add_argument('--tenant',
+                        help=f"Use this tenant's supplements catalog ({TENANT_SUPPLEMENT_PATH})")
+    parser.add_argument('--tenant-column',
+                        help="Input column naming each row's tenant; rows use their own tenant's catalog")
+    parser.add_argument('--catalog-budget-mb', type=float, default=DEFAULT_CATALOG_BUDGET_MB,
+                        help="Memory budget for loaded supplement catalogs "
+                             f"(default: {DEFAULT_CATALOG_BUDGET_MB})")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if args.top_k < 0:
+        parser.error(f"--top-k must be 0 or more, got {args.top_k}")
+    
+    args.stages = args.stages.split(',')
+    unknown = [name for name in args.stages if name not in DEFAULT_STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    return args
+
 def main():
     """Main annotation function"""
+    args = parse_args()
+    profiler = RunProfiler.from_args('annotate_treatments_comprehensive.py', args)
     
     print("Comprehensive Treatment Annotation (RxNorm + Supplements)")
     print("=" * 60)
     
     # Load databases
-    databases = load_databases()
+    profiler.begin('locate_databases')
+    catalogs = SupplementCatalogs(memory_budget=int(args.catalog_budget_mb * 1024 * 1024))
+    try:
+        databases = load_databases(args.sqlite_index, catalogs, args.tenant)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
     
-    if not databases['rxnorm'] and not databases['supplements']:
+    if not databases['rxnorm'] and not databases['supplements'] and not args.tenant_column:
         print("❌ No databases available for annotation")
         return 1
     
     # Load treatment data
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
-    else:
-        # Default to sample treatments
-        input_file = 'examples/sample_treatments.csv'
+    input_file = args.input_file
     
+    profiler.begin('read_input')
     try:
         treatment_df = pd.read_csv(input_file)
         print(f"✅ Loaded treatments from: {input_file}")
@@ -250,23 +659,46 @@ def main():
         print(f"❌ Treatment file not found: {input_file}")
         return 1
     
-    # Remove duplicates
-    original_count = len(treatment_df)
-    if 'Treatment Name' in treatment_df.columns:
-        treatment_df = treatment_df.drop_duplicates(subset=['Treatment Name'])
-    elif 'treatment' in treatment_df.columns:
-        treatment_df = treatment_df.drop_duplicates(subset=['treatment'])
-    else:
-        treatment_df = treatment_df.drop_duplicates()
+    if args.tenant_column and args.tenant_column not in treatment_df.columns:
+        print(f"❌ Tenant column not found in input: {args.tenant_column}")
+        return 1
     
-    print(f"Processing {len(treatment_df)} unique treatments (removed {original_count - len(treatment_df)} duplicates)")
+    print(f"Processing {len(treatment_df):,} treatments")
     
-    # Perform comprehensive annotation
-    results_df, stats = annotate_comprehensive(treatment_df, databases)
+    # Perform comprehensive annotation, writing rows as they are produced
+    output_file = output_path(input_file.replace('.csv', '_comprehensive_annotated.csv'),
+                              args.output_format)
+    profiler.begin('annotate', rows=len(treatment_df))
+    try:
+        with ResultWriter(output_file, args.output_format, DICTIONARY_COLUMNS, args.batch_size,
+                          output_column_types(args.top_k)) as writer:
+            if args.tenant_column:
+                results_df, stats, pipeline = annotate_by_tenant(treatment_df, databases['rxnorm'], catalogs,
+                                                                 args.tenant_column, args.stages,
+                                                                 top_k=args.top_k,
+                                                                 candidates_format=args.candidates_format)
+                # Tenants are annotated group by group, so rows are written once back in input order
+                writer.write_frame(results_df)
+            else:
+                pipeline = build_pipeline(databases, args.stages, top_k=args.top_k)
+                results_df, stats = annotate_comprehensive(treatment_df, databases,
+                                                           top_k=args.top_k,
+                                                           candidates_format=args.candidates_format,
+                                                           pipeline=pipeline, writer=writer)
+            profiler.begin('write_output', rows=len(results_df))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    profiler.end()
+    if databases['rxnorm'] is not None and databases['rxnorm'].loaded:
+        profiler.record('load_rxnorm', databases['rxnorm'].load_seconds,
+                        rows=databases['rxnorm'].row_count, within='annotate')
+    if catalogs.stats['loads']:
+        profiler.record('load_supplements', catalogs.stats['load_seconds'], within='annotate')
     
     # Calculate statistics
     total = len(results_df)
-    rxnorm_matches = stats['rxnorm_exact'] + stats['rxnorm_fuzzy']
+    rxnorm_matches = stats['rxnorm_exact'] + stats['rxnorm_phonetic'] + stats['rxnorm_fuzzy']
     supplement_matches = stats['supplements_exact'] + stats['supplements_fuzzy']
     total_matches = rxnorm_matches + supplement_matches
     
@@ -274,6 +706,7 @@ def main():
     print(f"Total treatments: {total:,}")
     print(f"\nRxNorm Medications:")
     print(f"  Exact matches: {stats['rxnorm_exact']:,} ({(stats['rxnorm_exact']/total)*100:.1f}%)")
+    print(f"  Phonetic matches: {stats['rxnorm_phonetic']:,} ({(stats['rxnorm_phonetic']/total)*100:.1f}%)")
     print(f"  Fuzzy matches: {stats['rxnorm_fuzzy']:,} ({(stats['rxnorm_fuzzy']/total)*100:.1f}%)")
     print(f"  Total RxNorm: {rxnorm_matches:,} ({(rxnorm_matches/total)*100:.1f}%)")
     
@@ -286,9 +719,20 @@ def main():
     print(f"  Total matched: {total_matches:,} ({(total_matches/total)*100:.1f}%)")
     print(f"  No matches: {stats['no_match']:,} ({(stats['no_match']/total)*100:.1f}%)")
     
-    # Save results
-    output_file = input_file.replace('.csv', '_comprehensive_annotated.csv')
-    results_df.to_csv(output_file, index=False)
+    pipeline.print_stats()
+    
+    print(f"\nDatabase load times:")
+    for label, database in databases.items():
+        if database is None:
+            print(f"  {label}: not available")
+        elif database.loaded:
+            print(f"  {label}: {database.load_seconds:.2f}s")
+        else:
+            print(f"  {label}: not needed (never loaded)")
+    
+    if args.tenant or args.tenant_column:
+        catalogs.print_stats()
+    
     print(f"\n✅ Saved comprehensive annotations to: {output_file}")
     
     # Show examples
@@ -315,6 +759,12 @@ def main():
         for _, row in unmatched_examples.iterrows():
             print(f"  ❌ {row['treatment_name']}")
     
+    profiler.extra['stages'] = pipeline.stats
+    profiler.finish()
+    
+    if args.metrics_file:
+        write_metrics(args.metrics_file, profiler, stats, total, pipeline, catalogs)
+    
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Prefix autocomplete over RxNorm drug names for EHR type-ahead
+
+PrefixIndex is built once from the RxNorm core database. Names are kept as a
+sorted array of normalized keys, so the entries starting with a prefix form
+one contiguous range found with two bisect calls. Completions are ranked by
+term type (IN, BN, PT, then anything else), then by number of sources, then
+by shorter name. Short prefixes match thousands of names, so their ranked
+completions are computed once when the index is built.
+
+Usage:
+    python autocomplete.py [prefix ...] [--limit N] [--database PATH]
+
+With no prefixes, reads one prefix per line from stdin.
+"""
+
+import argparse
+import bisect
+import csv
+import heapq
+import os
+import re
+import sys
+import time
+
+DEFAULT_DATABASE = 'data/rxnorm_core_medications.csv'
+
+TERM_TYPE_PRIORITY = {'IN': 0, 'BN': 1, 'PT': 2}
+
+# Prefixes up to this length have their completions precomputed
+CACHED_PREFIX_LENGTH = 2
+
+def normalize_prefix(text):
+    """Normalize typed text the way normalized_name is built"""
+    normalized = re.sub(r'[^\w\s-]', '', str(text).lower())
+    return re.sub(r'\s+', ' ', normalized).lstrip()
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+class PrefixIndex:
+    """Sorted key array answering ranked prefix queries
+
+    Each normalized name appears once, represented by its best ranked row.
+    """
+
+    def __init__(self, rows, max_limit=50):
+        best = {}
+        for row in rows:
+            key = row.get('normalized_name') or normalize_prefix(row.get('DrugName', '')).strip()
+            if not key:
+                continue
+            entry = {
+                'name': row['DrugName'],
+                'rxcui': row['primary_RXCUI'],
+                'term_type': row.get('preferred_term_type') or '',
+                'num_sources': _to_int(row.get('num_sources')),
+            }
+            rank = self._rank(key, entry)
+            if key not in best or rank < best[key][0]:
+                best[key] = (rank, entry)
+
+        self.keys = sorted(best)
+        self.entries = [best[key][1] for key in self.keys]
+        self.ranks = [best[key][0] for key in self.keys]
+        self.max_limit = max_limit
+        self._cache = {}
+        for prefix in dict.fromkeys(key[:length] for key in self.keys
+                                    for length in range(1, CACHED_PREFIX_LENGTH + 1)):
+            self._cache[prefix] = self._top(prefix, self.max_limit)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """Build an index from an RxNorm core CSV file"""
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls(csv.DictReader(f), **kwargs)
+
+    @staticmethod
+    def _rank(key, entry):
+        return (TERM_TYPE_PRIORITY.get(entry['term_type'], len(TERM_TYPE_PRIORITY)),
+                -entry['num_sources'], len(key), key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """Positions [start, end) of the keys starting with prefix"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', lo=start)
+        return start, end
+
+    def count(self, text):
+        """Number of names starting with text"""
+        start, end = self.prefix_range(normalize_prefix(text))
+        return end - start
+
+    def complete(self, text, limit=10):
+        """Top completions for typed text, best first"""
+        prefix = normalize_prefix(text)
+        if not prefix:
+            return []
+        limit = min(limit, self.max_limit)
+
+        if len(prefix) <= CACHED_PREFIX_LENGTH:
+            return self._cache.get(prefix, [])[:limit]
+        return self._top(prefix, limit)
+
+    def _top(self, prefix, limit):
+        start, end = self.prefix_range(prefix)
+        if end - start <= limit:
+            positions = sorted(range(start, end), key=self.ranks.__getitem__)
+        else:
+            positions = heapq.nsmallest(limit, range(start, end), key=self.ranks.__getitem__)
+        return [self.entries[position] for position in positions]
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Prefix autocomplete over RxNorm drug names")
+    parser.add_argument('prefixes', nargs='*', help="Prefixes to complete (default: read from stdin)")
+    parser.add_argument('--limit', type=int, default=10, help="Completions per prefix (default: 10)")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f"RxNorm core CSV file (default: {DEFAULT_DATABASE})")
+    return parser.parse_args(argv)
+
+def print_completions(index, prefix, limit):
+    start = time.perf_counter()
+    completions = index.complete(prefix, limit)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+
+    print(f"\n{prefix!r}: {index.count(prefix):,} names, top {len(completions)} ({elapsed_us:.0f} µs)")
+    for entry in completions:
+        print(f"  {entry['name']:40} {entry['term_type']:3} RXCUI: {entry['rxcui']:>8}  "
+              f"sources: {entry['num_sources']}")
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"❌ RxNorm core file not found: {args.database}")
+        return 1
+
+    start = time.perf_counter()
+    index = PrefixIndex.from_csv(args.database)
+    print(f"✅ Built prefix index over {len(index):,} names ({time.perf_counter() - start:.2f}s)")
+
+    prefixes = args.prefixes or (line.rstrip('\n') for line in sys.stdin)
+    for prefix in prefixes:
+        if prefix.strip():
+            print_completions(index, prefix, args.limit)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
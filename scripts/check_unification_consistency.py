@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Whole-database brand-generic unification consistency check
+
+verify_unification.py and find_unmatched_brands.py test hand-picked
+brand/generic pairs. This check covers every row: it joins all BN entries
+against the IN/PT entries on normalized name and on ingredient tokens, using
+groupby over primary_RXCUI instead of one scan per pair, and flags each brand
+whose evidence points at a different group than its own:
+
+- name_matches_generic: the brand's normalized name is a generic name that
+  only exists in other groups
+- ingredient_elsewhere: a word of the brand name is an ingredient word found
+  only in other groups' generic names (e.g. "Ibuprofen PM" outside the
+  ibuprofen group); rarer words weigh more
+- brand_only_group: the brand's group has no IN or PT member at all
+
+Anomalies are ranked by score and written to a CSV report.
+
+Usage:
+    python check_unification_consistency.py [--database PATH] [--output PATH] [--top N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from database_loader import load_rxnorm_compact
+
+DEFAULT_DATABASE = 'data/rxnorm_core_medications.csv'
+DEFAULT_OUTPUT = 'unification_anomalies.csv'
+
+GENERIC_TYPES = ['IN', 'PT']
+
+# Salt, form and filler words shared by unrelated ingredients
+NON_INGREDIENT_WORDS = {
+    'hydrochloride', 'hydrobromide', 'sulfate', 'sodium', 'calcium', 'magnesium', 'potassium',
+    'maleate', 'tartrate', 'succinate', 'citrate', 'acetate', 'phosphate', 'chloride',
+    'bromide', 'mesylate', 'besylate', 'fumarate', 'hyclate', 'monohydrate', 'dihydrate',
+    'anhydrous', 'extract', 'acid', 'oral', 'topical', 'tablet', 'capsule', 'solution',
+    'cream', 'extended', 'release', 'with', 'plus', 'and', 'free', 'base', 'human',
+}
+
+MIN_TOKEN_LENGTH = 4
+
+SCORES = {
+    'name_matches_generic': 3.0,
+    'brand_only_group': 0.5,
+}
+
+REPORT_COLUMNS = ['score', 'anomaly', 'primary_RXCUI', 'DrugName', 'evidence',
+                  'suggested_RXCUI', 'suggested_name']
+
+def name_tokens(frame):
+    """One row per (row, ingredient-like word) of normalized_name"""
+    tokens = frame.assign(token=frame['normalized_name'].astype(str).str.split()).explode('token')
+    tokens = tokens[tokens['token'].str.len() >= MIN_TOKEN_LENGTH]
+    tokens = tokens[~tokens['token'].isin(NON_INGREDIENT_WORDS) & ~tokens['token'].str.isdigit()]
+    return tokens
+
+def group_names(generics):
+    """First generic name of each group, used to describe suggested groups"""
+    return generics.drop_duplicates('primary_RXCUI').set_index('primary_RXCUI')['DrugName']
+
+def name_anomalies(brands, generics):
+    """Brands whose normalized name is a generic name found only in other groups"""
+    pairs = brands.merge(generics, on='normalized_name', suffixes=('', '_generic'))
+    pairs['same_group'] = pairs['primary_RXCUI'] == pairs['primary_RXCUI_generic']
+    consistent = pairs.groupby('brand_row')['same_group'].transform('any')
+    flagged = pairs[~consistent].drop_duplicates('brand_row')
+
+    return pd.DataFrame({
+        'brand_row': flagged['brand_row'],
+        'anomaly': 'name_matches_generic',
+        'score': SCORES['name_matches_generic'],
+        'evidence': flagged['normalized_name'],
+        'suggested_RXCUI': flagged['primary_RXCUI_generic'],
+    })
+
+def ingredient_anomalies(brands, generics):
+    """Brands containing ingredient words that belong only to other groups"""
+    generic_tokens = name_tokens(generics)[['token', 'primary_RXCUI']].drop_duplicates()
+    token_spread = generic_tokens.groupby('token')['primary_RXCUI'].nunique().rename('token_groups')
+
+    brand_tokens = name_tokens(brands)[['brand_row', 'primary_RXCUI', 'token']].drop_duplicates()
+    pairs = brand_tokens.merge(generic_tokens, on='token', suffixes=('', '_generic'))
+    pairs['same_group'] = pairs['primary_RXCUI'] == pairs['primary_RXCUI_generic']
+    consistent = pairs.groupby(['brand_row', 'token'])['same_group'].transform('any')
+    flagged = pairs[~consistent].drop_duplicates(['brand_row', 'token'])
+    flagged = flagged.join(token_spread, on='token')
+    flagged['weight'] = 1.0 / flagged['token_groups']
+
+    per_brand = flagged.sort_values(['brand_row', 'weight'], ascending=[True, False]).groupby('brand_row')
+    return pd.DataFrame({
+        'anomaly': 'ingredient_elsewhere',
+        'score': per_brand['weight'].sum(),
+        'evidence': per_brand['token'].agg(' '.join),
+        'suggested_RXCUI': per_brand['primary_RXCUI_generic'].first(),
+    }).reset_index()
+
+def brand_only_anomalies(brands, generics):
+    """Brands in groups without any IN or PT member"""
+    flagged = brands[~brands['primary_RXCUI'].isin(generics['primary_RXCUI'])]
+    return pd.DataFrame({
+        'brand_row': flagged['brand_row'],
+        'anomaly': 'brand_only_group',
+        'score': SCORES['brand_only_group'],
+        'evidence': '',
+        'suggested_RXCUI': pd.NA,
+    })
+
+def check_consistency(df):
+    """Ranked anomaly report over every BN row of the core database"""
+    df = df.assign(normalized_name=df['normalized_name'].astype(str),
+                   preferred_term_type=df['preferred_term_type'].astype(str))
+    brands = df[df['preferred_term_type'] == 'BN'][['primary_RXCUI', 'DrugName', 'normalized_name']]
+    brands = brands.rename_axis('brand_row').reset_index()
+    generics = df[df['preferred_term_type'].isin(GENERIC_TYPES)][['primary_RXCUI', 'DrugName',
+                                                                   'normalized_name']]
+
+    anomalies = pd.concat([
+        name_anomalies(brands, generics),
+        ingredient_anomalies(brands, generics),
+        brand_only_anomalies(brands, generics),
+    ], ignore_index=True)
+
+    report = anomalies.merge(brands[['brand_row', 'primary_RXCUI', 'DrugName']], on='brand_row')
+    report['suggested_name'] = report['suggested_RXCUI'].map(group_names(generics)).fillna('')
+    report['suggested_RXCUI'] = report['suggested_RXCUI'].astype('Int64')
+    report = report.sort_values(['score', 'DrugName'], ascending=[False, True], kind='stable')
+    return report[REPORT_COLUMNS].reset_index(drop=True)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Check brand-generic unification across the whole database")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f"RxNorm core CSV file (default: {DEFAULT_DATABASE})")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                        help=f"Anomaly report CSV (default: {DEFAULT_OUTPUT})")
+    parser.add_argument('--top', type=int, default=20, help="Anomalies to print (default: 20)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    print("=== CHECKING UNIFICATION CONSISTENCY ===\n")
+
+    if not os.path.exists(args.database):
+        print(f"❌ Database file not found: {args.database}")
+        return 1
+
+    start = time.perf_counter()
+    df = load_rxnorm_compact(args.database, report=False)
+    brand_count = int((df['preferred_term_type'] == 'BN').sum())
+    print(f"✅ Loaded database: {len(df):,} entries, {brand_count:,} brands")
+
+    report = check_consistency(df)
+    elapsed = time.perf_counter() - start
+    flagged_brands = report.drop_duplicates(['primary_RXCUI', 'DrugName'])
+    print(f"Checked {brand_count:,} brands in {elapsed:.2f}s: "
+          f"{len(flagged_brands):,} flagged ({len(report):,} anomalies)")
+    for anomaly, count in report['anomaly'].value_counts().items():
+        print(f"  {anomaly}: {count:,}")
+
+    if len(report):
+        print(f"\n=== TOP {min(args.top, len(report))} ANOMALIES ===")
+        for row in report.head(args.top).itertuples(index=False):
+            suggestion = (f" -> {row.suggested_name} (RXCUI: {row.suggested_RXCUI})"
+                          if row.suggested_name else '')
+            evidence = f" [{row.evidence}]" if row.evidence else ''
+            print(f"  {row.score:5.2f} {row.anomaly:22} {row.DrugName} (RXCUI: {row.primary_RXCUI})"
+                  f"{evidence}{suggestion}")
+
+    report.to_csv(args.output, index=False)
+    print(f"\nSaved anomaly report to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,25 @@ Enhanced treatment annotation with better parenthetical brand name handling
 """
 
 import pandas as pd
+import argparse
 import re
 import os
 
+from alias_matcher import DRUG_ALIASES
+from csv_offset_index import open_offset_index
+from database_loader import load_rxnorm_compact
+from layered_index import CONSOLIDATED, CORE, CORE_CLEAN, LayeredIndex
+from result_writer import ResultWriter, add_output_arguments, output_path
+from run_profiler import RunProfiler, add_profile_arguments
+from treatment_tokenizer import CORE_DRUG_TOKENIZER
+
+# Low-cardinality output columns stored as dictionaries in parquet/arrow output
+DICTIONARY_COLUMNS = ['consolidated_sources', 'consolidated_term_type', 'core_sources', 'core_term_type',
+                      'recommended_approach']
+
+# Non-text output columns, typed up front so parquet/arrow schemas do not depend on the first batch
+COLUMN_TYPES = {'consolidated_match': 'bool', 'core_match': 'bool'}
+
 def normalize_name(name):
     """Normalize drug/treatment names for matching"""
     if pd.isna(name):
@@ -42,57 +58,55 @@ def extract_names_from_parentheses(treatment_name):
     if core_drug_name and core_drug_name != normalized:
         names_to_try.append(core_drug_name)
     
+    # Then the expansion of an alias leading the name
+    alias_name = extract_alias_name(main_name)
+    if alias_name and alias_name != normalized:
+        names_to_try.append(alias_name)
+    
     return list(dict.fromkeys(names_to_try))  # Remove duplicates while preserving order
 
 def extract_core_drug_name(treatment_name):
     """Extract core drug name from complex treatment descriptions"""
     normalized = normalize_name(treatment_name)
     
-    # Special mappings first
-    mappings = {
-        'low dose naltrexone': 'naltrexone',
-        'ldn': 'naltrexone', 
-        'n acetyl cysteine': 'acetylcysteine',
-        'nac': 'acetylcysteine',
-        'coq10': 'coenzyme q10',
-        'd ribose': 'ribose',
-        'nad+': 'nicotinamide adenine dinucleotide',
-        'omega 3': 'omega-3 fatty acids',
-        'fish oil': 'omega-3 fatty acids',
-        'b complex': 'vitamin b complex',
-        'b12': 'cyanocobalamin',
-        'vitamin b12': 'cyanocobalamin',
-        'vitamin d3': 'cholecalciferol',
-        'vitamin d': 'vitamin d',
-        'vitamin c': 'vitamin c',
-        'magnesium glycinate': 'magnesium',
-        'magnesium citrate': 'magnesium',
-        'iron bisglycinate': 'iron',
-        'ferrous sulfate': 'iron',
-        'ivig': 'immunoglobulin',
-        'intravenous immunoglobulin': 'immunoglobulin',
-    }
-    
-    if normalized in mappings:
-        return mappings[normalized]
-    
-    # Pattern cleaning
-    patterns = [
-        (r'\b(low\s+dose|high\s+dose|extended\s+release|immediate\s+release)\s+', ''),
-        (r'\b(oral|iv|intravenous|topical|nasal|sublingual)\s+', ''),
-        (r'\b(tablet|capsule|injection|spray|cream|gel|solution)\s*', ''),
-        (r'\b\d+\s*(mg|mcg|ml|units?)\b', ''),
-        (r'\b(twice\s+daily|once\s+daily|bid|tid|qid|prn)\b', ''),
-    ]
+    # Names that are an abbreviation or common phrase (data/drug_aliases.json)
+    alias = DRUG_ALIASES.get(normalized)
+    if alias is not None:
+        return alias
     
-    result = normalized
-    for pattern, replacement in patterns:
-        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
-    
-    result = re.sub(r'\s+', ' ', result).strip()
-    return result
+    # Strip dose, route, form and frequency details in one scan
+    return CORE_DRUG_TOKENIZER.core_name(normalized)
+
+def extract_alias_name(treatment_name):
+    """Expansion of an alias that starts the name or is its whole core name, or ''"""
+    normalized = normalize_name(treatment_name)
+    return DRUG_ALIASES.leading_expansion(normalized, CORE_DRUG_TOKENIZER.core_name(normalized)) or ''
+
+def add_match(result, prefix, record, search_term):
+    """Fill the prefix_* match columns of a result from an index record"""
+    result[f'{prefix}_match'] = True
+    result[f'{prefix}_RXCUI'] = record['RXCUI']
+    result[f'{prefix}_drug_name'] = record['name']
+    result[f'{prefix}_sources'] = record['sources']
+    result[f'{prefix}_term_type'] = record['term_type']
+    result[f'{prefix}_matched_term'] = search_term
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Annotate treatments against consolidated and core RxNorm")
+    parser.add_argument('treatment_file', nargs='?',
+                        help="Treatment CSV file (default: examples/sample_treatments.csv)")
+    parser.add_argument('--load-consolidated', action='store_true',
+                        help="Load the whole consolidated file into memory instead of reading matching "
+                             "rows on demand through its offset index (see csv_offset_index.py)")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 def main():
+    args = parse_args()
+    profiler = RunProfiler.from_args('create_enhanced_annotation.py', args)
+    
     # Get the script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     repo_root = os.path.dirname(script_dir)
@@ -104,7 +118,8 @@ def main():
     consolidated_file = os.path.join(repo_root, "rxnorm_clinical_consolidated.csv")
     core_file = os.path.join(repo_root, "data", "rxnorm_core_medications.csv")
     treatment_file = os.path.join(repo_root, "examples", "sample_treatments.csv")
-    output_file = os.path.join(repo_root, "treatment_dictionary_enhanced_annotated.csv")
+    output_file = output_path(os.path.join(repo_root, "treatment_dictionary_enhanced_annotated.csv"),
+                              args.output_format)
     
     # Check if consolidated file exists
     if not os.path.exists(consolidated_file):
@@ -116,58 +131,45 @@ def main():
         use_consolidated = True
     
     # Check for custom treatment file
-    import sys
-    if len(sys.argv) > 1:
-        treatment_file = sys.argv[1]
+    if args.treatment_file:
+        treatment_file = args.treatment_file
         print(f"Using custom treatment file: {treatment_file}")
     
     print("Loading data...")
     
     # Load consolidated RxNorm if available
-    consolidated_lookup = {}
-    if use_consolidated:
-        print("Creating consolidated RxNorm lookup...")
+    layers = {}
+    consolidated_offsets = None
+    if use_consolidated and not args.load_consolidated:
+        # Rows are read on demand, so the consolidated layer costs almost nothing to open
+        print("Opening consolidated RxNorm offset index...")
+        profiler.begin('open_offset_index')
+        consolidated_offsets = open_offset_index(consolidated_file)
+        print(f"Mapped {len(consolidated_offsets)} consolidated names "
+              f"({consolidated_offsets.load_seconds * 1000:.1f} ms)")
+    elif use_consolidated:
+        print("Loading consolidated RxNorm...")
+        profiler.begin('load_consolidated')
         consolidated_df = pd.read_csv(consolidated_file, 
                                       usecols=['normalized_name', 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type'])
-        for _, row in consolidated_df.iterrows():
-            key = row['normalized_name']
-            if key not in consolidated_lookup:
-                consolidated_lookup[key] = {
-                    'RXCUI': row['primary_RXCUI'],
-                    'name': row['DrugName'], 
-                    'sources': row['sources'],
-                    'term_type': row['preferred_term_type']
-                }
+        layers[CONSOLIDATED] = (consolidated_df, 'normalized_name')
     
     # Load core medications
-    print("Creating core medications lookup...")
-    core_df = pd.read_csv(core_file,
-                          usecols=['normalized_name', 'clean_name', 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type'])
-    core_lookup = {}
-    core_clean_lookup = {}
-    for _, row in core_df.iterrows():
-        # Normalized name lookup
-        key = row['normalized_name']
-        if key not in core_lookup:
-            core_lookup[key] = {
-                'RXCUI': row['primary_RXCUI'],
-                'name': row['DrugName'],
-                'sources': row['sources'],
-                'term_type': row['preferred_term_type']
-            }
-        
-        # Clean name lookup
-        clean_key = row['clean_name']
-        if clean_key not in core_clean_lookup:
-            core_clean_lookup[clean_key] = {
-                'RXCUI': row['primary_RXCUI'],
-                'name': row['DrugName'],
-                'sources': row['sources'],
-                'term_type': row['preferred_term_type']
-            }
+    print("Loading core medications...")
+    profiler.begin('load_core')
+    core_df = load_rxnorm_compact(core_file)
+    layers[CORE] = (core_df, 'normalized_name')
+    layers[CORE_CLEAN] = (core_df, 'clean_name')
+    
+    # One index over every layer; shared names and records are stored once
+    print("Creating layered lookup...")
+    profiler.begin('build_index')
+    index = LayeredIndex(layers)
+    print(f"Indexed {len(index)} names with {index.record_count} distinct records")
     
     # Load treatment names
     print(f"Loading treatment names from {treatment_file}...")
+    profiler.begin('read_input')
     try:
         # Try reading as CSV first
         treatment_df = pd.read_csv(treatment_file)
@@ -190,90 +192,79 @@ def main():
     print(f"Processing {len(unique_treatments)} unique treatments...")
     
     # Process treatments
+    profiler.begin('annotate', rows=len(unique_treatments))
     results = []
-    
-    for i, treatment_name in enumerate(unique_treatments):
-        if i % 50 == 0:
-            print(f"  Processing {i}/{len(unique_treatments)}...")
-        
-        # Get all possible names to try
-        names_to_try = extract_names_from_parentheses(treatment_name)
-        
-        result = {
-            'Treatment Name': treatment_name,
-            'names_tried': '|'.join(names_to_try),
-            'consolidated_match': False,
-            'consolidated_RXCUI': '',
-            'consolidated_drug_name': '',
-            'consolidated_sources': '',
-            'consolidated_term_type': '',
-            'consolidated_matched_term': '',
-            'core_match': False,
-            'core_RXCUI': '',
-            'core_drug_name': '',
-            'core_sources': '',
-            'core_term_type': '',
-            'core_matched_term': '',
-            'recommended_approach': '',
-            'recommended_RXCUI': '',
-            'recommended_drug_name': ''
-        }
-        
-        # Try each possible name in consolidated database
-        if use_consolidated:
+    with ResultWriter(output_file, args.output_format, DICTIONARY_COLUMNS, args.batch_size, COLUMN_TYPES) as writer:
+        for i, treatment_name in enumerate(unique_treatments):
+            if i % 50 == 0:
+                print(f"  Processing {i}/{len(unique_treatments)}...")
+            
+            # Get all possible names to try
+            names_to_try = extract_names_from_parentheses(treatment_name)
+            
+            result = {
+                'Treatment Name': treatment_name,
+                'names_tried': '|'.join(names_to_try),
+                'consolidated_match': False,
+                'consolidated_RXCUI': '',
+                'consolidated_drug_name': '',
+                'consolidated_sources': '',
+                'consolidated_term_type': '',
+                'consolidated_matched_term': '',
+                'core_match': False,
+                'core_RXCUI': '',
+                'core_drug_name': '',
+                'core_sources': '',
+                'core_term_type': '',
+                'core_matched_term': '',
+                'recommended_approach': '',
+                'recommended_RXCUI': '',
+                'recommended_drug_name': ''
+            }
+            
+            # Probe each possible name once; the first name hitting a layer wins it
             for search_term in names_to_try:
-                if search_term in consolidated_lookup:
-                    match = consolidated_lookup[search_term]
-                    result['consolidated_match'] = True
-                    result['consolidated_RXCUI'] = match['RXCUI']
-                    result['consolidated_drug_name'] = match['name']
-                    result['consolidated_sources'] = match['sources']
-                    result['consolidated_term_type'] = match['term_type']
-                    result['consolidated_matched_term'] = search_term
-                    break  # Use first match found
+                hits = index.get(search_term)
+                
+                if use_consolidated and not result['consolidated_match']:
+                    if consolidated_offsets is not None:
+                        record = consolidated_offsets.get(search_term)
+                    else:
+                        record = index.first_record([(hits, CONSOLIDATED)])
+                    if record is not None:
+                        add_match(result, 'consolidated', record, search_term)
+                
+                if not result['core_match']:
+                    record = index.first_record([(hits, CORE), (hits, CORE_CLEAN)])
+                    if record is not None:
+                        add_match(result, 'core', record, search_term)
+                
+                if result['core_match'] and (result['consolidated_match'] or not use_consolidated):
+                    break
+            
+            # Determine recommendation
+            if result['consolidated_match'] and result['core_match']:
+                result['recommended_approach'] = 'consolidated'
+                result['recommended_RXCUI'] = result['consolidated_RXCUI']
+                result['recommended_drug_name'] = result['consolidated_drug_name']
+            elif result['consolidated_match']:
+                result['recommended_approach'] = 'consolidated'
+                result['recommended_RXCUI'] = result['consolidated_RXCUI']
+                result['recommended_drug_name'] = result['consolidated_drug_name']
+            elif result['core_match']:
+                result['recommended_approach'] = 'core'
+                result['recommended_RXCUI'] = result['core_RXCUI']
+                result['recommended_drug_name'] = result['core_drug_name']
+            else:
+                result['recommended_approach'] = 'none'
+            
+            results.append(result)
+            writer.write(result)
         
-        # Try each possible name in core database
-        for search_term in names_to_try:
-            if search_term in core_lookup:
-                match = core_lookup[search_term]
-                result['core_match'] = True
-                result['core_RXCUI'] = match['RXCUI']
-                result['core_drug_name'] = match['name']
-                result['core_sources'] = match['sources']
-                result['core_term_type'] = match['term_type']
-                result['core_matched_term'] = search_term
-                break
-            elif search_term in core_clean_lookup:
-                match = core_clean_lookup[search_term]
-                result['core_match'] = True
-                result['core_RXCUI'] = match['RXCUI']
-                result['core_drug_name'] = match['name']
-                result['core_sources'] = match['sources']
-                result['core_term_type'] = match['term_type']
-                result['core_matched_term'] = search_term
-                break
-        
-        # Determine recommendation
-        if result['consolidated_match'] and result['core_match']:
-            result['recommended_approach'] = 'consolidated'
-            result['recommended_RXCUI'] = result['consolidated_RXCUI']
-            result['recommended_drug_name'] = result['consolidated_drug_name']
-        elif result['consolidated_match']:
-            result['recommended_approach'] = 'consolidated'
-            result['recommended_RXCUI'] = result['consolidated_RXCUI']
-            result['recommended_drug_name'] = result['consolidated_drug_name']
-        elif result['core_match']:
-            result['recommended_approach'] = 'core'
-            result['recommended_RXCUI'] = result['core_RXCUI']
-            result['recommended_drug_name'] = result['core_drug_name']
-        else:
-            result['recommended_approach'] = 'none'
-        
-        results.append(result)
-    
-    # Create DataFrame and save
+        # Finish the output file
+        profiler.begin('write_output', rows=len(results))
     results_df = pd.DataFrame(results)
-    results_df.to_csv(output_file, index=False)
+    profiler.end()
     
     # Print summary
     total = len(results_df)
@@ -305,6 +296,7 @@ def main():
             print(f"  {row['Treatment Name']} -> {row['recommended_drug_name']} (matched: {row['consolidated_matched_term'] or row['core_matched_term']})")
     
     print(f"\nResults saved to: {output_file}")
+    profiler.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,8 +5,11 @@ but excludes dose-specific variations
 """
 
 import pandas as pd
+import argparse
 import re
 
+from run_profiler import RunProfiler, add_profile_arguments
+
 def is_dose_specific(drug_name):
     """Check if a drug name contains dose-specific information"""
     # Patterns that indicate dose-specific entries
@@ -65,12 +68,23 @@ def should_include_entry(row):
     # Exclude other term types
     return False
 
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Create the enhanced core medications file")
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
+    profiler = RunProfiler.from_args('create_enhanced_core_medications.py', args)
+    
     print("Creating enhanced core medications file...")
     
     # Load the consolidated file
     print("Loading consolidated RxNorm data...")
+    profiler.begin('load_consolidated')
     df = pd.read_csv('rxnorm_clinical_consolidated.csv')
+    profiler.set_rows(len(df))
     print(f"Loaded {len(df)} total entries")
     
     # Filter entries
@@ -78,6 +92,7 @@ def main():
     print(f"Original consolidated: {len(df)} entries")
     
     # Apply filtering
+    profiler.begin('filter', rows=len(df))
     mask = df.apply(should_include_entry, axis=1)
     enhanced_df = df[mask].copy()
     
@@ -90,6 +105,7 @@ def main():
         print(f"  {term_type}: {count}")
     
     # Sort by priority (ingredients first, then brand names, then others)
+    profiler.begin('sort', rows=len(enhanced_df))
     term_type_priority = {'IN': 1, 'BN': 2, 'PT': 3, 'SY': 4, 'PIN': 5}
     enhanced_df['type_priority'] = enhanced_df['preferred_term_type'].map(
         lambda x: term_type_priority.get(x, 99)
@@ -99,7 +115,9 @@ def main():
     
     # Save the enhanced core file
     output_file = 'rxnorm_enhanced_core_medications.csv'
+    profiler.begin('write_output', rows=len(enhanced_df))
     enhanced_df.to_csv(output_file, index=False)
+    profiler.end()
     print(f"\nSaved enhanced core medications to {output_file}")
     
     # Show examples of what we kept
@@ -126,6 +144,8 @@ def main():
         if len(matches) > 0:
             for _, match in matches.head(2).iterrows():
                 print(f"    - {match['DrugName']} ({match['preferred_term_type']})")
+    
+    profiler.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,9 +4,25 @@ Optimized comprehensive treatment annotation with faster matching
 """
 
 import pandas as pd
+import argparse
 import re
 from difflib import SequenceMatcher
 
+from alias_matcher import DRUG_ALIASES
+from csv_offset_index import open_offset_index
+from database_loader import load_rxnorm_compact
+from layered_index import CONSOLIDATED, CORE, CORE_CLEAN, LayeredIndex
+from result_writer import ResultWriter, add_output_arguments, output_path
+from run_profiler import RunProfiler, add_profile_arguments
+from treatment_tokenizer import CORE_DRUG_TOKENIZER
+
+# Low-cardinality output columns stored as dictionaries in parquet/arrow output
+DICTIONARY_COLUMNS = ['consolidated_sources', 'consolidated_term_type', 'core_sources', 'core_term_type',
+                      'recommended_approach']
+
+# Non-text output columns, typed up front so parquet/arrow schemas do not depend on the first batch
+COLUMN_TYPES = {'consolidated_match': 'bool', 'core_match': 'bool'}
+
 def normalize_name(name):
     """Normalize drug/treatment names for matching"""
     if pd.isna(name):
@@ -20,96 +36,76 @@ def extract_core_drug_name(treatment_name):
     """Extract core drug name from complex treatment descriptions"""
     normalized = normalize_name(treatment_name)
     
-    # Special mappings first
-    mappings = {
-        'low dose naltrexone': 'naltrexone',
-        'ldn': 'naltrexone', 
-        'n acetyl cysteine': 'acetylcysteine',
-        'nac': 'acetylcysteine',
-        'coq10': 'coenzyme q10',
-        'd ribose': 'ribose',
-        'nad+': 'nicotinamide adenine dinucleotide',
-        'omega 3': 'omega-3 fatty acids',
-        'fish oil': 'omega-3 fatty acids',
-        'b complex': 'vitamin b complex',
-        'b12': 'cyanocobalamin',
-        'vitamin b12': 'cyanocobalamin',
-        'vitamin d3': 'cholecalciferol',
-        'vitamin d': 'vitamin d',
-        'vitamin c': 'vitamin c',
-        'magnesium glycinate': 'magnesium',
-        'magnesium citrate': 'magnesium',
-        'iron bisglycinate': 'iron',
-        'ferrous sulfate': 'iron',
-    }
-    
-    if normalized in mappings:
-        return mappings[normalized]
-    
-    # Pattern cleaning
-    patterns = [
-        (r'\b(low\s+dose|high\s+dose|extended\s+release|immediate\s+release)\s+', ''),
-        (r'\b(oral|iv|intravenous|topical|nasal|sublingual)\s+', ''),
-        (r'\b(tablet|capsule|injection|spray|cream|gel|solution)\s*', ''),
-        (r'^(.+?)\s*\([^)]+\).*$', r'\1'),
-        (r'\b\d+\s*(mg|mcg|ml|units?)\b', ''),
-        (r'\b(twice\s+daily|once\s+daily|bid|tid|qid|prn)\b', ''),
-    ]
-    
-    result = normalized
-    for pattern, replacement in patterns:
-        result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
-    
-    result = re.sub(r'\s+', ' ', result).strip()
-    return result
+    # Names that are an abbreviation or common phrase (data/drug_aliases.json)
+    alias = DRUG_ALIASES.get(normalized)
+    if alias is not None:
+        return alias
+    
+    # Strip dose, route, form and frequency details in one scan
+    return CORE_DRUG_TOKENIZER.core_name(normalized)
+
+def extract_alias_name(treatment_name):
+    """Expansion of an alias that starts the name or is its whole core name, or ''"""
+    normalized = normalize_name(treatment_name)
+    return DRUG_ALIASES.leading_expansion(normalized, CORE_DRUG_TOKENIZER.core_name(normalized)) or ''
+
+def add_match(result, prefix, record):
+    """Fill the prefix_* match columns of a result from an index record"""
+    result[f'{prefix}_match'] = True
+    result[f'{prefix}_RXCUI'] = record['RXCUI']
+    result[f'{prefix}_drug_name'] = record['name']
+    result[f'{prefix}_sources'] = record['sources']
+    result[f'{prefix}_term_type'] = record['term_type']
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Annotate treatments against consolidated and core RxNorm")
+    parser.add_argument('--load-consolidated', action='store_true',
+                        help="Load the whole consolidated file into memory instead of reading matching "
+                             "rows on demand through its offset index (see csv_offset_index.py)")
+    add_output_arguments(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
 
 def main():
-    print("Loading data...")
+    args = parse_args()
+    profiler = RunProfiler.from_args('create_optimized_annotation.py', args)
     
-    # Load consolidated RxNorm with specific columns and create lookup
-    print("Creating consolidated RxNorm lookup...")
-    consolidated_df = pd.read_csv("rxnorm_clinical_consolidated.csv", 
-                                  usecols=['normalized_name', 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type'])
-    consolidated_lookup = {}
-    for _, row in consolidated_df.iterrows():
-        key = row['normalized_name']
-        if key not in consolidated_lookup:
-            consolidated_lookup[key] = {
-                'RXCUI': row['primary_RXCUI'],
-                'name': row['DrugName'], 
-                'sources': row['sources'],
-                'term_type': row['preferred_term_type']
-            }
+    print("Loading data...")
     
-    # Load core medications with specific columns and create lookup
-    print("Creating core medications lookup...")
-    core_df = pd.read_csv("rxnorm_core_medications.csv",
-                          usecols=['normalized_name', 'clean_name', 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type'])
-    core_lookup = {}
-    core_clean_lookup = {}
-    for _, row in core_df.iterrows():
-        # Normalized name lookup
-        key = row['normalized_name']
-        if key not in core_lookup:
-            core_lookup[key] = {
-                'RXCUI': row['primary_RXCUI'],
-                'name': row['DrugName'],
-                'sources': row['sources'],
-                'term_type': row['preferred_term_type']
-            }
-        
-        # Clean name lookup
-        clean_key = row['clean_name']
-        if clean_key not in core_clean_lookup:
-            core_clean_lookup[clean_key] = {
-                'RXCUI': row['primary_RXCUI'],
-                'name': row['DrugName'],
-                'sources': row['sources'],
-                'term_type': row['preferred_term_type']
-            }
+    layers = {}
+    consolidated_offsets = None
+    if args.load_consolidated:
+        # Load consolidated RxNorm with specific columns
+        print("Loading consolidated RxNorm...")
+        profiler.begin('load_consolidated')
+        consolidated_df = pd.read_csv("rxnorm_clinical_consolidated.csv", 
+                                      usecols=['normalized_name', 'primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type'])
+        layers[CONSOLIDATED] = (consolidated_df, 'normalized_name')
+    else:
+        # Read consolidated rows on demand through the offset index
+        print("Opening consolidated RxNorm offset index...")
+        profiler.begin('open_offset_index')
+        consolidated_offsets = open_offset_index("rxnorm_clinical_consolidated.csv")
+        print(f"Mapped {len(consolidated_offsets)} consolidated names "
+              f"({consolidated_offsets.load_seconds * 1000:.1f} ms)")
+    
+    # Load core medications with specific columns
+    print("Loading core medications...")
+    profiler.begin('load_core')
+    core_df = load_rxnorm_compact("rxnorm_core_medications.csv")
+    
+    # One index over every layer; shared names and records are stored once
+    print("Creating layered lookup...")
+    profiler.begin('build_index')
+    layers[CORE] = (core_df, 'normalized_name')
+    layers[CORE_CLEAN] = (core_df, 'clean_name')
+    index = LayeredIndex(layers)
+    print(f"Indexed {len(index)} names with {index.record_count} distinct records")
     
     # Load treatment names
     print("Loading treatment names...")
+    profiler.begin('read_input')
     with open("treatment_dictionary_analysis_clean.csv", 'r') as f:
         lines = f.readlines()
     
@@ -127,102 +123,87 @@ def main():
     print(f"Processing {len(unique_treatments)} unique treatments...")
     
     # Process treatments
+    profiler.begin('annotate', rows=len(unique_treatments))
+    output_file = output_path("treatment_dictionary_optimized_annotated.csv", args.output_format)
     results = []
-    
-    for i, treatment_name in enumerate(unique_treatments):
-        if i % 50 == 0:
-            print(f"  Processing {i}/{len(unique_treatments)}...")
-        
-        normalized_treatment = normalize_name(treatment_name)
-        core_drug_name = extract_core_drug_name(treatment_name)
-        
-        result = {
-            'Treatment Name': treatment_name,
-            'normalized_name': normalized_treatment,
-            'core_drug_name': core_drug_name,
-            'consolidated_match': False,
-            'consolidated_RXCUI': '',
-            'consolidated_drug_name': '',
-            'consolidated_sources': '',
-            'consolidated_term_type': '',
-            'core_match': False,
-            'core_RXCUI': '',
-            'core_drug_name': '',
-            'core_sources': '',
-            'core_term_type': '',
-            'recommended_approach': '',
-            'recommended_RXCUI': '',
-            'recommended_drug_name': ''
-        }
-        
-        # Check consolidated matches
-        if normalized_treatment in consolidated_lookup:
-            match = consolidated_lookup[normalized_treatment]
-            result['consolidated_match'] = True
-            result['consolidated_RXCUI'] = match['RXCUI']
-            result['consolidated_drug_name'] = match['name']
-            result['consolidated_sources'] = match['sources']
-            result['consolidated_term_type'] = match['term_type']
-        elif core_drug_name != normalized_treatment and core_drug_name in consolidated_lookup:
-            match = consolidated_lookup[core_drug_name]
-            result['consolidated_match'] = True
-            result['consolidated_RXCUI'] = match['RXCUI']
-            result['consolidated_drug_name'] = match['name']
-            result['consolidated_sources'] = match['sources']
-            result['consolidated_term_type'] = match['term_type']
-        
-        # Check core matches
-        if normalized_treatment in core_lookup:
-            match = core_lookup[normalized_treatment]
-            result['core_match'] = True
-            result['core_RXCUI'] = match['RXCUI']
-            result['core_drug_name'] = match['name']
-            result['core_sources'] = match['sources']
-            result['core_term_type'] = match['term_type']
-        elif core_drug_name != normalized_treatment and core_drug_name in core_lookup:
-            match = core_lookup[core_drug_name]
-            result['core_match'] = True
-            result['core_RXCUI'] = match['RXCUI']
-            result['core_drug_name'] = match['name']
-            result['core_sources'] = match['sources']
-            result['core_term_type'] = match['term_type']
-        elif normalized_treatment in core_clean_lookup:
-            match = core_clean_lookup[normalized_treatment]
-            result['core_match'] = True
-            result['core_RXCUI'] = match['RXCUI']
-            result['core_drug_name'] = match['name']
-            result['core_sources'] = match['sources']
-            result['core_term_type'] = match['term_type']
-        elif core_drug_name != normalized_treatment and core_drug_name in core_clean_lookup:
-            match = core_clean_lookup[core_drug_name]
-            result['core_match'] = True
-            result['core_RXCUI'] = match['RXCUI']
-            result['core_drug_name'] = match['name']
-            result['core_sources'] = match['sources']
-            result['core_term_type'] = match['term_type']
-        
-        # Determine recommendation
-        if result['consolidated_match'] and result['core_match']:
-            result['recommended_approach'] = 'consolidated'
-            result['recommended_RXCUI'] = result['consolidated_RXCUI']
-            result['recommended_drug_name'] = result['consolidated_drug_name']
-        elif result['consolidated_match']:
-            result['recommended_approach'] = 'consolidated'
-            result['recommended_RXCUI'] = result['consolidated_RXCUI']
-            result['recommended_drug_name'] = result['consolidated_drug_name']
-        elif result['core_match']:
-            result['recommended_approach'] = 'core'
-            result['recommended_RXCUI'] = result['core_RXCUI']
-            result['recommended_drug_name'] = result['core_drug_name']
-        else:
-            result['recommended_approach'] = 'none'
+    with ResultWriter(output_file, args.output_format, DICTIONARY_COLUMNS, args.batch_size, COLUMN_TYPES) as writer:
+        for i, treatment_name in enumerate(unique_treatments):
+            if i % 50 == 0:
+                print(f"  Processing {i}/{len(unique_treatments)}...")
+            
+            normalized_treatment = normalize_name(treatment_name)
+            core_drug_name = extract_core_drug_name(treatment_name)
+            alias_name = extract_alias_name(treatment_name)
+            
+            result = {
+                'Treatment Name': treatment_name,
+                'normalized_name': normalized_treatment,
+                'core_drug_name': core_drug_name,
+                'consolidated_match': False,
+                'consolidated_RXCUI': '',
+                'consolidated_drug_name': '',
+                'consolidated_sources': '',
+                'consolidated_term_type': '',
+                'core_match': False,
+                'core_RXCUI': '',
+                'core_drug_name': '',
+                'core_sources': '',
+                'core_term_type': '',
+                'recommended_approach': '',
+                'recommended_RXCUI': '',
+                'recommended_drug_name': ''
+            }
+            
+            # One probe per name covers every layer
+            normalized_hits = index.get(normalized_treatment)
+            core_hits = index.get(core_drug_name) if core_drug_name != normalized_treatment else None
+            # An alias expansion is only tried after the core drug name
+            alias_hits = (index.get(alias_name) if alias_name and alias_name not in (normalized_treatment, core_drug_name)
+                          else None)
+            
+            # Check consolidated matches
+            if consolidated_offsets is not None:
+                record = consolidated_offsets.get(normalized_treatment)
+                if record is None and core_drug_name != normalized_treatment:
+                    record = consolidated_offsets.get(core_drug_name)
+                if record is None and alias_name and alias_name not in (normalized_treatment, core_drug_name):
+                    record = consolidated_offsets.get(alias_name)
+            else:
+                record = index.first_record([(normalized_hits, CONSOLIDATED), (core_hits, CONSOLIDATED),
+                                             (alias_hits, CONSOLIDATED)])
+            if record is not None:
+                add_match(result, 'consolidated', record)
+            
+            # Check core matches
+            record = index.first_record([(normalized_hits, CORE), (core_hits, CORE),
+                                         (normalized_hits, CORE_CLEAN), (core_hits, CORE_CLEAN),
+                                         (alias_hits, CORE), (alias_hits, CORE_CLEAN)])
+            if record is not None:
+                add_match(result, 'core', record)
+            
+            # Determine recommendation
+            if result['consolidated_match'] and result['core_match']:
+                result['recommended_approach'] = 'consolidated'
+                result['recommended_RXCUI'] = result['consolidated_RXCUI']
+                result['recommended_drug_name'] = result['consolidated_drug_name']
+            elif result['consolidated_match']:
+                result['recommended_approach'] = 'consolidated'
+                result['recommended_RXCUI'] = result['consolidated_RXCUI']
+                result['recommended_drug_name'] = result['consolidated_drug_name']
+            elif result['core_match']:
+                result['recommended_approach'] = 'core'
+                result['recommended_RXCUI'] = result['core_RXCUI']
+                result['recommended_drug_name'] = result['core_drug_name']
+            else:
+                result['recommended_approach'] = 'none'
+            
+            results.append(result)
+            writer.write(result)
         
-        results.append(result)
-    
-    # Create DataFrame and save
+        # Finish the output file
+        profiler.begin('write_output', rows=len(results))
     results_df = pd.DataFrame(results)
-    output_file = "treatment_dictionary_optimized_annotated.csv"
-    results_df.to_csv(output_file, index=False)
+    profiler.end()
     
     # Print summary
     total = len(results_df)
@@ -247,6 +228,7 @@ def main():
         print(f"  {row['Treatment Name']} -> {row['recommended_drug_name']} (RXCUI: {row['recommended_RXCUI']}, {row['recommended_approach']})")
     
     print(f"\nResults saved to: {output_file}")
+    profiler.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,7 +6,7 @@ This script recreates the completely unified RxNorm core medications database
 from RxNorm RRF files with 100% brand-generic unification.
 
 Usage:
-    python create_unified_rxnorm_core.py
+    python create_unified_rxnorm_core.py [--sqlite PATH] [--profile] [--profile-stats FILE]
 
 Requirements:
     - RxNorm RRF files (RXNCONSO.RRF, RXNREL.RRF) in rrf/ directory
@@ -14,13 +14,20 @@ Requirements:
     
 Output:
     - rxnorm_core_medications.csv (completely unified database)
+    - optionally a SQLite index of the same table for on-disk annotation
 """
 
 import pandas as pd
+import argparse
 import re
 import sys
 import os
 
+from alias_matcher import normalize_phrase
+from run_profiler import RunProfiler, add_profile_arguments
+from sqlite_index import DEFAULT_INDEX_PATH, build_sqlite_index
+from treatment_tokenizer import CORE_DRUG_TOKENIZER
+
 def create_enhanced_core_from_rrf():
     """Create enhanced core medications database from RRF files"""
     print("=== STEP 1: CREATING ENHANCED CORE FROM RRF FILES ===\n")
@@ -225,34 +232,85 @@ def apply_comprehensive_unification(enhanced_file):
     
     return df
 
+def add_annotation_columns(df):
+    """Add the clean_name, normalized_name, sources and num_sources columns the annotators read
+
+    Rows for one RXCUI, name and term type from several sources (SABs) are
+    collapsed into one row that lists them in sources.
+    """
+    keys = ['primary_RXCUI', 'DrugName', 'preferred_term_type']
+    df = (df.groupby(keys, sort=False, dropna=False)['source']
+            .agg(sources=lambda sources: '|'.join(dict.fromkeys(sources.dropna().astype(str))),
+                 num_sources='nunique')
+            .reset_index())
+    normalized = df['DrugName'].fillna('').map(normalize_phrase)
+    df.insert(2, 'clean_name', normalized.map(CORE_DRUG_TOKENIZER.core_name))
+    df.insert(3, 'normalized_name', normalized)
+    print(f"✅ Added annotation columns for {len(df):,} distinct names")
+    return df
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Create the unified RxNorm core database from RRF files")
+    parser.add_argument('--sqlite', metavar='PATH', nargs='?', const=os.path.join('..', DEFAULT_INDEX_PATH),
+                        help="Also write a SQLite index with B-tree and FTS5 lookups "
+                             f"(default path: ../{DEFAULT_INDEX_PATH})")
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
 def main():
     """Main function to create unified RxNorm core database"""
+    args = parse_args()
+    profiler = RunProfiler.from_args('create_unified_rxnorm_core.py', args)
+    
     print("RxNorm Core Database Creation and Unification")
     print("=" * 50)
     
     # Step 1: Create enhanced core from RRF files
+    profiler.begin('enhanced_core_from_rrf')
     enhanced_file = create_enhanced_core_from_rrf()
     if not enhanced_file:
         print("❌ Failed to create enhanced core")
+        profiler.finish()
         return 1
     
     # Step 2: Apply comprehensive unification
+    profiler.begin('unification')
     unified_df = apply_comprehensive_unification(enhanced_file)
     if unified_df is None:
         print("❌ Failed to apply unification")
+        profiler.finish()
         return 1
+    unified_df = add_annotation_columns(unified_df)
+    profiler.set_rows(len(unified_df))
     
     # Step 3: Save final unified database
+    profiler.begin('write_output', rows=len(unified_df))
     output_file = '../data/rxnorm_core_medications.csv'
     unified_df.to_csv(output_file, index=False)
+    profiler.end()
     print(f"\n🎉 SUCCESS! Unified RxNorm core database saved to: {output_file}")
     
+    # Step 4: Optionally build the SQLite index for on-disk annotation
+    if args.sqlite:
+        profiler.begin('sqlite_index', rows=len(unified_df))
+        try:
+            build_sqlite_index(args.sqlite, unified_df.columns,
+                               unified_df.itertuples(index=False, name=None))
+        except ValueError as e:
+            print(f"❌ {e}")
+            profiler.finish()
+            return 1
+        profiler.end()
+        print(f"✅ SQLite index saved to: {args.sqlite}")
+    
     print(f"\nThe database now includes:")
     print(f"  • 100% brand-generic unification for major medications")
     print(f"  • Consistent RXCUIs for Tylenol=Acetaminophen, Advil=Ibuprofen, etc.")
     print(f"  • {len(unified_df):,} total medication entries")
     print(f"  • Production-ready for treatment annotation")
     
+    profiler.finish()
     return 0
 
 if __name__ == "__main__":
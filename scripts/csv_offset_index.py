@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Sidecar byte-offset index for looking up rows of a large CSV on demand
+
+rxnorm_clinical_consolidated.csv is only a second opinion for the enhanced
+annotators. Loading all of its rows into memory costs seconds and hundreds of
+MB before the first treatment is matched. build_offset_index() scans the file
+once and writes a sidecar next to it (<csv>.offsets). The sidecar maps each
+sorted key to the byte offset of the first row with that key. CsvOffsetIndex
+memory-maps the sidecar and the CSV, binary-searches the keys in place and
+parses only the rows it returns.
+
+The sidecar records the CSV's size and modification time, and
+open_offset_index() rebuilds it when the CSV changes. Cells that pandas reads
+as missing (e.g. empty or 'NaN') are treated the same way, so answers match
+a dict built with pd.read_csv, where the first row for a key wins.
+
+File layout (little-endian):
+    header      magic, CSV size, CSV mtime, key column, entry count
+    entries     sorted by key bytes: key (offset, length) in heap, row offset in CSV
+    heap        UTF-8 keys
+
+Usage:
+    python csv_offset_index.py [rxnorm_clinical_consolidated.csv] [--key normalized_name]
+"""
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+import time
+
+DEFAULT_CSV_PATH = 'rxnorm_clinical_consolidated.csv'
+DEFAULT_KEY_COLUMN = 'normalized_name'
+SUFFIX = '.offsets'
+
+MAGIC = b'RXOFF001'
+HEADER = struct.Struct('<8sQq32sI')
+ENTRY = struct.Struct('<IIQ')
+
+# Strings pd.read_csv reads as missing by default
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+}
+
+def default_index_path(csv_path):
+    """Sidecar path for a CSV file"""
+    return csv_path + SUFFIX
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _parse_row(data):
+    return next(csv.reader([data.decode('utf-8')]))
+
+def _rows(f):
+    """(byte offset, fields) for each CSV record of a binary file, quoted newlines included"""
+    offset = f.tell()
+    pending = b''
+    for line in f:
+        pending += line
+        if pending.count(b'"') % 2:
+            continue
+        yield offset, _parse_row(pending)
+        offset += len(pending)
+        pending = b''
+
+def build_offset_index(csv_path, index_path=None, key_column=DEFAULT_KEY_COLUMN):
+    """Write the sidecar for csv_path keyed on key_column, returning the number of keys
+
+    The file is written under a temporary name and renamed into place.
+    """
+    index_path = index_path or default_index_path(csv_path)
+    size, mtime = _source_stamp(csv_path)
+    offsets = {}
+    with open(csv_path, 'rb') as f:
+        header = _parse_row(f.readline())
+        if key_column not in header:
+            raise ValueError(f"Column {key_column} not found in {csv_path}")
+        column = header.index(key_column)
+        for offset, row in _rows(f):
+            if column < len(row) and row[column] not in NA_VALUES:
+                offsets.setdefault(row[column].encode('utf-8'), offset)
+
+    heap = bytearray()
+    entries = bytearray()
+    for key in sorted(offsets):
+        entries += ENTRY.pack(len(heap), len(key), offsets[key])
+        heap += key
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, size, mtime, key_column.encode('utf-8'), len(offsets)))
+        f.write(entries)
+        f.write(heap)
+    os.replace(tmp_path, index_path)
+    return len(offsets)
+
+def is_fresh(csv_path, index_path=None):
+    """Whether the sidecar exists and was built from the current CSV"""
+    index_path = index_path or default_index_path(csv_path)
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return False
+    magic, size, mtime, _, _ = HEADER.unpack(header)
+    return magic == MAGIC and (size, mtime) == _source_stamp(csv_path)
+
+class CsvOffsetIndex:
+    """Read-only exact lookup of CSV rows through a sidecar offset index
+
+    get() returns records in the shape used by the annotators' lookups: a
+    dict with RXCUI, name, sources and term_type keys.
+    """
+
+    loaded = True
+
+    def __init__(self, csv_path, index_path=None, label='RxNorm consolidated (offset index)'):
+        start = time.perf_counter()
+        self.label = label
+        self.path = csv_path
+        self.index_path = index_path or default_index_path(csv_path)
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"Offset index not found: {self.index_path}")
+
+        with open(self.index_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, _, key_column, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            self.buffer.close()
+            raise ValueError(f"Not an offset index file: {self.index_path}")
+        self.key_column = key_column.rstrip(b'\0').decode('utf-8')
+        self.heap_offset = HEADER.size + self.count * ENTRY.size
+
+        with open(csv_path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self._row_at(0)
+        self.columns = {name: position for position, name in enumerate(header)}
+        self.load_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return self.count
+
+    def _row_at(self, offset):
+        end = offset
+        while True:
+            end = self.data.find(b'\n', end)
+            end = len(self.data) if end == -1 else end + 1
+            line = self.data[offset:end]
+            if line.count(b'"') % 2 == 0 or end == len(self.data):
+                return _parse_row(line)
+
+    def row_offset(self, term):
+        """Byte offset of the first row whose key is term, or None"""
+        if not isinstance(term, str):
+            return None
+        target = term.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_length, row_offset = ENTRY.unpack_from(self.buffer, HEADER.size + mid * ENTRY.size)
+            key = self.buffer[self.heap_offset + key_offset:self.heap_offset + key_offset + key_length]
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                return row_offset
+        return None
+
+    def row(self, term):
+        """The first row whose key is term as a {column: value} dict, or None"""
+        offset = self.row_offset(term)
+        if offset is None:
+            return None
+        fields = self._row_at(offset)
+        return {name: '' if fields[position] in NA_VALUES else fields[position]
+                for name, position in self.columns.items() if position < len(fields)}
+
+    def get(self, term, default=None):
+        row = self.row(term)
+        if row is None:
+            return default
+        rxcui = row.get('primary_RXCUI', '')
+        return {
+            'RXCUI': int(rxcui) if rxcui.isdigit() else rxcui,
+            'name': row.get('DrugName', ''),
+            'sources': row.get('sources', ''),
+            'term_type': row.get('preferred_term_type', ''),
+        }
+
+    def __contains__(self, term):
+        return self.row_offset(term) is not None
+
+    def close(self):
+        self.buffer.close()
+        self.data.close()
+
+def open_offset_index(csv_path, index_path=None, key_column=DEFAULT_KEY_COLUMN):
+    """CsvOffsetIndex for csv_path, building or rebuilding its sidecar first if needed"""
+    if not is_fresh(csv_path, index_path):
+        print(f"Building offset index for {csv_path} (one-time)...")
+        start = time.perf_counter()
+        key_count = build_offset_index(csv_path, index_path, key_column)
+        print(f"Indexed {key_count:,} keys in {time.perf_counter() - start:.2f}s")
+    return CsvOffsetIndex(csv_path, index_path)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Build a sidecar byte-offset index for a CSV file")
+    parser.add_argument('csv_file', nargs='?', default=DEFAULT_CSV_PATH,
+                        help=f"CSV file to index (default: {DEFAULT_CSV_PATH})")
+    parser.add_argument('--key', default=DEFAULT_KEY_COLUMN,
+                        help=f"Column to index (default: {DEFAULT_KEY_COLUMN})")
+    parser.add_argument('--output', help="Sidecar path (default: <csv_file>.offsets)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.csv_file):
+        print(f"❌ CSV file not found: {args.csv_file}")
+        return 1
+
+    index_path = args.output or default_index_path(args.csv_file)
+    print(f"Building offset index from {args.csv_file}...")
+    start = time.perf_counter()
+    key_count = build_offset_index(args.csv_file, index_path, args.key)
+    print(f"✅ Indexed {key_count:,} {args.key} keys in {time.perf_counter() - start:.2f}s")
+    print(f"Saved offset index to: {index_path} ({os.path.getsize(index_path) / 1024 / 1024:.1f} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
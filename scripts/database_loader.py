@@ -0,0 +1,253 @@
+"""
+Shared loaders for the RxNorm core medications database
+
+The annotators only read a handful of columns from rxnorm_core_medications.csv.
+Loading it with every column as object dtype costs hundreds of MB per process,
+so load_rxnorm_compact() keeps just the annotation columns, parses RXCUIs to
+int32 and stores the low-cardinality columns as categoricals.
+
+LazyDatabase defers reading a table until the first time it is used, so a
+batch that never reaches the supplements fallback never pays for loading it.
+
+SupplementCatalogs addresses one supplements catalog per tenant (clinic). A
+catalog is loaded the first time its tenant needs it and kept in an LRU under
+a memory budget, so a process serving many clinics only holds the catalogs it
+is actively using. A catalog written with a fresh index artifact (see
+supplement_index.py) is loaded from the artifact, along with its prepared
+name lookups, instead of being parsed from CSV.
+"""
+
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from supplement_index import read_supplement_index
+
+# Columns read anywhere on the annotation path
+ANNOTATION_COLUMNS = ['primary_RXCUI', 'DrugName', 'clean_name', 'normalized_name',
+                      'preferred_term_type', 'sources']
+
+# Columns read from a supplements catalog
+SUPPLEMENT_COLUMNS = ['name', 'supplement_id', 'class']
+
+# Catalog used when no tenant is given
+DEFAULT_SUPPLEMENT_PATHS = ['data/cerbo_supplements.csv', 'cerbo_supplements.csv']
+
+# Per-tenant catalogs, e.g. data/supplements/clinic-a.csv
+TENANT_SUPPLEMENT_PATH = 'data/supplements/{tenant}.csv'
+
+DEFAULT_CATALOG_BUDGET_MB = 256
+
+# Few distinct values repeated across ~125k rows
+CATEGORICAL_COLUMNS = ['preferred_term_type', 'sources']
+
+INT32_MAX = 2 ** 31 - 1
+
+def memory_footprint(df):
+    """Deep memory usage of a DataFrame in bytes"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def deep_sizeof(obj):
+    """Approximate bytes held by nested dicts, lists and tuples, counting their contents"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+def format_bytes(num_bytes):
+    """Human readable byte count"""
+    size = float(num_bytes)
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+def compact_rxnorm_frame(df, columns=None):
+    """Drop unused columns and convert the rest to compact dtypes"""
+    columns = ANNOTATION_COLUMNS if columns is None else columns
+    df = df[[column for column in columns if column in df.columns]].copy()
+
+    if 'primary_RXCUI' in df.columns:
+        rxcuis = pd.to_numeric(df['primary_RXCUI'], errors='coerce')
+        if rxcuis.notna().all() and rxcuis.between(0, INT32_MAX).all():
+            df['primary_RXCUI'] = rxcuis.astype('int32')
+        else:
+            print("⚠️ Non-numeric RXCUIs found, keeping primary_RXCUI as text")
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+def load_rxnorm_compact(path, columns=None, report=True):
+    """Load the RxNorm core table in its compact in-memory form
+
+    Only the requested columns are read from disk. Prints the memory footprint
+    of those columns as parsed and after compaction when report is set.
+    """
+    columns = ANNOTATION_COLUMNS if columns is None else columns
+    df = pd.read_csv(path, usecols=lambda column: column in columns, low_memory=False)
+    before = memory_footprint(df) if report else 0
+
+    df = compact_rxnorm_frame(df, columns)
+
+    if report:
+        after = memory_footprint(df)
+        saved = (1 - after / before) * 100 if before else 0
+        print(f"  Memory footprint: {format_bytes(before)} -> {format_bytes(after)} ({saved:.0f}% smaller)")
+
+    return df
+
+def load_columns(path, columns):
+    """Read only the given columns of a CSV file"""
+    return pd.read_csv(path, usecols=lambda column: column in columns, low_memory=False)
+
+class LazyDatabase:
+    """A lookup table that is read from disk on first use
+
+    The table is found among candidate paths up front, but its DataFrame is only
+    loaded when .df is first accessed. load_seconds records how long that took.
+    A loader may fill prepared with lookups computed ahead of time, which the
+    matching stages use instead of building their own.
+    """
+
+    def __init__(self, label, path, name_column, id_column, type_column, loader):
+        self.label = label
+        self.path = path
+        self.name_column = name_column
+        self.id_column = id_column
+        self.type_column = type_column
+        self._loader = loader
+        self._df = None
+        self.load_seconds = None
+        self.prepared = {}
+
+    @classmethod
+    def find(cls, label, paths, name_column, id_column, type_column, loader=None):
+        """Return a LazyDatabase for the first existing path, or None"""
+        columns = [name_column, id_column, type_column]
+        loader = loader or (lambda path: load_columns(path, columns))
+        for path in paths:
+            if os.path.exists(path):
+                return cls(label, path, name_column, id_column, type_column, loader)
+        return None
+
+    @property
+    def row_count(self):
+        return len(self.df)
+
+    @property
+    def loaded(self):
+        return self._df is not None
+
+    @property
+    def df(self):
+        if self._df is None:
+            start = time.perf_counter()
+            self._df = self._loader(self.path)
+            self.load_seconds = time.perf_counter() - start
+            print(f"✅ Loaded {self.label} database: {len(self._df):,} entries ({self.load_seconds:.2f}s)")
+        return self._df
+
+    def unload(self):
+        """Drop the loaded table; the next access reads it from disk again"""
+        self._df = None
+        self.prepared = {}
+
+class SupplementCatalogs:
+    """Supplement catalogs addressed by tenant ID, kept in an LRU
+
+    get(tenant) returns a LazyDatabase for the tenant's catalog. When a
+    catalog is loaded, the least recently requested loaded catalogs are
+    unloaded until the total in-memory footprint, the DataFrame plus any
+    prepared lookups loaded with it, fits memory_budget bytes.
+    The catalog being loaded is always kept, even if it alone exceeds the
+    budget. Tenant None uses the default catalog.
+    """
+
+    def __init__(self, path_template=TENANT_SUPPLEMENT_PATH, default_paths=DEFAULT_SUPPLEMENT_PATHS,
+                 memory_budget=DEFAULT_CATALOG_BUDGET_MB * 1024 * 1024):
+        self.path_template = path_template
+        self.default_paths = default_paths
+        self.memory_budget = memory_budget
+        self.stats = {'requests': 0, 'hits': 0, 'loads': 0, 'evictions': 0, 'load_seconds': 0.0}
+        self._catalogs = OrderedDict()
+        self._footprints = {}
+
+    def paths_for(self, tenant):
+        """Candidate catalog paths for a tenant"""
+        if tenant is None:
+            return self.default_paths
+        if not re.fullmatch(r'[\w.-]+', str(tenant)) or str(tenant).startswith('.'):
+            raise ValueError(f"Invalid tenant ID: {tenant!r}")
+        return [self.path_template.format(tenant=tenant)]
+
+    def get(self, tenant=None):
+        """The tenant's catalog, or None if it has no catalog file"""
+        self.stats['requests'] += 1
+        if tenant in self._catalogs:
+            self._catalogs.move_to_end(tenant)
+            if self._catalogs[tenant].loaded:
+                self.stats['hits'] += 1
+            return self._catalogs[tenant]
+
+        label = 'supplements' if tenant is None else f'supplements ({tenant})'
+        catalog = LazyDatabase.find(
+            label, self.paths_for(tenant),
+            name_column='name',
+            id_column='supplement_id',
+            type_column='class',
+            loader=lambda path: self._load(tenant, path)
+        )
+        if catalog is not None:
+            self._catalogs[tenant] = catalog
+        return catalog
+
+    def _load(self, tenant, path):
+        start = time.perf_counter()
+        artifact = read_supplement_index(path)
+        if artifact is not None:
+            df, self._catalogs[tenant].prepared = artifact
+        else:
+            df = load_columns(path, SUPPLEMENT_COLUMNS)
+        self.stats['loads'] += 1
+        self.stats['load_seconds'] += time.perf_counter() - start
+        self._footprints[tenant] = memory_footprint(df) + deep_sizeof(self._catalogs[tenant].prepared)
+        self._catalogs.move_to_end(tenant)
+        self._evict(keep=tenant)
+        return df
+
+    def _evict(self, keep):
+        for tenant, catalog in list(self._catalogs.items()):
+            if self.bytes_in_use <= self.memory_budget:
+                break
+            if tenant == keep or not catalog.loaded:
+                continue
+            catalog.unload()
+            del self._footprints[tenant]
+            self.stats['evictions'] += 1
+            print(f"♻️ Evicted {catalog.label} catalog to stay within the memory budget")
+
+    @property
+    def bytes_in_use(self):
+        return sum(self._footprints.values())
+
+    @property
+    def loaded_tenants(self):
+        return [tenant for tenant, catalog in self._catalogs.items() if catalog.loaded]
+
+    def print_stats(self):
+        """Print catalog requests, loads, evictions and memory in use"""
+        stats = self.stats
+        print(f"\nSupplement catalogs:")
+        print(f"  requests: {stats['requests']:,}  cache hits: {stats['hits']:,}  loads: {stats['loads']:,}  "
+              f"evictions: {stats['evictions']:,}  load time: {stats['load_seconds']:.2f}s")
+        print(f"  in memory: {len(self.loaded_tenants)} catalog(s), {format_bytes(self.bytes_in_use)} "
+              f"of {format_bytes(self.memory_budget)} budget")
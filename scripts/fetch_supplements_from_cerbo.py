@@ -5,8 +5,13 @@ Fetch Supplements from Cerbo EHR API
 This script fetches all supplements from the Cerbo EHR API and saves them
 to a CSV file for use in treatment annotation.
 
+With --pipelined, records are processed, normalized and indexed as each page
+arrives. A single canonical catalog (data/cerbo_supplements.csv) is written
+with a ready-to-load index artifact next to it (see supplement_index.py), so
+the annotator skips parsing and normalizing the catalog on its next start.
+
 Usage:
-    python fetch_supplements_from_cerbo.py
+    python fetch_supplements_from_cerbo.py [--pipelined] [--metrics-file PATH]
 
 Configuration:
     Set CERBO_USERNAME and CERBO_PASSWORD environment variables
@@ -15,13 +20,30 @@ Configuration:
 
 import requests
 import pandas as pd
+import argparse
 import base64
 import os
 import time
 import json
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from dotenv import load_dotenv
 
+from run_metrics import MetricsFile, add_metrics_arguments
+from run_profiler import RunProfiler, add_profile_arguments
+from supplement_index import SupplementIndexBuilder, index_path_for
+
+# Retry transient failures (network errors, throttling, server errors)
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Canonical catalog written by --pipelined
+CANONICAL_OUTPUT = 'data/cerbo_supplements.csv'
+
+def new_fetch_stats() -> Dict:
+    """Counters describing the API traffic of a fetch"""
+    return {'requests': 0, 'pages': 0, 'bytes': 0, 'retries': 0}
+
 def get_auth_header(username: str = None, password: str = None, api_key: str = None) -> str:
     """Create auth header from username/password or API key"""
     if api_key:
@@ -40,8 +62,15 @@ def get_auth_header(username: str = None, password: str = None, api_key: str = N
         raise ValueError("Either API key or username/password must be provided")
 
 def fetch_supplements_page(auth_header: str, limit: int = 100, offset: int = 0, 
-                          active_only: bool = True) -> Dict:
-    """Fetch a single page of supplements from the API"""
+                          active_only: bool = True, stats: Optional[Dict] = None) -> Dict:
+    """Fetch a single page of supplements from the API
+
+    Network errors, throttling and server errors are retried up to MAX_RETRIES
+    times with exponential backoff. Requests, pages, bytes and retries are
+    counted in stats when given.
+    """
+    if stats is None:
+        stats = new_fetch_stats()
     
     url = "https://rthmehr.md-hq.com/api/v1/supplements"
     
@@ -59,29 +88,42 @@ def fetch_supplements_page(auth_header: str, limit: int = 100, offset: int = 0,
     if active_only:
         params["active_only"] = "true"
     
-    try:
-        print(f"Fetching supplements: offset={offset}, limit={limit}")
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+    print(f"Fetching supplements: offset={offset}, limit={limit}")
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt > 0:
+            stats['retries'] += 1
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            print(f"  Retrying in {delay:.0f}s (attempt {attempt + 1}/{MAX_RETRIES + 1})...")
+            time.sleep(delay)
+        
+        stats['requests'] += 1
+        try:
+            response = requests.get(url, headers=headers, params=params, timeout=30)
+        except requests.exceptions.RequestException as e:
+            if attempt < MAX_RETRIES:
+                continue
+            raise Exception(f"Network error: {str(e)}")
+        
+        stats['bytes'] += len(response.content)
         
         if response.status_code == 200:
+            stats['pages'] += 1
             return response.json()
         elif response.status_code == 401:
             raise Exception("Authentication failed. Please check your credentials.")
         elif response.status_code == 404:
             raise Exception("API endpoint not found. Please check the URL.")
+        elif response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+            continue
         else:
             raise Exception(f"API request failed with status {response.status_code}: {response.text}")
-            
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Network error: {str(e)}")
 
-def fetch_all_supplements(username: str = None, password: str = None, api_key: str = None, active_only: bool = True) -> List[Dict]:
-    """Fetch all supplements using pagination"""
-    
-    print("=== FETCHING SUPPLEMENTS FROM CERBO EHR ===\n")
+def iter_supplement_pages(username: str = None, password: str = None, api_key: str = None,
+                          active_only: bool = True, stats: Optional[Dict] = None) -> Iterator[List[Dict]]:
+    """Yield pages of supplements as they are fetched, following pagination"""
     
     auth_header = get_auth_header(username, password, api_key)
-    all_supplements = []
+    fetched = 0
     
     offset = 0
     limit = 100  # API maximum
@@ -92,7 +134,7 @@ def fetch_all_supplements(username: str = None, password: str = None, api_key: s
             if offset > 0:
                 time.sleep(0.5)
             
-            response_data = fetch_supplements_page(auth_header, limit, offset, active_only)
+            response_data = fetch_supplements_page(auth_header, limit, offset, active_only, stats)
             
             # Check if response has supplements data
             if 'data' in response_data:
@@ -106,58 +148,70 @@ def fetch_all_supplements(username: str = None, password: str = None, api_key: s
             if not supplements or len(supplements) == 0:
                 print("No more supplements to fetch.")
                 break
-            
-            all_supplements.extend(supplements)
-            print(f"  Fetched {len(supplements)} supplements (total: {len(all_supplements)})")
-            
-            # Check if we got fewer results than the limit (indicates last page)
-            if len(supplements) < limit:
-                print("Reached last page of results.")
-                break
-            
-            offset += limit
-            
-            # Safety check to prevent infinite loops
-            if len(all_supplements) > 10000:
-                print("⚠️ Fetched over 10,000 supplements. Stopping as safety measure.")
-                break
-                
+        
         except Exception as e:
             print(f"❌ Error fetching supplements at offset {offset}: {str(e)}")
             break
+        
+        fetched += len(supplements)
+        print(f"  Fetched {len(supplements)} supplements (total: {fetched})")
+        yield supplements
+        
+        # Check if we got fewer results than the limit (indicates last page)
+        if len(supplements) < limit:
+            print("Reached last page of results.")
+            break
+        
+        offset += limit
+        
+        # Safety check to prevent infinite loops
+        if fetched > 10000:
+            print("⚠️ Fetched over 10,000 supplements. Stopping as safety measure.")
+            break
+
+def fetch_all_supplements(username: str = None, password: str = None, api_key: str = None, active_only: bool = True,
+                          stats: Optional[Dict] = None) -> List[Dict]:
+    """Fetch all supplements using pagination"""
+    
+    print("=== FETCHING SUPPLEMENTS FROM CERBO EHR ===\n")
+    
+    all_supplements = []
+    for supplements in iter_supplement_pages(username, password, api_key, active_only, stats):
+        all_supplements.extend(supplements)
     
     print(f"\n✅ Successfully fetched {len(all_supplements)} supplements total")
     return all_supplements
 
+def process_supplement(supplement: Dict) -> Dict:
+    """Structured catalog row for one raw supplement record"""
+    # Extract key fields (adjust based on actual API response structure)
+    processed = {
+        'supplement_id': supplement.get('id', ''),
+        'name': supplement.get('name', ''),
+        'vendor_code': supplement.get('vendor_code', ''),
+        'class': supplement.get('class', ''),
+        'external_ref_id': supplement.get('external_ref_id', ''),
+        'active': supplement.get('active', True),
+        'description': supplement.get('description', ''),
+        'vendor': supplement.get('vendor', ''),
+        'dosage_form': supplement.get('dosage_form', ''),
+        'strength': supplement.get('strength', ''),
+        'unit': supplement.get('unit', ''),
+    }
+    
+    # Add any additional fields that might be present
+    for key, value in supplement.items():
+        if key not in processed:
+            processed[f'additional_{key}'] = value
+    
+    return processed
+
 def process_supplements_data(supplements: List[Dict]) -> pd.DataFrame:
     """Process raw supplement data into structured DataFrame"""
     
     print("Processing supplements data...")
     
-    processed_supplements = []
-    
-    for supplement in supplements:
-        # Extract key fields (adjust based on actual API response structure)
-        processed = {
-            'supplement_id': supplement.get('id', ''),
-            'name': supplement.get('name', ''),
-            'vendor_code': supplement.get('vendor_code', ''),
-            'class': supplement.get('class', ''),
-            'external_ref_id': supplement.get('external_ref_id', ''),
-            'active': supplement.get('active', True),
-            'description': supplement.get('description', ''),
-            'vendor': supplement.get('vendor', ''),
-            'dosage_form': supplement.get('dosage_form', ''),
-            'strength': supplement.get('strength', ''),
-            'unit': supplement.get('unit', ''),
-        }
-        
-        # Add any additional fields that might be present
-        for key, value in supplement.items():
-            if key not in processed:
-                processed[f'additional_{key}'] = value
-        
-        processed_supplements.append(processed)
+    processed_supplements = [process_supplement(supplement) for supplement in supplements]
     
     df = pd.DataFrame(processed_supplements)
     
@@ -179,7 +233,11 @@ def save_supplements_data(df: pd.DataFrame, output_file: str = 'cerbo_supplement
     df.to_csv(data_output, index=False)
     print(f"✅ Saved supplements to: {data_output}")
     
-    # Create summary statistics
+    print_supplements_summary(df)
+    return output_file
+
+def print_supplements_summary(df: pd.DataFrame):
+    """Print supplement counts by activity, class and vendor"""
     print(f"\n=== SUPPLEMENTS SUMMARY ===")
     print(f"Total supplements: {len(df):,}")
     
@@ -198,11 +256,76 @@ def save_supplements_data(df: pd.DataFrame, output_file: str = 'cerbo_supplement
         print(f"Top vendors:")
         for vendor, count in vendor_counts.head(5).items():
             print(f"  {vendor}: {count:,}")
+
+def fetch_pipelined(username: str = None, password: str = None, api_key: str = None,
+                    output_file: str = CANONICAL_OUTPUT, stats: Optional[Dict] = None) -> pd.DataFrame:
+    """Fetch, process and index supplements page by page, then write the catalog and its index
+
+    Each page is processed and indexed as soon as it arrives, so once the last
+    page is in only the writes remain. Returns the catalog DataFrame, empty if
+    nothing was fetched.
+    """
+    print("=== FETCHING SUPPLEMENTS FROM CERBO EHR (PIPELINED) ===\n")
     
-    return output_file
+    rows = []
+    builder = SupplementIndexBuilder()
+    for supplements in iter_supplement_pages(username, password, api_key, active_only=True, stats=stats):
+        for supplement in supplements:
+            processed = process_supplement(supplement)
+            rows.append(processed)
+            builder.add(processed)
+    
+    if not rows:
+        return pd.DataFrame()
+    print(f"\n✅ Successfully fetched and indexed {len(rows)} supplements total")
+    
+    # Remove completely empty columns, as the batch path does
+    df = pd.DataFrame(rows).dropna(axis=1, how='all')
+    df.to_csv(output_file, index=False)
+    print(f"✅ Saved supplements to: {output_file}")
+    index_path = builder.write(index_path_for(output_file), output_file)
+    print(f"✅ Saved supplement index to: {index_path}")
+    
+    print_supplements_summary(df)
+    return df
+
+def write_metrics(path: str, profiler: RunProfiler, stats: Dict):
+    """Write run metrics in Prometheus text format"""
+    metrics = MetricsFile('cerbo_fetch', 'fetch_supplements_from_cerbo')
+    metrics.add('success', int(stats.get('success', False)), "Whether the last fetch completed (1) or failed (0)")
+    metrics.add('supplements_saved', stats.get('supplements_saved', 0), "Supplements written to the catalog")
+    metrics.add('api_requests', stats['requests'], "API requests made, including retries")
+    metrics.add('api_pages', stats['pages'], "API pages fetched successfully")
+    metrics.add('api_bytes', stats['bytes'], "Response bytes received from the API")
+    metrics.add('api_retries', stats['retries'], "API requests retried after a transient failure")
+    metrics.add_run_metrics(profiler)
+    metrics.write(path)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Fetch supplements from the Cerbo EHR API")
+    parser.add_argument('--pipelined', action='store_true',
+                        help=f"Process and index records as pages arrive and write one catalog "
+                             f"({CANONICAL_OUTPUT}) plus its ready-to-load index")
+    add_profile_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
 
 def main():
     """Main function to fetch and process supplements"""
+    args = parse_args()
+    profiler = RunProfiler.from_args('fetch_supplements_from_cerbo.py', args)
+    stats = new_fetch_stats()
+    
+    try:
+        return run_fetch(stats, profiler, args.pipelined)
+    finally:
+        profiler.finish()
+        if args.metrics_file:
+            write_metrics(args.metrics_file, profiler, stats)
+
+def run_fetch(stats: Dict, profiler: RunProfiler, pipelined: bool = False) -> int:
+    """Fetch, process and save supplements, recording progress in stats"""
     
     print("Cerbo EHR Supplements Fetcher")
     print("=" * 40)
@@ -226,18 +349,22 @@ def main():
         return 1
     
     try:
-        # Fetch all supplements
-        supplements = fetch_all_supplements(username, password, api_key, active_only=True)
-        
-        if not supplements:
-            print("❌ No supplements were fetched")
-            return 1
-        
-        # Process into DataFrame
-        df = process_supplements_data(supplements)
-        
-        # Save to CSV
-        output_file = save_supplements_data(df)
+        if pipelined:
+            # Records are processed and indexed page by page; the writes follow the last page
+            profiler.begin('fetch_pipelined')
+            df = fetch_pipelined(username, password, api_key, stats=stats)
+            profiler.set_rows(len(df))
+            profiler.end()
+            if df.empty:
+                print("❌ No supplements were fetched")
+                return 1
+            output_file = CANONICAL_OUTPUT
+        else:
+            df, output_file = fetch_and_save(username, password, api_key, stats, profiler)
+            if df is None:
+                return 1
+        stats['supplements_saved'] = len(df)
+        stats['success'] = True
         
         print(f"\n🎉 SUCCESS!")
         print(f"   Fetched and saved {len(df):,} supplements")
@@ -250,5 +377,29 @@ def main():
         print(f"❌ Error: {str(e)}")
         return 1
 
+def fetch_and_save(username: str, password: str, api_key: str, stats: Dict, profiler: RunProfiler):
+    """Fetch every page, then process and save the catalog
+
+    Returns (DataFrame, output file), or (None, None) if nothing was fetched.
+    """
+    # Fetch all supplements
+    profiler.begin('fetch')
+    supplements = fetch_all_supplements(username, password, api_key, active_only=True, stats=stats)
+    profiler.set_rows(len(supplements))
+    
+    if not supplements:
+        print("❌ No supplements were fetched")
+        return None, None
+    
+    # Process into DataFrame
+    profiler.begin('process', rows=len(supplements))
+    df = process_supplements_data(supplements)
+    
+    # Save to CSV
+    profiler.begin('save', rows=len(df))
+    output_file = save_supplements_data(df)
+    profiler.end()
+    return df, output_file
+
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
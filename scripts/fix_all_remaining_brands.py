@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 """
 Comprehensive fix for all remaining 85 unmatched brand-generic pairs
+
+Usage:
+    python fix_all_remaining_brands.py [--profile] [--profile-stats PATH]
 """
+import argparse
+
 import pandas as pd
 
-def fix_all_remaining_brands():
+from run_profiler import RunProfiler, add_profile_arguments
+
+def fix_all_remaining_brands(profiler=None):
     """Apply comprehensive fix for all 85 remaining brand-generic pairs"""
+    if profiler is None:
+        profiler = RunProfiler('fix_all_remaining_brands.py')
     print("=== FIXING ALL REMAINING 85 BRAND-GENERIC PAIRS ===\n")
     
     # Load current data
+    profiler.begin('load')
     df = pd.read_csv('rxnorm_final_unified_core.csv', low_memory=False)
+    profiler.set_rows(len(df))
     
     # Comprehensive mappings for all 85 remaining unmatched pairs
     # Organized by therapeutic category for clarity
@@ -116,6 +127,7 @@ def fix_all_remaining_brands():
     }
     
     print(f"Applying {len(comprehensive_mappings)} comprehensive brand-generic mappings...")
+    profiler.begin('apply_mappings', rows=len(df))
     
     # Verify targets exist in dataset
     valid_rxcuis = set(df['primary_RXCUI'].astype(str))
@@ -163,8 +175,10 @@ def fix_all_remaining_brands():
     
     # Save completely unified results
     output_file = 'rxnorm_completely_unified_final.csv'
+    profiler.begin('write_output', rows=len(df))
     df.to_csv(output_file, index=False)
     print(f"Saved to: {output_file}")
+    profiler.begin('verify', rows=len(df))
     
     # Comprehensive verification - check all 85 original pairs
     print(f"\\n=== COMPREHENSIVE VERIFICATION OF ALL 85 PAIRS ===")
@@ -224,8 +238,10 @@ def fix_all_remaining_brands():
     # Update repository
     import shutil
     repo_file = 'repo_setup/data/rxnorm_core_medications.csv'
+    profiler.begin('update_repository')
     shutil.copy(output_file, repo_file)
     print(f"\\nRepository updated: {repo_file}")
+    profiler.end()
     
     # Final statistics
     rxcui_counts = df['primary_RXCUI'].value_counts()
@@ -240,11 +256,20 @@ def fix_all_remaining_brands():
     
     return mappings_applied, unified_count, len(known_pairs)
 
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Map the remaining unmatched brands to their generics")
+    add_profile_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    mappings_applied, unified_pairs, total_pairs = fix_all_remaining_brands()
+    args = parse_args()
+    profiler = RunProfiler.from_args('fix_all_remaining_brands.py', args)
+    mappings_applied, unified_pairs, total_pairs = fix_all_remaining_brands(profiler)
     
     print(f"\\n🎉 COMPREHENSIVE BRAND-GENERIC UNIFICATION COMPLETE!")
     print(f"   {mappings_applied} additional brand-generic mappings applied")
     print(f"   {unified_pairs}/{total_pairs} major brand-generic pairs now unified")
     print(f"   Success rate: {(unified_pairs/total_pairs*100):.1f}%")
-    print(f"   All major medications now have consistent brand-generic identification!")
\ No newline at end of file
+    print(f"   All major medications now have consistent brand-generic identification!")
+    profiler.finish()
@@ -0,0 +1,106 @@
+"""
+Negative prefilter for the fuzzy matching stages
+
+find_fuzzy_match() in annotate_treatments_comprehensive.py scores every
+database row with SequenceMatcher, so a treatment that matches nothing
+("Physical therapy", "Sauna") costs a full scan of RxNorm and another of the
+supplements catalog before it falls through. FuzzyPrefilter rules rows out
+before they are scored, using upper bounds on each part of the score:
+
+- word overlap needs a word shared with the database; a Bloom filter over
+  every database word answers "definitely not shared" in a few bytes per word
+- SequenceMatcher.ratio() is at most 2 * (shared characters) / (total length),
+  computed for all rows at once from a per-row character count matrix
+- a substring boost needs every character of the shorter name to be present
+  in the longer one, which the same counts show
+
+A row whose bounds are all under the cutoff cannot reach it, so skipping it
+never changes a match. Treatments sharing a word with the database are
+scanned in full; the rest only score the rows that can still reach the
+cutoff, and when there are none the stage is skipped outright.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789 '
+
+class BloomFilter:
+    """Compact set membership with no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+class FuzzyPrefilter:
+    """Upper bounds on find_fuzzy_match() scores for every row of a name column
+
+    names are the raw database names, in row order; normalize is the
+    normalizer find_fuzzy_match() applies to them.
+    """
+
+    def __init__(self, names, normalize):
+        normalized = ['' if name is None or name != name else normalize(name) for name in names]
+        self.columns = {char: column for column, char in enumerate(ALPHABET)}
+        other = len(ALPHABET)
+
+        words = {word for name in normalized for word in name.split()}
+        self.words = BloomFilter(len(words))
+        self.words.update(words)
+
+        self.lengths = np.array([len(name) for name in normalized], dtype=np.int64)
+        self.counts = np.zeros((len(normalized), other + 1), dtype=np.uint16)
+        for row, name in enumerate(normalized):
+            for char in name:
+                self.counts[row, self.columns.get(char, other)] += 1
+        self.stats = {'skipped': 0, 'pruned': 0, 'full_scans': 0}
+
+    def char_counts(self, text):
+        counts = np.zeros(self.counts.shape[1], dtype=np.uint16)
+        other = len(ALPHABET)
+        for char in text:
+            counts[self.columns.get(char, other)] += 1
+        return counts
+
+    def candidate_positions(self, normalized_treatment, cutoff):
+        """Row positions that might score cutoff or more, or None to scan every row"""
+        if any(word in self.words for word in normalized_treatment.split()):
+            self.stats['full_scans'] += 1
+            return None
+
+        length = len(normalized_treatment)
+        shared = np.minimum(self.counts, self.char_counts(normalized_treatment)).sum(axis=1, dtype=np.int64)
+        bound = 2.0 * shared / (length + self.lengths)
+        # One name can only be a substring of the other if all of its characters are shared
+        substring = (shared == length) | (shared == self.lengths)
+        bound[substring] = np.maximum(bound[substring], 0.8)
+        bound[self.lengths == 0] = 0.0
+
+        positions = np.flatnonzero(bound >= cutoff)
+        self.stats['skipped' if len(positions) == 0 else 'pruned'] += 1
+        return positions
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Reverse index from unified RXCUIs to their member names
+
+Every brand and generic name unified under one primary_RXCUI forms a group.
+RxcuiGroupIndex is built once from the core database: rows are bucketed by
+term type (BN, IN, PT, then everything else) and, within each bucket, sorted
+by group, so the members of a group are one contiguous slice of an int32
+position array. A dict maps each RXCUI to its group number, so looking up a
+group's members, or its size, costs the same for every group instead of a
+scan over the whole table.
+
+Usage:
+    python group_index.py RXCUI [RXCUI ...] [--database PATH]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_DATABASE = 'data/rxnorm_core_medications.csv'
+
+TERM_TYPES = ('BN', 'IN', 'PT')
+OTHER = 'other'
+
+class RxcuiGroupIndex:
+    """primary_RXCUI → member rows, split by term type
+
+    For each bucket, positions[offsets[g]:offsets[g + 1]] are the row
+    positions (in file order) of group g's members in that bucket.
+    """
+
+    def __init__(self, df, id_column='primary_RXCUI', name_column='DrugName',
+                 type_column='preferred_term_type'):
+        self.names = df[name_column].astype(str).to_numpy()
+        rxcuis, group_ids = np.unique(df[id_column].to_numpy(), return_inverse=True)
+        group_ids = group_ids.reshape(-1).astype(np.int32)
+        self.rxcuis = rxcuis
+        self._groups = {rxcui.item() if hasattr(rxcui, 'item') else rxcui: group
+                        for group, rxcui in enumerate(rxcuis)}
+
+        term_types = df[type_column].astype(str).to_numpy()
+        bucket_masks = {term_type: term_types == term_type for term_type in TERM_TYPES}
+        bucket_masks[OTHER] = ~np.isin(term_types, TERM_TYPES)
+
+        self.positions = {}
+        self.offsets = {}
+        for bucket, mask in bucket_masks.items():
+            rows = np.flatnonzero(mask).astype(np.int32)
+            bucket_groups = group_ids[rows]
+            self.positions[bucket] = rows[np.argsort(bucket_groups, kind='stable')]
+            counts = np.bincount(bucket_groups, minlength=len(rxcuis))
+            self.offsets[bucket] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+        self.sizes = np.bincount(group_ids, minlength=len(rxcuis))
+
+    @classmethod
+    def from_csv(cls, path):
+        """Build an index from an RxNorm core CSV file"""
+        from database_loader import load_rxnorm_compact
+        return cls(load_rxnorm_compact(path, report=False))
+
+    def __len__(self):
+        return len(self.rxcuis)
+
+    def __contains__(self, rxcui):
+        return self.group(rxcui) is not None
+
+    def group(self, rxcui):
+        """Group number of an RXCUI given as int or string, or None"""
+        group = self._groups.get(rxcui)
+        if group is None and isinstance(rxcui, str) and rxcui.strip().isdigit():
+            group = self._groups.get(int(rxcui))
+        return group
+
+    def size(self, rxcui):
+        """Number of rows unified under rxcui"""
+        group = self.group(rxcui)
+        return 0 if group is None else int(self.sizes[group])
+
+    def row_positions(self, rxcui, bucket):
+        """Row positions of rxcui's members with term type bucket, in file order"""
+        group = self.group(rxcui)
+        if group is None:
+            return self.positions[bucket][:0]
+        offsets = self.offsets[bucket]
+        return self.positions[bucket][offsets[group]:offsets[group + 1]]
+
+    def members(self, rxcui, buckets=TERM_TYPES + (OTHER,)):
+        """Member names of rxcui by term type, e.g. {'BN': [...], 'IN': [...], ...}"""
+        return {bucket: self.names[self.row_positions(rxcui, bucket)].tolist() for bucket in buckets}
+
+    def lookup(self, rxcui):
+        """Brand names, generic (IN/PT) names and member count of rxcui, or None"""
+        if rxcui not in self:
+            return None
+        members = self.members(rxcui)
+        return {
+            'RXCUI': rxcui,
+            'brands': members['BN'],
+            'generics': members['IN'] + members['PT'],
+            'other': members[OTHER],
+            'size': self.size(rxcui),
+        }
+
+    def largest_groups(self, count=10, min_size=2):
+        """RXCUIs of the largest groups with at least min_size members"""
+        order = np.argsort(-self.sizes, kind='stable')[:count]
+        return [self.rxcuis[group].item() for group in order if self.sizes[group] >= min_size]
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Show the brand and generic names unified under RXCUIs")
+    parser.add_argument('rxcuis', nargs='+', help="Primary RXCUIs to look up")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f"RxNorm core CSV file (default: {DEFAULT_DATABASE})")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"❌ RxNorm core file not found: {args.database}")
+        return 1
+
+    start = time.perf_counter()
+    index = RxcuiGroupIndex.from_csv(args.database)
+    print(f"✅ Indexed {len(index):,} groups ({time.perf_counter() - start:.2f}s)")
+
+    for rxcui in args.rxcuis:
+        group = index.lookup(rxcui)
+        if group is None:
+            print(f"\n❓ RXCUI {rxcui}: not found")
+            continue
+        print(f"\nRXCUI {rxcui} ({group['size']} entries):")
+        print(f"  Brands: {', '.join(group['brands']) or '-'}")
+        print(f"  Generics: {', '.join(group['generics']) or '-'}")
+        if group['other']:
+            print(f"  Other: {', '.join(group['other'])}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
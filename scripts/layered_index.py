@@ -0,0 +1,92 @@
+"""
+One exact-match index over the consolidated and core RxNorm databases
+
+create_enhanced_annotation.py and create_optimized_annotation.py used to
+build three dicts: consolidated normalized names, core normalized names and
+core clean names. Each entry held its own record dict. Most names appear in
+several of them, so the keys and records were stored up to three times, and
+every candidate name was probed once per dict.
+
+LayeredIndex keeps one dict from each key to a slot. A slot is a row of an
+int32 array holding the record number the key hits in each layer, or -1 when
+it has none. Identical records are stored once in a shared record table. One
+probe answers for every layer at once.
+
+Within a layer the first row for a key wins, as with the dicts it replaces.
+"""
+
+import numpy as np
+import pandas as pd
+
+CONSOLIDATED = 'consolidated'
+CORE = 'core'
+CORE_CLEAN = 'core_clean'
+
+LAYERS = (CONSOLIDATED, CORE, CORE_CLEAN)
+
+RECORD_COLUMNS = ['primary_RXCUI', 'DrugName', 'sources', 'preferred_term_type']
+
+MISSING = -1
+
+class LayeredIndex:
+    """Normalized name → record number in each layer
+
+    layers maps layer names from LAYERS to (DataFrame, key column) pairs.
+    Layers that are left out, e.g. when the consolidated file is not
+    available, never hit.
+    """
+
+    def __init__(self, layers):
+        self.layers = {layer: position for position, layer in enumerate(LAYERS)}
+        frames = []
+        for layer, (df, key_column) in layers.items():
+            frame = df[[key_column] + RECORD_COLUMNS].dropna(subset=[key_column])
+            frame = frame.drop_duplicates(key_column).astype(object)
+            frames.append(frame.rename(columns={key_column: 'key'}).assign(layer=self.layers[layer]))
+        entries = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=['key'] + RECORD_COLUMNS + ['layer'])
+        entries['key'] = entries['key'].astype(str)
+
+        # Rows with identical fields share one record
+        record_numbers = entries.groupby(RECORD_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+        records = entries[~pd.Series(record_numbers).duplicated().to_numpy()]
+        self.rxcuis, self.names, self.sources, self.term_types = (
+            records[column].tolist() for column in RECORD_COLUMNS)
+
+        slots, keys = pd.factorize(entries['key'])
+        self.slots = dict(zip(keys, range(len(keys))))
+        self.hits = np.full((len(keys), len(LAYERS)), MISSING, dtype=np.int32)
+        self.hits[slots, entries['layer'].to_numpy(dtype=np.int64)] = record_numbers
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def record_count(self):
+        return len(self.rxcuis)
+
+    def get(self, term):
+        """Record numbers of term in each layer (MISSING where absent), or None"""
+        slot = self.slots.get(term)
+        return None if slot is None else self.hits[slot].tolist()
+
+    def hit(self, hits, layer):
+        """Record number of layer in a get() result, or MISSING"""
+        return MISSING if hits is None else hits[self.layers[layer]]
+
+    def record(self, number):
+        """Record number as a dict with RXCUI, name, sources and term_type keys"""
+        return {
+            'RXCUI': self.rxcuis[number],
+            'name': self.names[number],
+            'sources': self.sources[number],
+            'term_type': self.term_types[number],
+        }
+
+    def first_record(self, probes):
+        """Record of the first (get() result, layer) probe that hits, or None"""
+        for hits, layer in probes:
+            number = self.hit(hits, layer)
+            if number != MISSING:
+                return self.record(number)
+        return None
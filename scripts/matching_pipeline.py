@@ -0,0 +1,265 @@
+"""
+Configurable staged matching pipeline
+
+A MatchPipeline runs a treatment name through an ordered list of stages. Each
+stage is a pluggable object with a name and a match(query) method that returns
+a match dict or None. The first stage to return a match wins, and the pipeline
+records per-stage call counts, hit counts and cumulative time so expensive
+stages can be reordered or disabled per workload.
+
+The lookup-based stages shared by the annotators live here. Stages that scan
+DataFrames are defined next to their scoring code in the annotator scripts.
+Only cheap standard library modules are imported up front, so fast-start tools
+such as quick_lookup.py can use the pipeline.
+"""
+
+import re
+import string
+import time
+
+class MatchQuery:
+    """A treatment name travelling through the pipeline
+
+    Stages share derived forms of the name through cached() so each is
+    computed once per query. Stages that score several candidates may append
+    them to candidates for review output. A stage that rules the query out
+    without doing its work sets skipped so the pipeline can count it.
+    """
+
+    def __init__(self, treatment_name):
+        self.treatment_name = treatment_name
+        self.candidates = []
+        self.skipped = False
+        self._cache = {}
+
+    def cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute(self.treatment_name)
+        return self._cache[key]
+
+class MatchStage:
+    """Base class for pipeline stages"""
+
+    name = 'stage'
+
+    def match(self, query):
+        """Return a match dict for the query, or None to fall through"""
+        raise NotImplementedError
+
+class MatchPipeline:
+    """Run stages in order, short-circuiting on the first hit"""
+
+    def __init__(self, stages, stats=None):
+        """stats may be a dict shared with other pipelines to aggregate their counts"""
+        self.stages = list(stages)
+        self.stats = {} if stats is None else stats
+        for stage in self.stages:
+            self.stats.setdefault(stage.name, {'calls': 0, 'hits': 0, 'skipped': 0, 'seconds': 0.0})
+
+    @classmethod
+    def from_names(cls, available, names, stats=None):
+        """Build a pipeline from a name -> stage mapping and an ordered list of names"""
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. "
+                             f"Available: {', '.join(available)}")
+        return cls((available[name] for name in names), stats=stats)
+
+    def match(self, treatment_name):
+        """Match a treatment name, returning (match, query)
+
+        match is None when no stage produced a hit. The returned query carries
+        any candidates collected along the way.
+        """
+        query = MatchQuery(treatment_name)
+        for stage in self.stages:
+            stats = self.stats[stage.name]
+            query.skipped = False
+            start = time.perf_counter()
+            result = stage.match(query)
+            stats['seconds'] += time.perf_counter() - start
+            stats['calls'] += 1
+            if query.skipped:
+                stats['skipped'] += 1
+            if result is not None:
+                stats['hits'] += 1
+                result.setdefault('stage', stage.name)
+                return result, query
+        return None, query
+
+    def print_stats(self):
+        """Print hit counts and cumulative time for each stage"""
+        print(f"\nPipeline stages:")
+        for name, stats in self.stats.items():
+            per_call = stats['seconds'] / stats['calls'] * 1000 if stats['calls'] else 0
+            skipped = f"  skipped: {stats['skipped']:,}" if stats.get('skipped') else ''
+            print(f"  {name:18} calls: {stats['calls']:6,}  hits: {stats['hits']:6,}  "
+                  f"time: {stats['seconds']:8.3f}s  ({per_call:.2f} ms/call){skipped}")
+
+def dedup_key(treatment_name):
+    """Key under which the lookup stages give every name the same result
+
+    The stages here only see normalize_name() of the name and of its
+    'Generic (Brand)' parts, so the key is that normalization with the
+    parentheses kept: case, whitespace and the punctuation it drops are
+    ignored, while hyphens and underscores, which it keeps, are not.
+    """
+    if treatment_name is None or treatment_name != treatment_name:  # None or NaN
+        return ""
+    key = re.sub(r'[^\w\s()-]', '', str(treatment_name).lower())
+    return re.sub(r'\s+', ' ', key).strip()
+
+def iter_fan_out(treatment_names, resolve, key=dedup_key, resolved=None, progress_every=0):
+    """Yield fan_out() results one name at a time, in input order
+
+    Each key is resolved when its first name is reached, so results can be
+    written as they are produced. resolved, if given, is filled with key ->
+    result; its length is the number of unique keys once iteration ends.
+    """
+    resolved = {} if resolved is None else resolved
+    keys = [key(name) for name in treatment_names]
+    unique_count = len(set(keys))
+    
+    for name, name_key in zip(treatment_names, keys):
+        if name_key not in resolved:
+            if progress_every and len(resolved) % progress_every == 0 and resolved:
+                print(f"  Processed {len(resolved)}/{unique_count}...")
+            resolved[name_key] = resolve(name)
+        yield resolved[name_key]
+
+def fan_out(treatment_names, resolve, key=dedup_key, progress_every=0):
+    """Resolve each distinct key once and fan the result out to every name
+
+    The first name seen for a key is resolved and its result is shared by all
+    names with the same key, so key must be no coarser than what the stages
+    behind resolve compare. Returns (results aligned with treatment_names in
+    input order, number of unique keys).
+    """
+    resolved = {}
+    results = list(iter_fan_out(treatment_names, resolve, key, resolved, progress_every))
+    return results, len(resolved)
+
+def split_parenthetical(treatment_name):
+    """Split 'Generic (Brand)' into its main and parenthetical parts"""
+    paren_match = re.search(r'^(.+?)\s*\(([^)]+)\)', str(treatment_name))
+    if not paren_match:
+        return []
+    return [paren_match.group(1), paren_match.group(2)]
+
+def _lookup_match(lookups, term):
+    """Probe (method, lookup) pairs in order for a search term"""
+    for method, lookup in lookups:
+        record = lookup.get(term)
+        if record is not None:
+            return {'method': method, 'term': term, 'record': record, 'confidence': 1.0}
+    return None
+
+class ExactNormalizedStage(MatchStage):
+    """Exact lookup of the normalized treatment name"""
+
+    name = 'normalized'
+
+    def __init__(self, lookup, normalize):
+        self.lookup = lookup
+        self.normalize = normalize
+
+    def match(self, query):
+        term = query.cached('normalized', self.normalize)
+        if not term:
+            return None
+        return _lookup_match([('normalized', self.lookup)], term)
+
+class CleanNameStage(ExactNormalizedStage):
+    """Exact lookup of the normalized treatment name among clean names"""
+
+    name = 'clean_name'
+
+    def match(self, query):
+        term = query.cached('normalized', self.normalize)
+        if not term:
+            return None
+        return _lookup_match([('clean_name', self.lookup)], term)
+
+class ParentheticalStage(MatchStage):
+    """Look up the main and parenthetical parts of 'Generic (Brand)' separately"""
+
+    name = 'parenthetical'
+
+    def __init__(self, lookups, normalize):
+        self.lookups = lookups
+        self.normalize = normalize
+
+    def match(self, query):
+        normalized = query.cached('normalized', self.normalize)
+        for part in split_parenthetical(query.treatment_name):
+            term = self.normalize(part)
+            if term and term != normalized:
+                result = _lookup_match(self.lookups, term)
+                if result is not None:
+                    return result
+        return None
+
+class CoreDrugStage(MatchStage):
+    """Look up the core drug name with dosages, routes and forms stripped
+
+    With extract_alias, the expansion of an alias in the name is looked up
+    after the core drug name misses.
+    """
+
+    name = 'core_drug'
+
+    def __init__(self, lookups, normalize, extract_core, extract_alias=None):
+        self.lookups = lookups
+        self.normalize = normalize
+        self.extract_core = extract_core
+        self.extract_alias = extract_alias
+
+    def match(self, query):
+        normalized = query.cached('normalized', self.normalize)
+        main_name = re.sub(r'\s*\([^)]+\)', '', str(query.treatment_name))
+        terms = [self.extract_core(main_name)]
+        if self.extract_alias is not None:
+            terms.append(self.extract_alias(main_name))
+        for term in dict.fromkeys(terms):
+            if term and term != normalized:
+                result = _lookup_match(self.lookups, term)
+                if result is not None:
+                    return result
+        return None
+
+class TypoStage(MatchStage):
+    """Look up every single-edit variant of the normalized name
+
+    Catches one dropped, doubled, swapped or mistyped character at the cost of
+    a few hundred dict probes. Short names are skipped because one edit away
+    from a three-letter name is usually a different drug.
+    """
+
+    name = 'typo'
+    alphabet = string.ascii_lowercase + string.digits + ' -'
+
+    def __init__(self, lookup, normalize, min_length=5):
+        self.lookup = lookup
+        self.normalize = normalize
+        self.min_length = min_length
+
+    def edits(self, term):
+        splits = [(term[:i], term[i:]) for i in range(len(term) + 1)]
+        deletes = [left + right[1:] for left, right in splits if right]
+        transposes = [left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1]
+        replaces = [left + c + right[1:] for left, right in splits if right for c in self.alphabet]
+        inserts = [left + c + right for left, right in splits for c in self.alphabet]
+        return dict.fromkeys(deletes + transposes + replaces + inserts)
+
+    def match(self, query):
+        term = query.cached('normalized', self.normalize)
+        if len(term) < self.min_length:
+            return None
+        for variant in self.edits(term):
+            if variant != term:
+                record = self.lookup.get(variant)
+                if record is not None:
+                    from difflib import SequenceMatcher
+                    confidence = SequenceMatcher(None, term, variant).ratio()
+                    return {'method': 'typo', 'term': variant, 'record': record, 'confidence': confidence}
+        return None
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Asyncio micro-batching front end for annotation requests
+
+Callers that annotate one name at a time each pay the full per-query
+overhead. MicroBatcher collects concurrent annotate() calls into batches,
+collapses names that share a dedup key, runs each batch through the matching
+engine in one call on a worker thread and resolves every caller's future.
+
+When the engine is idle, the requests that arrived in the same event loop
+turn are dispatched straight away. While a batch is running, new requests
+wait for it to finish, but never longer than max_delay, and a batch is
+dispatched immediately once max_batch_size distinct names are waiting. A
+quiet service therefore adds no delay, and a busy one forms large batches
+with bounded tail latency.
+
+Usage:
+    python micro_batcher.py [treatment_file.csv] [--requests N] [--concurrency N]
+                            [--max-delay-ms MS] [--batch-size N] [--sqlite-index PATH]
+                            [--reload-interval SECONDS]
+
+The command line runs the annotate_treatments.py pipeline behind a batcher
+and fires concurrent single-name requests at it to report throughput and
+latency. With --reload-interval the lookups are held in a ReloadableIndex and
+rebuilt in the background when the RxNorm source file changes.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from matching_pipeline import dedup_key, fan_out
+from reloadable_index import ReloadableIndex
+
+RXNORM_FILE = 'data/rxnorm_core_medications.csv'
+
+class MicroBatcher:
+    """Collect concurrent single-name requests into batches
+
+    resolve_batch takes a list of distinct names and returns their results in
+    the same order. It runs on a single worker thread, so the matching engine
+    behind it never sees two batches at once.
+
+    Concurrent names with the same key are resolved once, so key must be no
+    coarser than what the matching engine compares; the default is the
+    annotate_treatments.py normalization. Each caller gets its own copy of a
+    dict result with name_field set to the name it asked for.
+    """
+
+    def __init__(self, resolve_batch, max_delay=0.005, max_batch_size=64, key=dedup_key, executor=None,
+                 name_field='Treatment Name'):
+        self.resolve_batch = resolve_batch
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.key = key
+        self.name_field = name_field
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='annotate')
+        self.stats = {'requests': 0, 'batches': 0, 'names_resolved': 0, 'largest_batch': 0}
+        self._pending = {}
+        self._timer = None
+        self._in_flight = 0
+
+    @classmethod
+    def for_resolver(cls, resolve, key=dedup_key, **kwargs):
+        """Batch a single-name resolve function, resolving each distinct key once"""
+        return cls(lambda names: fan_out(names, resolve, key=key)[0], key=key, **kwargs)
+
+    async def annotate(self, treatment_name):
+        """Annotate one name, sharing a batch with concurrent callers"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.stats['requests'] += 1
+
+        name_key = self.key(treatment_name)
+        if name_key in self._pending:
+            self._pending[name_key][1].append((future, treatment_name))
+        else:
+            self._pending[name_key] = (treatment_name, [(future, treatment_name)])
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            delay = self.max_delay if self._in_flight else 0
+            self._timer = loop.call_later(delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._in_flight += 1
+        asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        names = [name for name, _ in batch.values()]
+        self.stats['batches'] += 1
+        self.stats['names_resolved'] += len(names)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(names))
+
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.resolve_batch, names)
+        except Exception as e:
+            for _, waiters in batch.values():
+                for future, _ in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+        else:
+            for (_, waiters), result in zip(batch.values(), results):
+                for future, treatment_name in waiters:
+                    if not future.done():
+                        future.set_result(self._result_for(result, treatment_name))
+        finally:
+            self._in_flight -= 1
+
+        # Requests that queued up behind this batch go next
+        if self._pending and not self._in_flight:
+            self._flush()
+
+    def _result_for(self, result, treatment_name):
+        """A caller's own copy of a shared result, carrying the name it asked for"""
+        if not isinstance(result, dict):
+            return result
+        result = dict(result)
+        if self.name_field in result:
+            result[self.name_field] = treatment_name
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched concurrent annotation")
+    parser.add_argument('treatment_file', nargs='?', default='examples/sample_treatments.csv',
+                        help="Treatment CSV file (default: examples/sample_treatments.csv)")
+    parser.add_argument('--requests', type=int, default=5000,
+                        help="Single-name requests to send (default: 5000)")
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help="Concurrent clients sending requests (default: 100)")
+    parser.add_argument('--max-delay-ms', type=float, default=5.0,
+                        help="Longest a request waits for its batch to fill (default: 5)")
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help="Distinct names that trigger an immediate batch (default: 64)")
+    parser.add_argument('--sqlite-index', metavar='PATH',
+                        help="Answer lookups from a SQLite index instead of the RxNorm CSV")
+    parser.add_argument('--reload-interval', type=float, default=0, metavar='SECONDS',
+                        help="Watch the RxNorm source and hot-reload lookups when it changes (default: off)")
+    return parser.parse_args(argv)
+
+def build_annotator(sqlite_index=None):
+    """The annotate_treatments.py pipeline as a single-name resolve function"""
+    from annotate_treatments import (DEFAULT_STAGES, annotate_treatment, build_lookups,
+                                     build_stages)
+    from matching_pipeline import MatchPipeline
+
+    if sqlite_index:
+        from sqlite_index import RxnormSqliteIndex
+        index = RxnormSqliteIndex(sqlite_index)
+        lookups = index.lookup('normalized_name'), index.lookup('clean_name')
+    else:
+        from database_loader import load_rxnorm_compact
+        lookups = build_lookups(load_rxnorm_compact(RXNORM_FILE))
+    pipeline = MatchPipeline.from_names(build_stages(*lookups), DEFAULT_STAGES)
+    return lambda name: annotate_treatment(name, pipeline)
+
+async def run_benchmark(batcher, treatment_names, request_count, concurrency):
+    """Clients each send requests one after another; returns (seconds, sorted latencies)"""
+    latencies = []
+    names = [random.choice(treatment_names) for _ in range(request_count)]
+
+    async def client(client_names):
+        for name in client_names:
+            start = time.perf_counter()
+            await batcher.annotate(name)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(names[i::concurrency]) for i in range(concurrency)))
+    return time.perf_counter() - start, sorted(latencies)
+
+def main():
+    args = parse_args()
+    import pandas as pd
+
+    if not os.path.exists(args.treatment_file):
+        print(f"❌ Treatment file not found: {args.treatment_file}")
+        return 1
+    treatment_names = pd.read_csv(args.treatment_file).iloc[:, 0].dropna().astype(str).tolist()
+
+    if args.reload_interval:
+        # Each batch takes one snapshot, so a reload never splits a batch across versions
+        annotators = ReloadableIndex(lambda: build_annotator(args.sqlite_index),
+                                     [args.sqlite_index or RXNORM_FILE],
+                                     poll_interval=args.reload_interval, label='RxNorm lookups').start()
+        resolve = annotators.current
+        batcher = MicroBatcher(lambda names: fan_out(names, annotators.current)[0],
+                               max_delay=args.max_delay_ms / 1000, max_batch_size=args.batch_size)
+    else:
+        resolve = build_annotator(args.sqlite_index)
+        batcher = MicroBatcher.for_resolver(resolve, max_delay=args.max_delay_ms / 1000,
+                                            max_batch_size=args.batch_size)
+    random.seed(0)
+    elapsed, latencies = asyncio.run(run_benchmark(batcher, treatment_names, args.requests,
+                                                         args.concurrency))
+    batcher.close()
+    if args.reload_interval:
+        annotators.stop()
+    
+    # The same requests resolved one at a time, for comparison
+    random.seed(0)
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        resolve(random.choice(treatment_names))
+    unbatched = time.perf_counter() - start
+
+    stats = batcher.stats
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"\n=== MICRO-BATCHING RESULTS ===")
+    print(f"Requests: {stats['requests']:,} in {elapsed:.2f}s ({stats['requests'] / elapsed:,.0f} requests/s)")
+    print(f"Batches: {stats['batches']:,} (largest: {stats['largest_batch']}, "
+          f"names resolved: {stats['names_resolved']:,})")
+    print(f"Latency: p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+    print(f"Unbatched: {unbatched:.2f}s ({args.requests / unbatched:,.0f} requests/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
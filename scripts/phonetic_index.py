@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Phonetic key index for sound-alike brand and generic names
+
+Misspelled drug names ("Klonapin", "Zithromycin", "Synthroyd") usually keep
+the consonants of the real name and get the vowels wrong. phonetic_key()
+reduces a word to its consonant sounds with Metaphone-style rules (PH -> F,
+soft C -> S, TH -> 0, X -> KS, silent leading letters, doubled letters
+collapsed). Every vowel is dropped, including a leading one, so a missing
+"a" in "zithromycin" still matches "azithromycin".
+
+PhoneticIndex maps the keys of a database's BN and IN names to their row
+positions. A treatment's candidates are then the few rows sharing its key,
+and only those need scoring.
+
+Usage:
+    python phonetic_index.py NAME [NAME ...] [--database PATH]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+DEFAULT_DATABASE = 'data/rxnorm_core_medications.csv'
+
+# Term types indexed by default: brand names and ingredients
+PHONETIC_TERM_TYPES = ('BN', 'IN')
+
+VOWELS = set('aeiouy')
+FRONT_VOWELS = set('eiy')
+
+# Silent or merged leading letter pairs
+INITIAL_REPLACEMENTS = [('kn', 'n'), ('gn', 'n'), ('pn', 'n'), ('ps', 's'), ('wr', 'r'), ('wh', 'w'), ('x', 's')]
+
+SIMPLE_CODES = {'b': 'B', 'f': 'F', 'j': 'J', 'k': 'K', 'l': 'L', 'm': 'M', 'n': 'N', 'q': 'K', 'r': 'R',
+                'v': 'F', 'x': 'KS', 'z': 'S'}
+
+def phonetic_key(word):
+    """Consonant sound code of one word, e.g. 'klonopin' -> 'KLNPN'"""
+    word = ''.join(char for char in str(word).lower() if char.isalpha())
+    for prefix, replacement in INITIAL_REPLACEMENTS:
+        if word.startswith(prefix):
+            word = replacement + word[len(prefix):]
+            break
+
+    codes = []
+    length = len(word)
+    i = 0
+    while i < length:
+        char = word[i]
+        after = word[i + 1] if i + 1 < length else ''
+        step = 1
+        code = ''
+        if char == word[i - 1:i] and char != 'c':
+            pass  # doubled letter
+        elif char in VOWELS:
+            pass
+        elif char == 'c':
+            if after == 'h':
+                code, step = 'X', 2
+            elif after in FRONT_VOWELS:
+                code = 'S'
+            else:
+                code = 'K'
+                if after in ('c', 'k', 'q'):
+                    step = 2
+        elif char == 'd':
+            code = 'J' if after == 'g' and word[i + 2:i + 3] in FRONT_VOWELS else 'T'
+        elif char == 'g':
+            if after == 'h':
+                step = 2  # silent, as in "night"
+            else:
+                code = 'J' if after in FRONT_VOWELS else 'K'
+        elif char == 'p':
+            code, step = ('F', 2) if after == 'h' else ('P', 1)
+        elif char == 's':
+            if after == 'h':
+                code, step = 'X', 2
+            elif word[i + 1:i + 3] in ('io', 'ia'):
+                code = 'X'
+            else:
+                code = 'S'
+        elif char == 't':
+            if after == 'h':
+                code, step = '0', 2
+            elif word[i + 1:i + 3] in ('io', 'ia'):
+                code = 'X'
+            else:
+                code = 'T'
+        elif char == 'w':
+            code = 'W' if after in VOWELS else ''
+        elif char == 'h':
+            pass  # only sounded in the digraphs above
+        else:
+            code = SIMPLE_CODES.get(char, '')
+
+        if code and not (codes and codes[-1] == code):
+            codes.append(code)
+        i += step
+    return ''.join(codes)
+
+def name_key(normalized_name):
+    """Phonetic key of a normalized name: word keys joined by spaces"""
+    return ' '.join(key for key in map(phonetic_key, str(normalized_name).split()) if key)
+
+class PhoneticIndex:
+    """Phonetic key -> row positions over the names of selected term types
+
+    names are the raw database names, in row order, and normalize is the
+    normalizer applied to them and to the treatments looked up. When
+    term_types is given, only rows whose term type is in types are indexed.
+    """
+
+    def __init__(self, names, normalize, term_types=None, types=PHONETIC_TERM_TYPES):
+        self.positions = {}
+        for position, name in enumerate(names):
+            if name is None or name != name:
+                continue
+            if term_types is not None and term_types[position] not in types:
+                continue
+            key = name_key(normalize(name))
+            if key:
+                self.positions.setdefault(key, []).append(position)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def candidates(self, normalized_name):
+        """Row positions of names that sound like normalized_name, in row order"""
+        key = name_key(normalized_name)
+        return self.positions.get(key, []) if key else []
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Show the brand and generic names that sound like NAMEs")
+    parser.add_argument('names', nargs='+', help="Treatment names to look up")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f"RxNorm core CSV file (default: {DEFAULT_DATABASE})")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"❌ RxNorm core file not found: {args.database}")
+        return 1
+
+    from database_loader import load_rxnorm_compact
+    from treatment_tokenizer import FUZZY_NAME_TOKENIZER
+    normalize = FUZZY_NAME_TOKENIZER.core_name
+
+    start = time.perf_counter()
+    df = load_rxnorm_compact(args.database, columns=['primary_RXCUI', 'DrugName', 'preferred_term_type'],
+                             report=False)
+    index = PhoneticIndex(df['DrugName'].tolist(), normalize, df['preferred_term_type'].tolist())
+    print(f"✅ Indexed {len(index):,} phonetic keys ({time.perf_counter() - start:.2f}s)")
+
+    for name in args.names:
+        normalized = normalize(name)
+        positions = index.candidates(normalized)
+        print(f"\n{name} [{name_key(normalized)}]: {len(positions)} candidate(s)")
+        for row in df.iloc[positions].itertuples(index=False):
+            print(f"  {row.DrugName} ({row.preferred_term_type}, RXCUI: {row.primary_RXCUI})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
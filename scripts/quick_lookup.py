@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Fast-start exact RxNorm lookup for shell scripts
+
+annotate_treatments.py spends most of a small run importing pandas and numpy
+and parsing the whole RxNorm CSV. This entry point uses only the standard
+library: it answers exact lookups (normalized name, clean name, the parts of
+'Generic (Brand)', then the core drug name and any leading alias expansion)
+from the SQLite index built by sqlite_index.py,
+or by streaming the CSV with the csv module when there is no index. pandas,
+difflib and requests are never imported. Import, startup and lookup times are
+reported on stderr.
+
+Usage:
+    python quick_lookup.py NAME [NAME ...] [--index PATH] [--database CSV] [--json]
+    echo "Tylenol" | python quick_lookup.py
+
+Prints one tab-separated line per name: name, RXCUI, matched name, term type
+and match method (empty fields when there is no match).
+"""
+
+import time
+
+_start = time.perf_counter()
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from alias_matcher import DRUG_ALIASES, normalize_phrase as normalize_name
+from matching_pipeline import (CleanNameStage, CoreDrugStage, ExactNormalizedStage, MatchPipeline,
+                               ParentheticalStage)
+from treatment_tokenizer import CORE_DRUG_TOKENIZER
+
+_imported = time.perf_counter()
+
+DEFAULT_INDEX = 'data/rxnorm_core.sqlite'
+DEFAULT_DATABASE = 'data/rxnorm_core_medications.csv'
+
+def extract_core_drug_name(treatment_name):
+    """Core drug name, or the expansion of a name that is an alias, as annotate_treatments.py extracts it"""
+    normalized = normalize_name(treatment_name)
+    alias = DRUG_ALIASES.get(normalized)
+    if alias is not None:
+        return alias
+    return CORE_DRUG_TOKENIZER.core_name(normalized)
+
+def extract_alias_name(treatment_name):
+    """Expansion of an alias that starts the name or is its whole core name, or ''"""
+    normalized = normalize_name(treatment_name)
+    return DRUG_ALIASES.leading_expansion(normalized, CORE_DRUG_TOKENIZER.core_name(normalized)) or ''
+
+def load_csv_lookups(path):
+    """Normalized name and clean name lookups read with the csv module; the first row wins"""
+    rxnorm_lookup = {}
+    clean_lookup = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            record = {
+                'RXCUI': row['primary_RXCUI'],
+                'name': row['DrugName'],
+                'sources': row.get('sources', ''),
+                'term_type': row.get('preferred_term_type', '')
+            }
+            rxnorm_lookup.setdefault(row['normalized_name'], record)
+            if row.get('clean_name'):
+                clean_lookup.setdefault(row['clean_name'], record)
+    return rxnorm_lookup, clean_lookup
+
+def open_lookups(index_path, database_path):
+    """Lookups from the SQLite index if it exists, else from the CSV; returns (lookups, source)"""
+    if os.path.exists(index_path):
+        from sqlite_index import RxnormSqliteIndex
+        index = RxnormSqliteIndex(index_path)
+        return (index.lookup('normalized_name'), index.lookup('clean_name')), index_path
+    return load_csv_lookups(database_path), database_path
+
+def build_pipeline(rxnorm_lookup, clean_lookup):
+    """The exact-match stages of annotate_treatments.py"""
+    lookups = [('normalized', rxnorm_lookup), ('clean_name', clean_lookup)]
+    return MatchPipeline([
+        ExactNormalizedStage(rxnorm_lookup, normalize_name),
+        CleanNameStage(clean_lookup, normalize_name),
+        ParentheticalStage(lookups, normalize_name),
+        CoreDrugStage(lookups, normalize_name, extract_core_drug_name, extract_alias_name),
+    ])
+
+def lookup(pipeline, treatment_name):
+    """Match one name, returning a result dict"""
+    match, _ = pipeline.match(treatment_name)
+    if match is None:
+        return {'treatment_name': treatment_name, 'matched': False, 'RXCUI': '', 'matched_name': '',
+                'term_type': '', 'match_method': ''}
+    record = match['record']
+    return {'treatment_name': treatment_name, 'matched': True, 'RXCUI': record['RXCUI'],
+            'matched_name': record['name'], 'term_type': record['term_type'],
+            'match_method': match['method']}
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Fast exact RxNorm lookup using only the standard library")
+    parser.add_argument('names', nargs='*', help="Treatment names to look up (default: read lines from stdin)")
+    parser.add_argument('--index', default=DEFAULT_INDEX,
+                        help=f"SQLite index built by sqlite_index.py (default: {DEFAULT_INDEX})")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f"RxNorm core CSV used when there is no index (default: {DEFAULT_DATABASE})")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per line")
+    parser.add_argument('--quiet', action='store_true', help="Do not report timings on stderr")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    if not os.path.exists(args.index) and not os.path.exists(args.database):
+        print(f"❌ Neither {args.index} nor {args.database} exists", file=sys.stderr)
+        return 1
+
+    (rxnorm_lookup, clean_lookup), source = open_lookups(args.index, args.database)
+    pipeline = build_pipeline(rxnorm_lookup, clean_lookup)
+    started = time.perf_counter()
+
+    names = args.names or [line.strip() for line in sys.stdin if line.strip()]
+    for name in names:
+        result = lookup(pipeline, name)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print('\t'.join(str(result[field]) for field in
+                            ('treatment_name', 'RXCUI', 'matched_name', 'term_type', 'match_method')))
+    finished = time.perf_counter()
+
+    if not args.quiet:
+        print(f"imports: {(_imported - _start) * 1000:.1f} ms, "
+              f"startup: {(started - _imported) * 1000:.1f} ms ({source}), "
+              f"lookups: {(finished - started) * 1000:.1f} ms for {len(names)} name(s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Hot reload of database indexes with an atomic swap
+
+A long-lived process holds its lookups in a ReloadableIndex instead of
+building them once at startup. A background thread polls the source files
+(the RxNorm CSV, a SQLite index, a supplements catalog). When one changes and
+has stopped changing, the new index is built on that thread while requests
+keep using the old one, then swapped in with a single reference assignment.
+
+Requests take one snapshot with .current and use it throughout, so in-flight
+work finishes on the version it started with and new work sees the new one.
+The old version is freed once the last request holding it finishes; apart
+from the build itself there is never more than one extra copy alive.
+"""
+
+import os
+import threading
+import time
+
+def file_signature(paths):
+    """(mtime, size) of each path, or None for missing files"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+class IndexSnapshot:
+    """One built version of an index"""
+
+    def __init__(self, index, version, signature):
+        self.index = index
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+class ReloadableIndex:
+    """An index rebuilt in the background when its source files change
+
+    build() returns a new index object. It is called once at construction
+    and again, on the watcher thread, after a change to any of paths has been
+    stable for one poll interval. A failed rebuild keeps the current version
+    and is not retried until the files change again.
+    """
+
+    def __init__(self, build, paths, poll_interval=5.0, label='index'):
+        self.build = build
+        self.paths = list(paths)
+        self.poll_interval = poll_interval
+        self.label = label
+        self.stats = {'reloads': 0, 'failures': 0, 'last_build_seconds': 0.0}
+        self._pending_signature = None
+        self._failed_signature = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = self._build(version=1)
+
+    @property
+    def current(self):
+        """The current index; take it once per request and keep using it"""
+        return self._snapshot.index
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def _build(self, version):
+        signature = file_signature(self.paths)
+        start = time.perf_counter()
+        index = self.build()
+        self.stats['last_build_seconds'] = time.perf_counter() - start
+        return IndexSnapshot(index, version, signature)
+
+    def check(self):
+        """Poll the source files once, rebuilding if a change has settled
+
+        Returns True if a new version was swapped in.
+        """
+        signature = file_signature(self.paths)
+        if signature in (self._snapshot.signature, self._failed_signature):
+            self._pending_signature = None
+            return False
+        if signature != self._pending_signature or None in signature:
+            # Changed since the last poll (or missing mid-rewrite); wait for it to settle
+            self._pending_signature = signature
+            return False
+        return self.reload()
+
+    def reload(self):
+        """Build a new version now and swap it in; returns True on success"""
+        try:
+            snapshot = self._build(self._snapshot.version + 1)
+        except Exception as e:
+            self._failed_signature = file_signature(self.paths)
+            self.stats['failures'] += 1
+            print(f"⚠️ Rebuilding {self.label} failed, keeping version {self.version}: {e}")
+            return False
+
+        # A single reference assignment: readers see the old or the new version, never a mix
+        self._snapshot = snapshot
+        self._pending_signature = None
+        self.stats['reloads'] += 1
+        print(f"🔄 Reloaded {self.label}: version {snapshot.version} "
+              f"({self.stats['last_build_seconds']:.2f}s to build)")
+        return True
+
+    def start(self):
+        """Start watching the source files on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name=f'reload-{self.label}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
@@ -0,0 +1,218 @@
+"""
+Output writers for annotation results
+
+Annotated results are written as CSV by default. With --output-format parquet
+or arrow they are written as columnar Parquet or Arrow IPC (Feather v2) files
+in record batches while results are produced, so rows reach the file as the
+run goes rather than in one write at the end. Column types are declared by
+the calling script, so the file's schema does not depend on which rows land
+in the first batch. Repetitive columns such as match_type, term_type and
+sources are dictionary encoded, which keeps the files small and lets pandas
+read them back as categoricals.
+
+Parquet and Arrow output need pyarrow, which is only imported when one of
+those formats is requested.
+"""
+
+import os
+
+import pandas as pd
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'arrow']
+
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Types a script may declare for its non-text output columns
+COLUMN_TYPES = ['bool', 'float']
+
+def add_output_arguments(parser):
+    """Add --output-format and --batch-size to an argparse parser"""
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv',
+                        help="Format for the annotated output (parquet and arrow need pyarrow; default: csv)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Rows per record batch for parquet/arrow output (default: {DEFAULT_BATCH_SIZE:,})")
+
+def output_path(path, output_format):
+    """Swap the extension of an output path for the chosen format"""
+    return os.path.splitext(path)[0] + EXTENSIONS[output_format]
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow output require pyarrow. "
+                          "Install it with: pip install pyarrow") from None
+    return pyarrow
+
+def _is_missing(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+class ResultWriter:
+    """Write result dicts to CSV, Parquet or Arrow IPC
+
+    Rows passed to write() are buffered and flushed as a record batch every
+    batch_size rows. The columns are those of the first batch. Columns named
+    in column_types are stored as 'bool' or 'float', columns in
+    dictionary_columns share one growing dictionary across batches, and every
+    other column is stored as text. Empty strings and None are written as
+    nulls.
+
+    CSV output is written in one pass on close() so it stays identical to the
+    pandas output the scripts have always produced. Used as a context manager,
+    the file is finished on success and the partial file is removed if an
+    exception escapes, so a failed run never leaves a truncated output.
+    """
+
+    def __init__(self, path, output_format='csv', dictionary_columns=(), batch_size=DEFAULT_BATCH_SIZE,
+                 column_types=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}. "
+                             f"Available: {', '.join(OUTPUT_FORMATS)}")
+        self.path = path
+        self.output_format = output_format
+        self.dictionary_columns = set(dictionary_columns)
+        self.column_types = dict(column_types or {})
+        unknown = set(self.column_types.values()) - set(COLUMN_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown column type(s): {', '.join(sorted(unknown))}. "
+                             f"Available: {', '.join(COLUMN_TYPES)}")
+        self.batch_size = max(1, batch_size)
+        self.rows_written = 0
+        self.batches_written = 0
+        self._pending = []
+        self._frames = []
+        self._pa = None if output_format == 'csv' else _import_pyarrow()
+        self._schema = None
+        self._dictionaries = {}
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, record):
+        """Add one result dict"""
+        self._pending.append(record)
+        if self.output_format != 'csv' and len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def write_all(self, records):
+        """Add result dicts in order"""
+        for record in records:
+            self.write(record)
+
+    def write_frame(self, df):
+        """Add the rows of a DataFrame, one batch at a time"""
+        if self.output_format == 'csv':
+            # Kept as frames and written with the records on close
+            if self._pending:
+                self._frames.append(pd.DataFrame(self._pending, dtype=object))
+                self._pending = []
+            self._frames.append(df)
+            return
+        for start in range(0, len(df), self.batch_size):
+            self.write_all(df.iloc[start:start + self.batch_size].to_dict('records'))
+
+    def close(self):
+        """Flush remaining rows and finish the file"""
+        if self.output_format == 'csv':
+            if self._pending or not self._frames:
+                # Object columns keep values as given, so ids next to None are not written as floats
+                self._frames.append(pd.DataFrame(self._pending, dtype=object))
+            frame = self._frames[0] if len(self._frames) == 1 else pd.concat(self._frames, ignore_index=True)
+            frame.to_csv(self.path, index=False)
+            self.rows_written += len(frame)
+            self._pending = []
+            self._frames = []
+            return
+        if self._pending or self._writer is None:
+            self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def abort(self):
+        """Discard buffered rows and remove the partial output file"""
+        self._pending = []
+        self._frames = []
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _flush(self):
+        batch = pd.DataFrame(self._pending, dtype=object)
+        self._pending = []
+        if self._schema is None:
+            self._schema = self._schema_for(batch)
+            self._writer = self._open_writer()
+        if len(batch) == 0:
+            return
+
+        arrays = [self._column_array(batch, field) for field in self._schema]
+        table = self._pa.Table.from_arrays(arrays, schema=self._schema)
+        self._writer.write_table(table)
+        self.rows_written += len(batch)
+        self.batches_written += 1
+
+    def _schema_for(self, batch):
+        pa = self._pa
+        types = {'bool': pa.bool_(), 'float': pa.float64()}
+        fields = []
+        for column in batch.columns:
+            if column in self.dictionary_columns:
+                field_type = pa.dictionary(pa.int32(), pa.string())
+            else:
+                field_type = types.get(self.column_types.get(column), pa.string())
+            fields.append(pa.field(str(column), field_type))
+        return pa.schema(fields)
+
+    def _column_array(self, batch, field):
+        pa = self._pa
+        if field.name not in batch.columns:
+            return pa.nulls(len(batch), type=field.type)
+        values = batch[field.name].tolist()
+
+        if pa.types.is_dictionary(field.type):
+            return self._dictionary_array(field.name, values)
+        if pa.types.is_string(field.type):
+            values = [None if _is_missing(value) else str(value) for value in values]
+        else:
+            values = [None if _is_missing(value) else value for value in values]
+        return pa.array(values, type=field.type, from_pandas=True)
+
+    def _dictionary_array(self, column, values):
+        """Encode against a dictionary that only grows, so each batch is a delta"""
+        pa = self._pa
+        codes = self._dictionaries.setdefault(column, {})
+        indices = []
+        for value in values:
+            if _is_missing(value):
+                indices.append(None)
+            else:
+                indices.append(codes.setdefault(str(value), len(codes)))
+        dictionary = pa.array(list(codes), type=pa.string())
+        return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), dictionary)
+
+    def _open_writer(self):
+        pa = self._pa
+        if self.output_format == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.path, self._schema, compression='zstd')
+        options = pa.ipc.IpcWriteOptions(compression='zstd', emit_dictionary_deltas=True)
+        return pa.ipc.new_file(self.path, self._schema, options=options)
+
+def write_results(records, path, output_format='csv', dictionary_columns=(), batch_size=DEFAULT_BATCH_SIZE,
+                  column_types=None):
+    """Write result dicts to path in the given format, returning the writer"""
+    with ResultWriter(path, output_format, dictionary_columns, batch_size, column_types) as writer:
+        writer.write_all(records)
+    return writer
@@ -0,0 +1,89 @@
+"""
+Prometheus text exposition metrics for scheduled runs
+
+Nightly jobs write a metrics file at the end of a run so a node-exporter
+textfile collector can pick it up. The file is written to a temporary name and
+renamed into place so the collector never reads a half-written file.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def add_metrics_arguments(parser):
+    """Add --metrics-file to an argparse parser"""
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="Write run metrics in Prometheus text format to PATH "
+                             "(e.g. for a node-exporter textfile collector)")
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class MetricsFile:
+    """Collects samples and renders them in Prometheus text exposition format
+
+    Every sample carries a script label so several jobs can share a collector
+    directory.
+    """
+
+    def __init__(self, prefix, script):
+        self.prefix = prefix
+        self.script = script
+        self._metrics = {}
+
+    def add(self, name, value, help_text, labels=None, metric_type='gauge'):
+        """Add a sample; samples with the same name share HELP and TYPE lines"""
+        if value is None:
+            return
+        full_name = f"{self.prefix}_{name}"
+        metric = self._metrics.setdefault(full_name, {'help': help_text, 'type': metric_type, 'samples': []})
+        metric['samples'].append(({'script': self.script, **(labels or {})}, value))
+
+    def add_run_metrics(self, profiler):
+        """Add phase durations, run duration, peak RSS and completion time"""
+        for phase, seconds in profiler.phase_seconds().items():
+            self.add('phase_duration_seconds', seconds, "Wall time spent in each run phase",
+                     labels={'phase': phase})
+        self.add('run_duration_seconds', profiler.report()['total_wall_seconds'], "Wall time of the whole run")
+        self.add('peak_rss_bytes', peak_rss_bytes(), "Peak resident set size of the run")
+        self.add('last_run_timestamp_seconds', time.time(), "Unix time the run finished")
+
+    def render(self):
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in metric['samples']:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically write the metrics file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        print(f"📈 Saved metrics to: {path}")
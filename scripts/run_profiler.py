@@ -0,0 +1,145 @@
+"""
+Per-phase run profiling for the annotator and build scripts
+
+Scripts mark their phases (loading, normalization, matching, writing output)
+with RunProfiler.begin(). Each phase records wall and CPU time and, when rows
+are given, rows per second. With --profile the phases are written to a JSON
+report, and --profile-stats additionally dumps cProfile stats for the run that
+can be inspected with `python -m pstats` or snakeviz.
+"""
+
+import cProfile
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+def add_profile_arguments(parser):
+    """Add --profile, --profile-report and --profile-stats to an argparse parser"""
+    parser.add_argument('--profile', action='store_true',
+                        help="Write per-phase wall/CPU timings and rows per second to a JSON report")
+    parser.add_argument('--profile-report', metavar='PATH',
+                        help="Path for the JSON profile report (default: <script>_profile.json)")
+    parser.add_argument('--profile-stats', metavar='PATH',
+                        help="Also dump cProfile stats for the whole run to PATH (implies --profile)")
+
+class RunProfiler:
+    """Wall and CPU time for the sequential phases of a script run"""
+
+    def __init__(self, script, report_path=None, stats_path=None):
+        self.script = script
+        self.report_path = report_path
+        self.stats_path = stats_path
+        self.phases = []
+        self.extra = {}
+        self._current = None
+        self._started_at = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._profile = None
+        if stats_path:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    @classmethod
+    def from_args(cls, script, args):
+        """Create a profiler from parsed --profile options
+
+        Phases are always timed; the report and stats are only written when
+        profiling was requested.
+        """
+        report_path = None
+        if args.profile or args.profile_stats:
+            report_path = args.profile_report or f"{os.path.splitext(script)[0]}_profile.json"
+        return cls(script, report_path, args.profile_stats)
+
+    @property
+    def enabled(self):
+        return self.report_path is not None
+
+    def begin(self, name, rows=None):
+        """Start a phase, ending the current one"""
+        self.end()
+        self._current = {
+            'name': name,
+            'rows': rows,
+            '_wall': time.perf_counter(),
+            '_cpu': time.process_time(),
+        }
+
+    def set_rows(self, rows):
+        """Set the number of rows processed by the current phase"""
+        if self._current is not None:
+            self._current['rows'] = rows
+
+    def end(self):
+        """End the current phase, if any"""
+        if self._current is None:
+            return
+        phase = self._current
+        self._current = None
+
+        wall_seconds = time.perf_counter() - phase.pop('_wall')
+        cpu_seconds = time.process_time() - phase.pop('_cpu')
+        phase['wall_seconds'] = round(wall_seconds, 6)
+        phase['cpu_seconds'] = round(cpu_seconds, 6)
+        if phase['rows'] is not None and wall_seconds > 0:
+            phase['rows_per_second'] = round(phase['rows'] / wall_seconds, 1)
+        self.phases.append(phase)
+
+    def record(self, name, wall_seconds, rows=None, within=None):
+        """Record an externally timed phase, such as a lazy database load
+
+        within names the enclosing phase whose time already includes this one.
+        """
+        phase = {'name': name, 'rows': rows, 'wall_seconds': round(wall_seconds, 6), 'cpu_seconds': None}
+        if within:
+            phase['within'] = within
+        if rows is not None and wall_seconds > 0:
+            phase['rows_per_second'] = round(rows / wall_seconds, 1)
+        self.phases.append(phase)
+
+    def phase_seconds(self):
+        """Wall seconds per phase name"""
+        seconds = {}
+        for phase in self.phases:
+            if 'within' in phase:
+                continue
+            seconds[phase['name']] = seconds.get(phase['name'], 0) + phase['wall_seconds']
+        return seconds
+
+    def report(self):
+        """The profile report as a dict"""
+        return {
+            'script': self.script,
+            'started_at': self._started_at.isoformat(),
+            'total_wall_seconds': round(time.perf_counter() - self._wall_start, 6),
+            'total_cpu_seconds': round(time.process_time() - self._cpu_start, 6),
+            'phases': self.phases,
+            **self.extra,
+        }
+
+    def finish(self):
+        """End the last phase and write the report and cProfile stats if requested"""
+        self.end()
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.stats_path)
+            print(f"📊 Saved cProfile stats to: {self.stats_path}")
+        if not self.enabled:
+            return None
+
+        report = self.report()
+        with open(self.report_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+        print(f"\n=== PROFILE ===")
+        for phase in report['phases']:
+            cpu = f"{phase['cpu_seconds']:.3f}s cpu" if phase['cpu_seconds'] is not None else "-"
+            rate = f"  {phase['rows_per_second']:,.0f} rows/s" if 'rows_per_second' in phase else ""
+            name = f"  {phase['name']}" if 'within' in phase else phase['name']
+            print(f"  {name:22} {phase['wall_seconds']:8.3f}s wall  {cpu:>12}{rate}")
+        total_cpu = f"{report['total_cpu_seconds']:.3f}s cpu"
+        print(f"  {'total':22} {report['total_wall_seconds']:8.3f}s wall  {total_cpu:>12}")
+        print(f"📊 Saved profile report to: {self.report_path}")
+        return report
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped lookup index shared by annotator processes
+
+Every annotator process builds its own lookup dicts from
+rxnorm_core_medications.csv, so running several workers on one machine
+multiplies the memory cost. build_shared_index() serializes the lookups once
+into a flat file: a table of records, a sorted key table per lookup and a
+string heap. SharedIndex maps that file read-only; the pages live in the OS
+page cache and are shared by every process that maps the file, so adding
+workers adds almost no memory. Lookups binary search the key table in place
+and decode only the record they return.
+
+File layout (little-endian):
+    header      magic, record count, lookup count, heap offset, heap size
+    directory   per lookup: name, entry count, entries offset
+    records     per record: RXCUI, then (offset, length) of name, sources, term type
+    entries     per lookup, sorted by key bytes: key (offset, length), record number
+    heap        UTF-8 strings
+
+Usage:
+    python shared_index.py [rxnorm_core_medications.csv] [rxnorm_core.idx]
+"""
+
+import csv
+import mmap
+import os
+import struct
+import sys
+import time
+
+DEFAULT_INDEX_PATH = 'data/rxnorm_core.idx'
+
+MAGIC = b'RXIDX001'
+HEADER = struct.Struct('<8sIIQQ')
+DIRECTORY_ENTRY = struct.Struct('<16sIQ')
+RECORD = struct.Struct('<qIIIIII')
+ENTRY = struct.Struct('<III')
+
+def _text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return str(value)
+
+class _Heap:
+    """String heap that stores each distinct string once"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, text):
+        encoded = text.encode('utf-8')
+        offset = self.offsets.get(encoded)
+        if offset is None:
+            offset = self.offsets[encoded] = len(self.data)
+            self.data += encoded
+        return offset, len(encoded)
+
+def build_shared_index(path, lookups):
+    """Write lookups ({name: {key: record}}) to a shared index file at path
+
+    Records are dicts with RXCUI, name, sources and term_type keys, as built by
+    annotate_treatments.build_lookups(). The file is written under a
+    temporary name and renamed into place. Returns the number of records.
+    """
+    heap = _Heap()
+    records = []
+    record_numbers = {}
+    tables = []
+    for lookup_name, lookup in lookups.items():
+        entries = []
+        for key, record in lookup.items():
+            key = _text(key)
+            if not key:
+                continue
+            fields = (int(record['RXCUI']), _text(record['name']), _text(record['sources']),
+                      _text(record['term_type']))
+            number = record_numbers.get(fields)
+            if number is None:
+                number = record_numbers[fields] = len(records)
+                records.append(fields)
+            entries.append((key.encode('utf-8'), number))
+        entries.sort()
+        tables.append((lookup_name, entries))
+
+    record_bytes = bytearray()
+    for rxcui, name, sources, term_type in records:
+        record_bytes += RECORD.pack(rxcui, *heap.add(name), *heap.add(sources), *heap.add(term_type))
+
+    directory = bytearray()
+    entry_bytes = bytearray()
+    entries_start = HEADER.size + DIRECTORY_ENTRY.size * len(tables) + len(record_bytes)
+    for lookup_name, entries in tables:
+        directory += DIRECTORY_ENTRY.pack(lookup_name.encode('utf-8'), len(entries),
+                                          entries_start + len(entry_bytes))
+        for key, number in entries:
+            entry_bytes += ENTRY.pack(*heap.add(key.decode('utf-8')), number)
+
+    heap_offset = entries_start + len(entry_bytes)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), len(tables), heap_offset, len(heap.data)))
+        f.write(directory)
+        f.write(record_bytes)
+        f.write(entry_bytes)
+        f.write(heap.data)
+    os.replace(tmp_path, path)
+    return len(records)
+
+def read_csv_lookups(csv_path):
+    """normalized_name and clean_name lookups from an RxNorm core CSV; the first row for a name wins"""
+    lookups = {'normalized_name': {}, 'clean_name': {}}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            record = {
+                'RXCUI': row['primary_RXCUI'],
+                'name': row['DrugName'],
+                'sources': row.get('sources', ''),
+                'term_type': row.get('preferred_term_type', '')
+            }
+            for column, lookup in lookups.items():
+                if row.get(column):
+                    lookup.setdefault(row[column], record)
+    return lookups
+
+def build_shared_index_from_csv(csv_path, path):
+    """Build a shared index from an RxNorm core CSV file"""
+    return build_shared_index(path, read_csv_lookups(csv_path))
+
+class SharedLookup:
+    """Read-only mapping from one lookup's keys to annotation records"""
+
+    def __init__(self, index, name, count, offset):
+        self.index = index
+        self.name = name
+        self.count = count
+        self.offset = offset
+
+    def __len__(self):
+        return self.count
+
+    def get(self, term, default=None):
+        if not isinstance(term, str):
+            return default
+        target = term.encode('utf-8')
+        buffer = self.index.buffer
+        heap = self.index.heap_offset
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_length, number = ENTRY.unpack_from(buffer, self.offset + mid * ENTRY.size)
+            key = buffer[heap + key_offset:heap + key_offset + key_length]
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                return self.index.record(number)
+        return default
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __getitem__(self, term):
+        record = self.get(term)
+        if record is None:
+            raise KeyError(term)
+        return record
+
+class SharedIndex:
+    """Read-only, memory-mapped view of a shared index file
+
+    Exposes the same label, path, loaded and load_seconds attributes as
+    RxnormSqliteIndex so the annotators can report it the same way.
+    """
+
+    loaded = True
+
+    def __init__(self, path, label='RxNorm (shared index)'):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Shared index not found: {path}")
+        start = time.perf_counter()
+        self.label = label
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.row_count, lookup_count, self.heap_offset, _ = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a shared index file: {path}")
+        self.lookups = {}
+        for position in range(lookup_count):
+            name, count, offset = DIRECTORY_ENTRY.unpack_from(
+                self.buffer, HEADER.size + position * DIRECTORY_ENTRY.size)
+            name = name.rstrip(b'\0').decode('utf-8')
+            self.lookups[name] = SharedLookup(self, name, count, offset)
+        self.records_offset = HEADER.size + DIRECTORY_ENTRY.size * lookup_count
+        self.load_seconds = time.perf_counter() - start
+
+    def lookup(self, name):
+        """Mapping-like exact lookup on normalized_name or clean_name"""
+        return self.lookups[name]
+
+    def record(self, number):
+        """Record number as a dict with RXCUI, name, sources and term_type keys"""
+        rxcui, *spans = RECORD.unpack_from(self.buffer, self.records_offset + number * RECORD.size)
+        heap = self.heap_offset
+        name, sources, term_type = (self.buffer[heap + offset:heap + offset + length].decode('utf-8')
+                                    for offset, length in zip(spans[::2], spans[1::2]))
+        return {'RXCUI': rxcui, 'name': name, 'sources': sources, 'term_type': term_type}
+
+    def close(self):
+        self.buffer.close()
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data/rxnorm_core_medications.csv'
+    index_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_PATH
+
+    if not os.path.exists(csv_path):
+        print(f"❌ RxNorm core file not found: {csv_path}")
+        return 1
+
+    print(f"Building shared index from {csv_path}...")
+    start = time.perf_counter()
+    record_count = build_shared_index_from_csv(csv_path, index_path)
+    print(f"✅ Indexed {record_count:,} records in {time.perf_counter() - start:.2f}s")
+    print(f"Saved shared index to: {index_path} ({os.path.getsize(index_path) / 1024 / 1024:.1f} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
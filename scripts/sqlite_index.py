@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+SQLite build artifact for the RxNorm core database
+
+A short annotation job only needs a few hundred lookups, so loading all of
+rxnorm_core_medications.csv into pandas costs far more than the lookups
+themselves. build_sqlite_index() writes the table to a SQLite file with B-tree
+indexes on normalized_name, clean_name and an exact_key column holding
+treatment_tokenizer.exact_key() of DrugName, plus an FTS5 table over DrugName
+tokens. RxnormSqliteIndex opens that file read-only
+and answers exact, token and prefix queries straight from disk, so startup is
+near zero and resident memory stays small. Fuzzy and phonetic matching read
+just the name column with column() and fetch their candidate rows with
+rows_at().
+
+Rows keep their order from the CSV as rowids, so "first row wins" lookups
+return the same record as the in-memory dict lookups built from the CSV.
+
+Usage:
+    python sqlite_index.py [rxnorm_core_medications.csv] [rxnorm_core.sqlite]
+"""
+
+import csv
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from treatment_tokenizer import exact_key
+
+DEFAULT_INDEX_PATH = 'data/rxnorm_core.sqlite'
+
+# Column affinities; every other column is stored as text
+COLUMN_TYPES = {
+    'primary_RXCUI': 'INTEGER',
+    'num_sources': 'INTEGER',
+    'priority_score': 'NUMERIC',
+}
+
+INDEXED_COLUMNS = ['normalized_name', 'clean_name', 'exact_key']
+
+# Columns the annotators read from an index
+REQUIRED_COLUMNS = ['primary_RXCUI', 'DrugName', 'clean_name', 'normalized_name', 'preferred_term_type', 'sources']
+
+# Columns build_sqlite_index() adds
+DERIVED_COLUMNS = ['exact_key']
+
+def _quote(identifier):
+    """SQL identifier in double quotes, for names already checked against the table"""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+def _is_missing(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+def build_sqlite_index(path, columns, rows):
+    """Write rows (tuples in column order) to a SQLite index at path
+
+    The database is built under a temporary name and renamed into place, so
+    annotators never open a half-built index. Raises ValueError if a column
+    in REQUIRED_COLUMNS is missing; the DERIVED_COLUMNS are added. Returns
+    the number of rows.
+    """
+    columns = list(columns)
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Cannot build a SQLite index without column(s): {', '.join(missing)}")
+    name_position = columns.index('DrugName')
+    rows = (tuple(row) + (exact_key(row[name_position]),) for row in rows)
+    columns += DERIVED_COLUMNS
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    column_defs = ', '.join(f'{_quote(column)} {COLUMN_TYPES.get(column, "TEXT")}' for column in columns)
+    column_names = ', '.join(_quote(column) for column in columns)
+    placeholders = ', '.join('?' for _ in columns)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute(f'CREATE TABLE medications (rowid INTEGER PRIMARY KEY, {column_defs})')
+        conn.executemany(
+            f'INSERT INTO medications ({column_names}) VALUES ({placeholders})',
+            ([None if _is_missing(value) else value for value in row] for row in rows))
+
+        for column in INDEXED_COLUMNS:
+            conn.execute(f'CREATE INDEX idx_{column} ON medications({_quote(column)})')
+        conn.execute("CREATE VIRTUAL TABLE medications_fts USING fts5("
+                     "DrugName, content='medications', content_rowid='rowid', "
+                     "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        conn.execute("INSERT INTO medications_fts(medications_fts) VALUES ('rebuild')")
+
+        row_count = conn.execute('SELECT COUNT(*) FROM medications').fetchone()[0]
+        conn.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)')
+        conn.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('row_count', str(row_count)),
+            ('built_at', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ])
+        conn.commit()
+        conn.execute('ANALYZE')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    return row_count
+
+def build_sqlite_index_from_csv(csv_path, path):
+    """Build a SQLite index from an RxNorm core CSV file"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        return build_sqlite_index(path, columns, reader)
+
+def fts_query(text, prefix=True, operator='OR'):
+    """FTS5 query for the tokens of text joined by operator, optionally as prefixes"""
+    tokens = dict.fromkeys(re.findall(r'\w+', str(text).lower()))
+    suffix = '*' if prefix else ''
+    return f' {operator} '.join(f'"{token}"{suffix}' for token in tokens)
+
+class SqliteLookup:
+    """Read-only mapping from one indexed column to annotation records
+
+    get(term) returns the first row with that value as a dict with RXCUI,
+    name, sources and term_type keys, the same shape as the in-memory lookups.
+    The column must exist in the index, or ValueError is raised up front
+    rather than every query silently matching nothing.
+    """
+
+    def __init__(self, index, column):
+        if column not in index.columns:
+            raise ValueError(f"SQLite index {index.path} has no column {column!r}")
+        self.index = index
+        self.column = column
+        self._sql = (f'SELECT "primary_RXCUI", "DrugName", "sources", "preferred_term_type" '
+                     f'FROM medications WHERE {_quote(column)} = ? ORDER BY rowid LIMIT 1')
+
+    def get(self, term, default=None):
+        row = self.index.conn.execute(self._sql, (term,)).fetchone()
+        if row is None:
+            return default
+        return {'RXCUI': row[0], 'name': row[1], 'sources': row[2], 'term_type': row[3]}
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __getitem__(self, term):
+        record = self.get(term)
+        if record is None:
+            raise KeyError(term)
+        return record
+
+class RxnormSqliteIndex:
+    """Read-only handle on a SQLite RxNorm index
+
+    Exposes the same label, path, column names, loaded and load_seconds
+    attributes as database_loader.LazyDatabase so the annotators can report it
+    alongside in-memory databases.
+    """
+
+    name_column = 'DrugName'
+    id_column = 'primary_RXCUI'
+    type_column = 'preferred_term_type'
+    loaded = True
+
+    def __init__(self, path, label='RxNorm (SQLite)'):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"SQLite index not found: {path}")
+        start = time.perf_counter()
+        self.label = label
+        self.path = path
+        self.conn = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.columns = [row[1] for row in self.conn.execute('PRAGMA table_info(medications)')
+                        if row[1] != 'rowid']
+        missing = [column for column in REQUIRED_COLUMNS + DERIVED_COLUMNS if column not in self.columns]
+        if missing:
+            self.conn.close()
+            raise ValueError(f"SQLite index {path} is missing column(s): {', '.join(missing)}. "
+                             f"Rebuild it with sqlite_index.py")
+        self.load_seconds = time.perf_counter() - start
+        self._row_count = None
+        self._values = {}
+        self._rowids = None
+
+    @property
+    def row_count(self):
+        if self._row_count is None:
+            self._row_count = self.conn.execute('SELECT COUNT(*) FROM medications').fetchone()[0]
+        return self._row_count
+
+    def close(self):
+        self.conn.close()
+
+    def column(self, column):
+        """Every value of a column in file order, read on first use and cached"""
+        if column not in self.columns:
+            raise ValueError(f"SQLite index {self.path} has no column {column!r}")
+        if column not in self._values:
+            self._values[column] = [row[0] for row in self.conn.execute(
+                f'SELECT {_quote(column)} FROM medications ORDER BY rowid')]
+        return self._values[column]
+
+    def rows_at(self, positions, chunk_size=500):
+        """Rows at 0-based file positions as dicts, in the order given"""
+        if self._rowids is None:
+            self._rowids = [row[0] for row in self.conn.execute('SELECT rowid FROM medications ORDER BY rowid')]
+        rowids = [self._rowids[position] for position in positions]
+        rows = {}
+        for start in range(0, len(rowids), chunk_size):
+            chunk = rowids[start:start + chunk_size]
+            placeholders = ', '.join('?' for _ in chunk)
+            for row in self.conn.execute(f'SELECT rowid, * FROM medications WHERE rowid IN ({placeholders})',
+                                         chunk):
+                rows[row[0]] = dict(row)
+        return [rows[rowid] for rowid in rowids]
+
+    def lookup(self, column):
+        """Mapping-like exact lookup on normalized_name or clean_name"""
+        return SqliteLookup(self, column)
+
+    def exact_name(self, name, limit=1):
+        """Rows whose DrugName has the same exact_key() as name, in file order"""
+        rows = self.conn.execute(
+            'SELECT * FROM medications WHERE "exact_key" = ? ORDER BY rowid LIMIT ?',
+            (exact_key(name), limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text, limit=20, prefix=True):
+        """Rows sharing any token (or token prefix) with text, best BM25 rank first"""
+        return self._fts(fts_query(text, prefix), limit)
+
+    def prefix_search(self, text, limit=20):
+        """Rows with a DrugName token starting with every token of text"""
+        return self._fts(fts_query(text, prefix=True, operator='AND'), limit)
+
+    def _fts(self, query, limit):
+        if not query:
+            return []
+        rows = self.conn.execute(
+            'SELECT m.* FROM medications_fts JOIN medications m ON m.rowid = medications_fts.rowid '
+            'WHERE medications_fts MATCH ? ORDER BY rank LIMIT ?',
+            (query, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data/rxnorm_core_medications.csv'
+    index_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_PATH
+
+    if not os.path.exists(csv_path):
+        print(f"❌ RxNorm core file not found: {csv_path}")
+        return 1
+
+    print(f"Building SQLite index from {csv_path}...")
+    start = time.perf_counter()
+    try:
+        row_count = build_sqlite_index_from_csv(csv_path, index_path)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Indexed {row_count:,} rows in {time.perf_counter() - start:.2f}s")
+    print(f"Saved SQLite index to: {index_path} ({os.path.getsize(index_path) / 1024 / 1024:.1f} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Ready-to-load index artifact for a supplements catalog
+
+Opening a supplements catalog used to mean parsing its CSV, then grouping the
+names by exact_key() for exact matches and normalizing every name for the fuzzy
+prefilter. fetch_supplements_from_cerbo.py --pipelined does that work while
+pages arrive: SupplementIndexBuilder takes each processed record as it is
+fetched and, next to the canonical CSV, writes <catalog>.index.json with:
+
+- the columns the annotators read (name, supplement_id, class) and their dtypes
+- exact_key() of each name -> row positions, for ExactNameStage
+- the normalize_name() form of every name, for the fuzzy prefilter
+
+The artifact must load exactly the DataFrame database_loader.load_columns()
+parses from the CSV. Records are indexed with pandas' NA rules ("NA", "null"
+and "N/A" names are missing), and the column values themselves are read back
+from the written CSV the same way load_columns() reads them, so dtypes,
+missing values and all-empty columns match.
+
+The artifact records the size and modification time of the CSV it was built
+alongside. read_supplement_index() ignores it once the CSV changes, and the
+catalog is then parsed from the CSV as before.
+
+Usage:
+    python supplement_index.py CATALOG_CSV [--rebuild]
+
+checks that the catalog's artifact loads the same DataFrame and lookups as
+its CSV, building the artifact first if it is missing, stale or --rebuild
+is given.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+from csv_offset_index import NA_VALUES
+from treatment_tokenizer import FUZZY_NAME_TOKENIZER, exact_key
+
+INDEX_VERSION = 3
+SUFFIX = '.index.json'
+
+# Columns read from a supplements catalog (database_loader.SUPPLEMENT_COLUMNS)
+INDEX_COLUMNS = ['supplement_id', 'name', 'class']
+
+def index_path_for(csv_path):
+    """Artifact path for a catalog CSV, e.g. data/cerbo_supplements.index.json"""
+    return os.path.splitext(csv_path)[0] + SUFFIX
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _read_columns(csv_path):
+    # As database_loader.load_columns(csv_path, SUPPLEMENT_COLUMNS) reads them
+    return pd.read_csv(csv_path, usecols=lambda column: column in INDEX_COLUMNS, low_memory=False)
+
+def _csv_text(value):
+    """A value as pandas reads it back from the catalog CSV: its text, or None when missing"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    text = str(value)
+    return None if text in NA_VALUES else text
+
+class SupplementIndexBuilder:
+    """Accumulate catalog lookups one record at a time
+
+    Records are the processed supplement dicts written to the catalog CSV, in
+    the same order.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.normalized_names = []
+        self.key_positions = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, record):
+        position = len(self.names)
+        name = _csv_text(record.get('name'))
+        self.names.append(name)
+        if name is None:
+            self.normalized_names.append('')
+        else:
+            self.normalized_names.append(FUZZY_NAME_TOKENIZER.core_name(name))
+            self.key_positions.setdefault(exact_key(name), []).append(position)
+
+    def add_all(self, records):
+        for record in records:
+            self.add(record)
+
+    def write(self, path, csv_path):
+        """Write the artifact for the catalog CSV at csv_path, which must already be written"""
+        frame = _read_columns(csv_path)
+        for column in INDEX_COLUMNS:
+            if column not in frame:
+                frame[column] = float('nan')
+
+        # Names pandas parsed differently from their text (a catalog of numeric names) are indexed again
+        names = [None if pd.isna(name) else str(name) for name in frame['name']]
+        if names != self.names:
+            rebuilt = SupplementIndexBuilder()
+            rebuilt.add_all({'name': name} for name in names)
+            self.names, self.normalized_names, self.key_positions = (
+                rebuilt.names, rebuilt.normalized_names, rebuilt.key_positions)
+
+        artifact = {
+            'version': INDEX_VERSION,
+            'source': _source_stamp(csv_path),
+            'columns': {column: frame[column].astype(object).where(frame[column].notna(), None).tolist()
+                        for column in frame.columns},
+            'dtypes': {column: str(dtype) for column, dtype in frame.dtypes.items()},
+            'normalized_names': self.normalized_names,
+            'key_positions': self.key_positions,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return path
+
+def build_supplement_index(csv_path):
+    """Write the artifact for an existing catalog CSV; returns its path"""
+    builder = SupplementIndexBuilder()
+    builder.add_all({'name': name} for name in _read_columns(csv_path).get('name', []))
+    return builder.write(index_path_for(csv_path), csv_path)
+
+def read_supplement_index(csv_path):
+    """(DataFrame, prepared lookups) from the artifact of csv_path, or None if missing or stale"""
+    path = index_path_for(csv_path)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        artifact = json.load(f)
+    if artifact.get('version') != INDEX_VERSION or artifact.get('source') != _source_stamp(csv_path):
+        return None
+
+    df = pd.DataFrame(artifact['columns'])
+    df = df.where(df.notna(), float('nan')) if len(df) else df
+    df = df.astype(artifact['dtypes'])
+    prepared = {
+        'key_positions': artifact['key_positions'],
+        'normalized_names': artifact['normalized_names'],
+    }
+    return df, prepared
+
+def check_parity(csv_path):
+    """Differences between the artifact load of a catalog and its CSV load; empty when they match"""
+    loaded = read_supplement_index(csv_path)
+    if loaded is None:
+        return ["artifact is missing or stale"]
+    df, prepared = loaded
+    expected = _read_columns(csv_path)
+
+    problems = []
+    try:
+        pd.testing.assert_frame_equal(df, expected)
+    except AssertionError as e:
+        problems.append(f"columns differ: {e}")
+        return problems
+
+    # The lookups ExactNameStage and the fuzzy prefilter build from the CSV frame
+    if 'name' in expected and not pd.api.types.is_numeric_dtype(expected['name']):
+        keys = expected['name'].map(exact_key, na_action='ignore')
+        key_positions = {key: positions.tolist()
+                         for key, positions in keys.groupby(keys, sort=False).indices.items()}
+        normalized_names = ['' if pd.isna(name) else FUZZY_NAME_TOKENIZER.core_name(name)
+                            for name in expected['name']]
+        if prepared['key_positions'] != key_positions:
+            problems.append("exact key positions differ")
+        if prepared['normalized_names'] != normalized_names:
+            problems.append("normalized names differ")
+    return problems
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Check that a supplements catalog's index artifact "
+                                                 "loads the same as its CSV")
+    parser.add_argument('csv_path', help="Catalog CSV, e.g. data/cerbo_supplements.csv")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the artifact before checking")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.csv_path):
+        print(f"❌ Catalog not found: {args.csv_path}")
+        return 1
+
+    if args.rebuild or read_supplement_index(args.csv_path) is None:
+        print(f"✅ Built {build_supplement_index(args.csv_path)}")
+
+    problems = check_parity(args.csv_path)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print(f"✅ {index_path_for(args.csv_path)} loads the same catalog as {args.csv_path}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
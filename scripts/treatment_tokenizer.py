@@ -0,0 +1,165 @@
+"""
+Single-pass tokenizer for treatment strings
+
+Treatment names carry dose, route, form and frequency details ("Low Dose
+Naltrexone 4.5 mg oral capsule twice daily"). The annotators used to strip
+them with a chain of re.sub calls and throw them away. TreatmentTokenizer
+compiles all of the detail patterns into one alternation and scans the string
+once: each match is recorded in its field and removed, and what is left is the
+core name.
+
+The patterns keep the semantics of the regex chains they replace, so core
+names come out as before. Two vocabularies are provided:
+
+- CORE_DRUG_TOKENIZER: the extract_core_drug_name rules of the annotate_*
+  scripts, applied to normalize_name() output
+- FUZZY_NAME_TOKENIZER: the normalize_name rules of
+  annotate_treatments_comprehensive.py, applied to raw names
+
+tokenize_many() tokenizes a whole column, once per distinct value, and
+treatment_details() gives the detail columns added to annotate_treatments.py
+output. exact_key() is the form exact name matches compare.
+"""
+
+import re
+
+DETAIL_COLUMNS = ['strength', 'unit', 'route', 'dosage_form', 'frequency', 'qualifiers']
+
+class TokenizedTreatment:
+    """Structured fields of one treatment string
+
+    Fields holding several values (e.g. two strengths) are joined with '|'.
+    """
+
+    __slots__ = ('core_name', 'strength', 'unit', 'route', 'dosage_form', 'frequency', 'qualifiers')
+
+    def __init__(self, core_name, strength='', unit='', route='', dosage_form='', frequency='', qualifiers=''):
+        self.core_name = core_name
+        self.strength = strength
+        self.unit = unit
+        self.route = route
+        self.dosage_form = dosage_form
+        self.frequency = frequency
+        self.qualifiers = qualifiers
+
+    def details(self):
+        """Detail fields as a dict keyed by DETAIL_COLUMNS"""
+        return {column: getattr(self, column) for column in DETAIL_COLUMNS}
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__ if getattr(self, name))
+        return f'TokenizedTreatment({fields})'
+
+class TreatmentTokenizer:
+    """Split treatment strings into a core name and detail fields in one scan
+
+    patterns is an ordered list of (field, regex) pairs, where field is one of
+    qualifier, route, form, strength or frequency. The strength regex must
+    capture (?P<amount>...) and (?P<unit>...). Characters matching
+    punctuation are replaced by spaces in the same scan.
+    """
+
+    def __init__(self, patterns, punctuation=None):
+        alternatives = [f'(?P<{field}>{regex})' for field, regex in patterns]
+        if punctuation:
+            alternatives.append(f'(?P<punctuation>{punctuation}+)')
+        self.pattern = re.compile('|'.join(alternatives))
+
+    def tokenize(self, text):
+        """TokenizedTreatment for one string"""
+        text = str(text).lower()
+
+        kept = []
+        position = 0
+        details = {}
+        for match in self.pattern.finditer(text):
+            start, end = match.span()
+            kept.append(text[position:start])
+            position = end
+
+            field = match.lastgroup
+            if field == 'punctuation':
+                kept.append(' ')
+            elif field == 'strength':
+                details.setdefault('strength', []).append(match.group('amount'))
+                details.setdefault('unit', []).append(match.group('unit'))
+            else:
+                value = ' '.join(match.group().split())
+                if field == 'form':
+                    value = value.rstrip('s')
+                values = details.setdefault(field, [])
+                if value not in values:
+                    values.append(value)
+        kept.append(text[position:])
+
+        core_name = ' '.join(''.join(kept).split())
+        if not details:
+            return TokenizedTreatment(core_name)
+        return TokenizedTreatment(
+            core_name,
+            strength='|'.join(details.get('strength', ())),
+            unit='|'.join(details.get('unit', ())),
+            route='|'.join(details.get('route', ())),
+            dosage_form='|'.join(details.get('form', ())),
+            frequency='|'.join(details.get('frequency', ())),
+            qualifiers='|'.join(details.get('qualifier', ())),
+        )
+
+    def core_name(self, text):
+        """Just the core name of one string"""
+        return self.tokenize(text).core_name
+
+    def tokenize_many(self, texts, prepare=None):
+        """Tokenize a column of strings, once per distinct value
+
+        prepare, if given, is applied to each distinct string first. Missing
+        values give empty fields.
+        """
+        cache = {}
+        results = []
+        for text in texts:
+            result = cache.get(text)
+            if result is None:
+                if text is None or text != text:
+                    result = TokenizedTreatment('')
+                else:
+                    result = self.tokenize(prepare(text) if prepare else text)
+                cache[text] = result
+            results.append(result)
+        return results
+
+def normalize_keeping_decimals(text):
+    """normalize_name() of the annotate_* scripts, except that decimal points in numbers are kept"""
+    text = re.sub(r'(?!(?<=\d)\.(?=\d))[^\w\s-]', '', str(text).lower())
+    return ' '.join(text.split())
+
+def exact_key(text):
+    """Lowercased text with punctuation as spaces and whitespace collapsed; "" for None or NaN"""
+    if text is None or text != text:
+        return ""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', str(text).lower()).split())
+
+# Rules of extract_core_drug_name in annotate_treatments.py and create_*_annotation.py
+CORE_DRUG_PATTERNS = [
+    ('qualifier', r'\b(?:low\s+dose|high\s+dose|extended\s+release|immediate\s+release)\s+'),
+    ('route', r'\b(?:oral|iv|intravenous|topical|nasal|sublingual)\s+'),
+    ('form', r'\b(?:tablet|capsule|injection|spray|cream|gel|solution)\s*'),
+    ('strength', r'\b(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>mg|mcg|ml|units?)\b'),
+    ('frequency', r'\b(?:twice\s+daily|once\s+daily|bid|tid|qid|prn)\b'),
+]
+
+# Rules of normalize_name in annotate_treatments_comprehensive.py
+FUZZY_NAME_PATTERNS = [
+    ('form', r'\b(?:tablet|capsule|injection|cream|gel|ointment|syrup|liquid|suspension)s?\b'),
+    ('strength', r'\b(?P<amount>\d+)\s*(?P<unit>mg|mcg|g|ml|cc|units?|iu|meq)\b'),
+    ('frequency', r'\bonce\s+daily\b|\bod\b|\bbid\b|\btid\b|\bqid\b'),
+    ('route', r'\b(?:oral|topical|iv|im|sc|sublingual|rectal)\b'),
+]
+
+CORE_DRUG_TOKENIZER = TreatmentTokenizer(CORE_DRUG_PATTERNS)
+FUZZY_NAME_TOKENIZER = TreatmentTokenizer(FUZZY_NAME_PATTERNS, punctuation=r'[^\w\s]')
+
+def treatment_details(treatment_names):
+    """Detail fields (DETAIL_COLUMNS) of a column of raw treatment names, one dict per name"""
+    return [tokens.details() for tokens in
+            CORE_DRUG_TOKENIZER.tokenize_many(treatment_names, prepare=normalize_keeping_decimals)]
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Verify alias expansion in the annotators
+
+Runs regression cases for data/drug_aliases.json through annotate_treatments.py
+(pipeline and --vectorized modes) against a small RxNorm table. Also checks
+that create_enhanced_annotation.py and create_optimized_annotation.py derive
+the same search terms. An alias expansion must only be tried after the core
+drug name, and only for an alias that starts the name or is its whole core
+name.
+
+Usage:
+    python verify_alias_expansion.py
+"""
+
+import sys
+
+import pandas as pd
+
+import annotate_treatments
+import create_enhanced_annotation
+import create_optimized_annotation
+from matching_pipeline import MatchPipeline
+
+# RxNorm rows the cases can match, including both magnesium citrate and magnesium
+RXNORM_ROWS = [
+    (52356, 'Magnesium Citrate', 'IN'),
+    (6574, 'Magnesium', 'IN'),
+    (161, 'acetaminophen', 'IN'),
+    (36676, 'sodium bicarbonate', 'IN'),
+    (1151, 'Vitamin C', 'PT'),
+    (11248, 'cyanocobalamin', 'IN'),
+    (7243, 'naltrexone', 'IN'),
+    (197, 'acetylcysteine', 'IN'),
+    (4492, 'omega-3 fatty acids', 'IN'),
+]
+
+# (treatment name, expected matched name or '' for no match)
+TEST_CASES = [
+    # Aliases inside a name must not replace a core name that matches
+    ('Magnesium citrate 200 mg tablet', 'Magnesium Citrate'),
+    ('Magnesium citrate', 'Magnesium Citrate'),
+    # Aliases later in the name name a different ingredient
+    ('Acetaminophen 500mg with vitamin c', ''),
+    ('Sodium bicarbonate and vitamin c', ''),
+    ('Methyl B12 injection', ''),
+    # Aliases leading the name or forming its whole core name
+    ('LDN 4.5mg nightly', 'naltrexone'),
+    ('Oral LDN', 'naltrexone'),
+    ('NAC 600 + glutathione', 'acetylcysteine'),
+    ('Fish oil capsule', 'omega-3 fatty acids'),
+    ('B12', 'cyanocobalamin'),
+]
+
+def rxnorm_fixture():
+    """Small RxNorm core table in the columns the annotators read"""
+    df = pd.DataFrame(RXNORM_ROWS, columns=['primary_RXCUI', 'DrugName', 'preferred_term_type'])
+    df['normalized_name'] = df['DrugName'].map(annotate_treatments.normalize_name)
+    df['clean_name'] = df['normalized_name']
+    df['sources'] = 'RXNORM'
+    return df
+
+def verify_alias_expansion():
+    """Check every test case in both annotate_treatments.py modes; returns True when all pass"""
+    print("=== VERIFYING ALIAS EXPANSION ===\n")
+
+    rxnorm_df = rxnorm_fixture()
+    stages = annotate_treatments.build_stages(*annotate_treatments.build_lookups(rxnorm_df))
+    pipeline = MatchPipeline.from_names(stages, annotate_treatments.DEFAULT_STAGES)
+    names = [name for name, _ in TEST_CASES]
+    joined, _, _ = annotate_treatments.annotate_exact_join(names, rxnorm_df)
+
+    failures = 0
+    for (name, expected), (_, joined_row) in zip(TEST_CASES, joined.iterrows()):
+        result = annotate_treatments.annotate_treatment(name, pipeline)
+        matched = result['matched_name'] if result['matched'] else ''
+        joined_matched = joined_row['matched_name'] if joined_row['matched'] else ''
+
+        # The other annotators must search the same terms
+        enhanced_terms = create_enhanced_annotation.extract_names_from_parentheses(name)
+        optimized_terms = [create_optimized_annotation.extract_core_drug_name(name),
+                           create_optimized_annotation.extract_alias_name(name)]
+        expected_optimized = [annotate_treatments.extract_core_drug_name(name),
+                              annotate_treatments.extract_alias_name(name)]
+
+        problems = []
+        if matched != expected:
+            problems.append(f"matched '{matched}'")
+        if joined_matched != matched or joined_row['searched_terms'] != result['searched_terms']:
+            problems.append(f"vectorized mode matched '{joined_matched}'")
+        if enhanced_terms != result['searched_terms'].split('|'):
+            problems.append(f"enhanced terms {enhanced_terms}")
+        if optimized_terms != expected_optimized:
+            problems.append(f"optimized terms {optimized_terms}")
+
+        if problems:
+            failures += 1
+            print(f"❌ {name:38} → expected '{expected}': {', '.join(problems)}")
+        else:
+            print(f"✅ {name:38} → {expected or 'no match'} (searched: {result['searched_terms']})")
+
+    print(f"\n{len(TEST_CASES) - failures}/{len(TEST_CASES)} alias cases passed")
+    return failures == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if verify_alias_expansion() else 1)
@@ -11,6 +11,8 @@ Usage:
 
 import pandas as pd
 
+from group_index import RxcuiGroupIndex
+
 def verify_unification():
     """Verify brand-generic unification in the core database"""
     print("=== VERIFYING RXNORM CORE DATABASE UNIFICATION ===\n")
@@ -19,6 +21,7 @@ def verify_unification():
     try:
         df = pd.read_csv('data/rxnorm_core_medications.csv', low_memory=False)
         print(f"✅ Loaded database: {len(df):,} entries")
+        groups = RxcuiGroupIndex(df)
     except FileNotFoundError:
         print("❌ Database file not found: data/rxnorm_core_medications.csv")
         print("Please run create_unified_rxnorm_core.py first")
@@ -59,16 +62,14 @@ def verify_unification():
         generic_matches = generics_df[generics_df['DrugName'].str.contains(generic, case=False, na=False)]
         
         if len(brand_matches) > 0 and len(generic_matches) > 0:
-            brand_rxcui = str(brand_matches.iloc[0]['primary_RXCUI'])
-            generic_rxcui = str(generic_matches.iloc[0]['primary_RXCUI'])
+            brand_rxcui = brand_matches.iloc[0]['primary_RXCUI']
+            generic_rxcui = generic_matches.iloc[0]['primary_RXCUI']
             unified = brand_rxcui == generic_rxcui
             
             if unified:
                 unified_count += 1
                 status = '✅'
-                # Show unified entries
-                unified_entries = df[df['primary_RXCUI'] == brand_rxcui]
-                entry_count = len(unified_entries)
+                entry_count = groups.size(brand_rxcui)
             else:
                 status = '❌'
                 entry_count = 0
@@ -81,28 +82,24 @@ def verify_unification():
     print(f"\nUnification Success Rate: {unified_count}/{len(test_cases)} = {success_rate:.1f}%")
     
     # Database statistics
-    rxcui_counts = df['primary_RXCUI'].value_counts()
-    unified_groups = len(rxcui_counts[rxcui_counts > 1])
-    total_in_unified = rxcui_counts[rxcui_counts > 1].sum()
+    unified_groups = int((groups.sizes > 1).sum())
+    total_in_unified = int(groups.sizes[groups.sizes > 1].sum())
     
     print(f"\n=== DATABASE STATISTICS ===")
     print(f"Total entries: {len(df):,}")
-    print(f"Unique RXCUIs: {len(rxcui_counts):,}")
+    print(f"Unique RXCUIs: {len(groups):,}")
     print(f"Unified groups: {unified_groups:,}")
     print(f"Entries in unified groups: {total_in_unified:,}")
     print(f"Unification coverage: {(total_in_unified / len(df) * 100):.1f}%")
     
     # Show examples of large unified groups
     print(f"\n=== EXAMPLES OF SUCCESSFUL UNIFICATIONS ===")
-    large_groups = rxcui_counts[rxcui_counts >= 5].head(5)
-    
-    for rxcui, count in large_groups.items():
-        entries = df[df['primary_RXCUI'] == rxcui]
-        
-        brands = entries[entries['preferred_term_type'] == 'BN']['DrugName'].tolist()
-        generics = entries[entries['preferred_term_type'].isin(['IN', 'PT'])]['DrugName'].tolist()
+    for rxcui in groups.largest_groups(5, min_size=5):
+        group = groups.lookup(rxcui)
+        brands = group['brands']
+        generics = group['generics']
         
-        print(f"\nRXCUI {rxcui} ({count} entries):")
+        print(f"\nRXCUI {rxcui} ({group['size']} entries):")
         if brands:
             print(f"  Brands: {', '.join(brands[:3])}{'...' if len(brands) > 3 else ''}")
         if generics: